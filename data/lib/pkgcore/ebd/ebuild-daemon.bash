@@ -328,7 +328,7 @@ __make_preloaded_eclass_func() {
 }
 
 __ebd_main_loop() {
-	PKGCORE_BLACKLIST_VARS+=( __mode com is_depends phases line cont )
+	PKGCORE_BLACKLIST_VARS+=( __mode __seq com is_depends phases line cont )
 	SANDBOX_ON=1
 	while :; do
 		local com=''
@@ -377,16 +377,21 @@ __ebd_main_loop() {
 				;;
 			gen_metadata\ *|gen_ebuild_env\ *)
 				local __mode="depend"
-				local error_output
+				local error_output __seq=''
 				[[ ${com} == gen_ebuild_env* ]] && __mode="generate_env"
 				line=${com#* }
+				# optional sequence tag echoed back in the final reply
+				if [[ ${line} == seq=* ]]; then
+					__seq="${line%% *} "
+					line=${line#* }
+				fi
 				# capture sourcing stderr output
 				error_output=$(__ebd_process_metadata "${line}" "${__mode}" 2>&1 1>/dev/null)
 				if [[ $? -eq 0 ]]; then
-					__ebd_write_line "phases succeeded"
+					__ebd_write_line "phases ${__seq}succeeded"
 				else
-					[[ -n ${error_output} ]] || error_output="ebd::${com% *} failed"
-					__ebd_write_line "phases failed ${error_output}"
+					[[ -n ${error_output} ]] || error_output="ebd::${com%% *} failed"
+					__ebd_write_line "phases ${__seq}failed ${error_output}"
 				fi
 				;;
 			alive)
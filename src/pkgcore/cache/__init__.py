@@ -8,6 +8,7 @@ import math
 import operator
 import os
 from functools import partial
+from itertools import chain
 
 from snakeoil import klass
 from snakeoil.chksum import get_handler
@@ -261,6 +262,46 @@ class base:
                 cpv, f"ValueError reading {eclass_string!r}"
             ) from e
 
+    def _eclass_names(self, eclass_data):
+        """Return the eclass names from a serialized ``_eclasses_`` value."""
+        step = len(self.eclass_chf_types) + 1
+        return [x for x in eclass_data.strip().split(self.eclass_splitter)[::step] if x]
+
+    def eclass_index(self):
+        """Return a mapping of eclass names to the cpvs of entries inheriting them.
+
+        Corrupted entries are mapped under None since their eclasses are unknown.
+        Derived classes may maintain the index instead of scanning every entry.
+        """
+        index = {}
+        for cpv in self.keys():
+            try:
+                names = self._eclass_names(self._getitem(cpv).get("_eclasses_", ""))
+            except KeyError:
+                continue
+            except errors.CacheCorruption:
+                names = (None,)
+            for name in names:
+                index.setdefault(name, set()).add(cpv)
+        return index
+
+    def eclass_consumers(self, eclasses):
+        """Return the cpvs of entries inheriting any of the given eclasses.
+
+        Corrupted entries are included since their eclasses are unknown.
+
+        :param eclasses: iterable of eclass names
+        :return: set of cpvs
+        """
+        eclasses = frozenset(eclasses)
+        consumers = set()
+        if not eclasses:
+            return consumers
+        index = self.eclass_index()
+        for name in chain((None,), eclasses):
+            consumers.update(index.get(name, ()))
+        return consumers
+
     def validate_entry(self, cache_item, ebuild_hash_item, eclass_db):
         chf_hash = cache_item.get(self._chf_key)
         if chf_hash is None or chf_hash != getattr(
@@ -280,6 +321,67 @@ class base:
         cache_item["_eclasses_"] = update
         return True
 
+    def validate_entries(self, entries, eclass_db):
+        """Bulk validate cache entries.
+
+        Each distinct serialized eclass set is only deserialized and checked
+        against the eclass db once per call, instead of once per entry.
+
+        :param entries: iterable of (cpv, ebuild_hash_item) pairs
+        :param eclass_db: :obj:`pkgcore.ebuild.eclass_cache.base` instance
+        :return: set of cpvs with stale or missing entries
+        """
+        stale = set()
+        eclasses_valid = {}
+        for cpv, ebuild_hash_item in entries:
+            try:
+                data = self._getitem(cpv)
+            except KeyError:
+                stale.add(cpv)
+                continue
+            except errors.CacheError:
+                stale.add(cpv)
+                continue
+
+            chf_hash = data.get(self._chf_key)
+            if chf_hash is None or chf_hash != getattr(
+                ebuild_hash_item, self.chf_type, None
+            ):
+                stale.add(cpv)
+                continue
+            eclass_string = data.get("_eclasses_")
+            if eclass_string is None:
+                continue
+            if data.get("INHERIT") is None:
+                stale.add(cpv)
+                continue
+            valid = eclasses_valid.get(eclass_string)
+            if valid is None:
+                try:
+                    eclass_data = self.reconstruct_eclasses(cpv, eclass_string)
+                except errors.CacheError:
+                    stale.add(cpv)
+                    continue
+                valid = eclass_db.rebuild_cache_entry(eclass_data) is not None
+                eclasses_valid[eclass_string] = valid
+            if not valid:
+                stale.add(cpv)
+        return stale
+
+    def validated(self, cpv, ebuild_hash_item, eclass_db):
+        """Return a cpv's entry if it's valid for the given ebuild and eclasses.
+
+        Backends able to detect stale entries without loading them override
+        this.
+
+        :raise KeyError: if no entry exists for the cpv
+        :return: the entry, or None if it's stale
+        """
+        data = self[cpv]
+        if self.validate_entry(data, ebuild_hash_item, eclass_db):
+            return data
+        return None
+
 
 class bulk(base):
     default_sync_rate = 100
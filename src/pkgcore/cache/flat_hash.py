@@ -4,18 +4,188 @@ per key file based backend
 
 __all__ = ("database",)
 
+import fcntl
+import json
 import os
 import stat
+import threading
+from urllib.parse import quote
 
-from snakeoil.fileutils import readlines_utf8
-from snakeoil.osutils import pjoin
+from snakeoil.fileutils import AtomicWriteFile, readlines_utf8
+from snakeoil.osutils import ensure_dirs, pjoin
 
+from .. import const
 from ..config.hint import ConfigHint
+from ..log import logger
 from . import errors, fs_template
 
 
+class _EclassIndex:
+    """Reverse eclass index of a :obj:`database`, persisted in the user cache.
+
+    Entries are grouped by directory along with the directory's mtime; on
+    refresh only directories with changed mtimes are rescanned, catching
+    entries written by other tools as long as they replace files instead of
+    modifying them in place.
+    """
+
+    version = 1
+
+    def __init__(self, cache):
+        self.cache = cache
+        name = quote(os.path.realpath(cache.location), safe="")
+        self.path = pjoin(const.USER_CACHE_PATH, "eclass-index", f"{name}.json")
+        # dirname -> (mtime, {cpv: eclass names or None if corrupted})
+        self.dirs = {}
+        # eclass name -> set of cpvs, corrupted entries are mapped under None
+        self.consumers = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") != self.version:
+                return
+            dirs = {
+                dirname: (mtime, dict(entries))
+                for dirname, (mtime, entries) in data["dirs"].items()
+            }
+        except FileNotFoundError:
+            return
+        except (EnvironmentError, AttributeError, KeyError, TypeError, ValueError):
+            logger.debug("ignoring invalid eclass index %r", self.path)
+            return
+        self.dirs = dirs
+        for _mtime, entries in dirs.values():
+            for cpv, names in entries.items():
+                self._add(cpv, names)
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {"version": self.version, "dirs": self.dirs}
+        try:
+            ensure_dirs(os.path.dirname(self.path), mode=0o755)
+            with AtomicWriteFile(self.path) as f:
+                json.dump(data, f)
+        except EnvironmentError as e:
+            logger.debug("failed writing eclass index %r: %s", self.path, e)
+            return
+        self.dirty = False
+
+    def _add(self, cpv, names):
+        for name in (None,) if names is None else names:
+            self.consumers.setdefault(name, set()).add(cpv)
+
+    def _remove(self, cpv, names):
+        for name in (None,) if names is None else names:
+            cpvs = self.consumers.get(name)
+            if cpvs is not None:
+                cpvs.discard(cpv)
+                if not cpvs:
+                    del self.consumers[name]
+
+    def _drop_dir(self, dirname):
+        _mtime, entries = self.dirs.pop(dirname)
+        for cpv, names in entries.items():
+            self._remove(cpv, names)
+        self.dirty = True
+
+    def _scan_dir(self, dirname, mtime, names):
+        """Reindex all entries of a directory, returning its subdirectories."""
+        if dirname in self.dirs:
+            self._drop_dir(dirname)
+        path = pjoin(self.cache.location, dirname)
+        entries, subdirs = {}, []
+        for name in names:
+            if name.startswith(".") or name.endswith(".cpickle"):
+                continue
+            try:
+                st = os.lstat(pjoin(path, name))
+            except FileNotFoundError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                subdirs.append(f"{dirname}{name}/")
+                continue
+            cpv = dirname + name
+            try:
+                eclasses = self.cache._eclass_names(
+                    self.cache._getitem(cpv).get("_eclasses_", "")
+                )
+            except KeyError:
+                continue
+            except errors.CacheCorruption:
+                eclasses = None
+            entries[cpv] = eclasses
+            self._add(cpv, eclasses)
+        self.dirs[dirname] = (mtime, entries)
+        self.dirty = True
+        return subdirs
+
+    def refresh(self):
+        """Rescan directories changed since they were last indexed."""
+        children = {}
+        for dirname in self.dirs:
+            if dirname:
+                parent = dirname[: dirname.rfind("/", 0, -1) + 1]
+                children.setdefault(parent, []).append(dirname)
+        unseen = set(self.dirs)
+        pending = [""]
+        while pending:
+            dirname = pending.pop()
+            path = pjoin(self.cache.location, dirname)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if mtime == self.dirs.get(dirname, (None,))[0]:
+                    unseen.discard(dirname)
+                    pending.extend(children.get(dirname, ()))
+                    continue
+                names = os.listdir(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            except EnvironmentError as e:
+                raise errors.GeneralCacheCorruption(e) from e
+            unseen.discard(dirname)
+            pending.extend(self._scan_dir(dirname, mtime, names))
+        for dirname in unseen:
+            self._drop_dir(dirname)
+
+    def update(self, dirname, before, after, entries):
+        """Record entries written to or removed from a directory.
+
+        The update is only applied if the directory was unchanged since it
+        was indexed, otherwise it's left for :meth:`refresh` to rescan.
+
+        :param before: directory mtime prior to the modification
+        :param after: directory mtime following the modification
+        :param entries: mapping of cpv to eclass names, removed entries
+            are mapped to False
+        """
+        indexed = self.dirs.get(dirname)
+        if indexed is None or indexed[0] != before:
+            return
+        current = indexed[1]
+        for cpv, names in entries.items():
+            if cpv in current:
+                self._remove(cpv, current.pop(cpv))
+            if names is not False:
+                current[cpv] = names
+                self._add(cpv, names)
+        self.dirs[dirname] = (after, current)
+        self.dirty = True
+
+
 class database(fs_template.FsBased):
-    """Stores cache entries in key=value form, stripping newlines."""
+    """Stores cache entries in key=value form, stripping newlines.
+
+    With a sync rate above one (as used during regen), updates are queued and
+    written out on commit one directory at a time, syncing each directory
+    once instead of handling every entry on its own. Queued updates can
+    optionally be journaled so entries generated by an interrupted run get
+    written out the next time the cache is opened.
+    """
 
     # TODO: different way of passing in default auxdbkeys and location
     pkgcore_config_type = ConfigHint(
@@ -24,17 +194,44 @@ class database(fs_template.FsBased):
             "location": "str",
             "label": "str",
             "auxdbkeys": "list",
+            "journal": "bool",
         },
         required=["location"],
         positional=["location"],
         typename="cache",
     )
 
-    autocommits = True
+    autocommits = False
     mtime_in_entry = True
     eclass_chf_types = ("eclassdir", "mtime")
+    journal_name = ".update.journal"
+    # queued updates forcing a commit regardless of the sync rate
+    max_pending = 1000
+
+    def __init__(self, *args, journal=False, **config):
+        super().__init__(*args, **config)
+        # queued updates mapped by their directory
+        self._pending = {}
+        self._pending_count = 0
+        # guards queued updates against threaded regen, held while committing
+        self._lock = threading.RLock()
+        self._journal = None
+        self._eclass_index = None
+        self.journal = journal and not self.readonly
+        if self.journal:
+            self._replay_journal()
+
+    @property
+    def journal_path(self):
+        return pjoin(self.location, self.journal_name)
 
     def _getitem(self, cpv):
+        s = cpv.rfind("/") + 1
+        values = self._pending.get(cpv[:s], {}).get(cpv)
+        if values is not None:
+            return self._parse_data(
+                (f"{k}={v}" for k, v in values.items()), values.get(self._chf_key)
+            )
         path = pjoin(self.location, cpv)
         try:
             data = readlines_utf8(path, True, True, True)
@@ -65,54 +262,208 @@ class database(fs_template.FsBased):
         # might seem weird, but we rely on the trailing +1; this
         # makes it behave properly for any cache depth (including no depth)
         s = cpv.rfind("/") + 1
-        fp = pjoin(self.location, cpv[:s], f".update.{os.getpid()}.{cpv[s:]}")
+        if self.sync_rate <= 1:
+            self._write_entries(cpv[:s], {cpv: values})
+            return
+        values = dict(values)
+        with self._lock:
+            if self.journal:
+                self._journal_entry(cpv, values)
+            pending = self._pending.setdefault(cpv[:s], {})
+            if cpv not in pending:
+                self._pending_count += 1
+            pending[cpv] = values
+            if self._pending_count >= self.max_pending:
+                self.commit()
+
+    def _write_entries(self, dirname, entries, sync=False):
+        """Write entries sharing a directory, optionally syncing the directory.
+
+        :param dirname: directory relative to the cache location, including
+            the trailing separator
+        :param entries: mapping of cpv to serialized values
+        """
+        path = pjoin(self.location, dirname)
+        cpv = next(iter(entries))
         try:
-            myf = open(fp, "w", 32768)
+            dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
         except FileNotFoundError:
             if not self._ensure_dirs(cpv):
                 raise errors.CacheCorruption(
-                    cpv, f"error creating directory for {fp!r}"
+                    cpv, f"error creating directory for {path!r}"
                 )
             try:
-                myf = open(fp, "w", 32768)
+                dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
             except EnvironmentError as e:
                 raise errors.CacheCorruption(cpv, e) from e
         except OSError as e:
             raise errors.CacheCorruption(cpv, e) from e
 
-        if self._mtime_used:
-            if not self.mtime_in_entry:
-                mtime = values["_mtime_"]
-        for k, v in sorted(values.items()):
-            myf.writelines(f"{k}={v}\n")
-
-        myf.close()
-        if self._mtime_used and not self.mtime_in_entry:
-            self._ensure_access(fp, mtime=mtime)
-        else:
-            self._ensure_access(fp)
+        pid = os.getpid()
+        s = len(dirname)
+        try:
+            before = os.fstat(dir_fd).st_mtime_ns
+            for cpv, values in entries.items():
+                name = cpv[s:]
+                tmp = f".update.{pid}.{name}"
+                data = "".join(f"{k}={v}\n" for k, v in sorted(values.items()))
+                mtime = None
+                if self._mtime_used and not self.mtime_in_entry:
+                    mtime = values["_mtime_"]
+                try:
+                    fd = os.open(
+                        tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666, dir_fd=dir_fd
+                    )
+                    with open(fd, "w", 32768) as f:
+                        f.write(data)
+                        f.flush()
+                        self._ensure_access(fd, mtime=mtime)
+                except EnvironmentError as e:
+                    raise errors.CacheCorruption(cpv, e) from e
+
+                # update written, now we move it
+                try:
+                    os.rename(tmp, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+                except EnvironmentError as e:
+                    os.remove(tmp, dir_fd=dir_fd)
+                    raise errors.CacheCorruption(cpv, e) from e
+            if sync:
+                os.fsync(dir_fd)
+            if self._eclass_index is not None:
+                self._eclass_index.update(
+                    dirname,
+                    before,
+                    os.fstat(dir_fd).st_mtime_ns,
+                    {
+                        cpv: self._eclass_names(values.get("_eclasses_", ""))
+                        for cpv, values in entries.items()
+                    },
+                )
+        finally:
+            os.close(dir_fd)
 
-        # update written, now we move it
-        new_fp = pjoin(self.location, cpv)
+    def commit(self, force=False):
+        with self._lock:
+            # queued entries stay visible to lookups until written out
+            for dirname, entries in sorted(self._pending.items()):
+                self._write_entries(dirname, entries, sync=True)
+            self._pending = {}
+            self._pending_count = 0
+            if self._journal is not None:
+                # everything journaled has been written out
+                self._journal.close()
+                self._journal = None
+                try:
+                    os.remove(self.journal_path)
+                except FileNotFoundError:
+                    pass
+            if self._eclass_index is not None:
+                self._eclass_index.save()
+
+    def _journal_entry(self, cpv, values):
+        if self._journal is None:
+            if not self._ensure_dirs():
+                raise errors.GeneralCacheCorruption(
+                    f"error creating directory {self.location!r}"
+                )
+            try:
+                f = open(self.journal_path, "a")
+            except EnvironmentError as e:
+                raise errors.GeneralCacheCorruption(e) from e
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # another process is journaling to this cache, go without
+                f.close()
+                self.journal = False
+                return
+            self._journal = f
+        self._journal.write(json.dumps([cpv, values]) + "\n")
+        self._journal.flush()
+
+    def _replay_journal(self):
+        """Write out entries journaled by a run that didn't commit."""
         try:
-            os.rename(fp, new_fp)
+            f = open(self.journal_path)
+        except FileNotFoundError:
+            return
         except EnvironmentError as e:
-            os.remove(fp)
-            raise errors.CacheCorruption(cpv, e) from e
+            raise errors.GeneralCacheCorruption(e) from e
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # journal belongs to a running process
+                return
+            pending = {}
+            for line in f:
+                try:
+                    cpv, values = json.loads(line)
+                except ValueError:
+                    # truncated by the interruption
+                    break
+                s = cpv.rfind("/") + 1
+                entries = pending.setdefault(cpv[:s], {})
+                if values is None:
+                    # removed after being queued
+                    entries.pop(cpv, None)
+                else:
+                    entries[cpv] = values
+            for dirname, entries in sorted(pending.items()):
+                if entries:
+                    self._write_entries(dirname, entries, sync=True)
+            os.remove(self.journal_path)
 
     def _delitem(self, cpv):
+        s = cpv.rfind("/") + 1
+        with self._lock:
+            if self._journal is not None:
+                self._journal_entry(cpv, None)
+            pending = self._pending.get(cpv[:s], {})
+            queued = cpv in pending
+            if queued:
+                del pending[cpv]
+                self._pending_count -= 1
+        dirname = pjoin(self.location, cpv[:s])
         try:
+            before = os.stat(dirname).st_mtime_ns
             os.remove(pjoin(self.location, cpv))
         except FileNotFoundError:
+            if queued:
+                return
             raise KeyError(cpv)
         except OSError as e:
             raise errors.CacheCorruption(cpv, e) from e
+        if self._eclass_index is not None:
+            try:
+                after = os.stat(dirname).st_mtime_ns
+            except OSError:
+                return
+            self._eclass_index.update(cpv[:s], before, after, {cpv: False})
+
+    def eclass_index(self):
+        """Return the eclass index, updating it for changes since its last use.
+
+        The index is kept across runs and maintained as entries are updated,
+        only directories modified behind its back get rescanned.
+        """
+        self.commit()
+        if self._eclass_index is None:
+            self._eclass_index = _EclassIndex(self)
+        self._eclass_index.refresh()
+        self._eclass_index.save()
+        return self._eclass_index.consumers
 
     def __contains__(self, cpv):
+        s = cpv.rfind("/") + 1
+        if cpv in self._pending.get(cpv[:s], ()):
+            return True
         return os.path.exists(pjoin(self.location, cpv))
 
     def keys(self):
         """generator for walking the dir struct"""
+        # queued updates are written out first so they're included
+        self.commit()
         dirs = [self.location]
         len_base = len(self.location)
         # Note: the misc try/except clauses are to protect against concurrent
@@ -126,7 +477,7 @@ class database(fs_template.FsBased):
             except EnvironmentError as e:
                 raise KeyError(cpv, f"access failure: {e}")
             for l in os.listdir(d):
-                if l.endswith(".cpickle"):
+                if l.endswith(".cpickle") or l.startswith("."):
                     continue
                 p = pjoin(d, l)
                 try:
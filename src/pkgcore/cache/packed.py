@@ -0,0 +1,321 @@
+"""
+single file backend storing all cache entries in one memory-mapped pack
+
+The pack starts with a header line holding the format magic and the size of the
+index that follows it; each index line maps a cpv to the offset and length of
+its entry plus the entry's chksum, allowing staleness checks without decoding
+the entry itself. Entries use the same key=value format as
+:obj:`pkgcore.cache.flat_hash`.
+
+The file handling shared with other single file backends lives in
+:obj:`MappedEntries` and :obj:`mapped_database`.
+"""
+
+__all__ = ("MappedEntries", "mapped_database", "database", "md5_cache")
+
+import mmap
+import os
+from collections.abc import Mapping
+
+from snakeoil import klass
+from snakeoil.chksum import get_handler
+from snakeoil.osutils import pjoin
+
+from ..config.hint import ConfigHint
+from . import bulk, errors, fs_template
+
+
+class MappedEntries(Mapping):
+    """Mapping of cpv to cache entries backed by a memory-mapped file.
+
+    Updates are kept in memory until :meth:`write` is called; subclasses parse
+    the mapped file into the index of stored entries via :meth:`_load`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mmap = None
+        self.reload()
+
+    def reload(self):
+        """Drop pending updates and (re)map the file."""
+        self.close()
+        self._index = {}
+        self._updates = {}
+        try:
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            raise errors.GeneralCacheCorruption(e) from e
+        if self._mmap is not None:
+            self._load()
+
+    def _load(self):
+        raise NotImplementedError(self, "_load")
+
+    def close(self):
+        """Unmap the file."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __contains__(self, cpv):
+        value = self._updates.get(cpv, klass.sentinel)
+        if value is klass.sentinel:
+            return cpv in self._index
+        return value is not None
+
+    def __iter__(self):
+        for cpv in self._index:
+            if cpv not in self._updates:
+                yield cpv
+        for cpv, value in self._updates.items():
+            if value is not None:
+                yield cpv
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def remove_entry(self, cpv):
+        if cpv not in self:
+            raise KeyError(cpv)
+        self._updates[cpv] = None
+
+    def write(self, f):
+        """Write the current entries to a binary file object."""
+        raise NotImplementedError(self, "write")
+
+
+class PackedEntries(MappedEntries):
+    """Mapping of cpv to raw cache entries backed by a memory-mapped pack file.
+
+    Unchanged entries are copied over as is when writing a new pack.
+    """
+
+    magic = b"pkgcore-md5-pack"
+    version = 1
+
+    def _load(self):
+        try:
+            header = self._mmap.readline()
+            magic, version, index_len = header.split()
+            if magic != self.magic or int(version) != self.version:
+                raise ValueError(f"unsupported pack format: {header!r}")
+            start = len(header)
+            data_start = start + int(index_len)
+            index = self._mmap[start:data_start].decode()
+            for line in index.splitlines():
+                cpv, offset, length, chf = line.split("\t")
+                self._index[cpv] = (data_start + int(offset), int(length), chf)
+        except ValueError as e:
+            raise errors.GeneralCacheCorruption(f"{self.path!r}: {e}") from e
+
+    def __getitem__(self, cpv):
+        raw = self._updates.get(cpv, klass.sentinel)
+        if raw is klass.sentinel:
+            offset, length, _chf = self._index[cpv]
+            return self._mmap[offset : offset + length]
+        elif raw is None:
+            raise KeyError(cpv)
+        return raw[0]
+
+    def chf(self, cpv):
+        """Return the serialized ebuild chksum stored in the index for a cpv."""
+        raw = self._updates.get(cpv, klass.sentinel)
+        if raw is klass.sentinel:
+            return self._index[cpv][2]
+        elif raw is None:
+            raise KeyError(cpv)
+        return raw[1]
+
+    def update_entry(self, cpv, raw, chf):
+        self._updates[cpv] = (raw, chf)
+
+    def write(self, f):
+        cpvs = sorted(self)
+        index = []
+        offset = 0
+        for cpv in cpvs:
+            length = len(self[cpv])
+            index.append(f"{cpv}\t{offset}\t{length}\t{self.chf(cpv)}\n")
+            offset += length
+        index = "".join(index).encode()
+        f.write(b"%s %i %i\n" % (self.magic, self.version, len(index)))
+        f.write(index)
+        for cpv in cpvs:
+            f.write(self[cpv])
+
+
+class mapped_database(fs_template.FsBased, bulk):
+    """Base for caches storing all entries in a single memory-mapped file.
+
+    Updates are queued and written out as a new file once the sync rate is
+    reached or on commits, since every write rewrites the whole file; queued
+    updates that aren't committed are lost. Regen raises the sync rate while
+    running so the file is only written once at its end. Processes still
+    using the previous file keep their mapping.
+
+    :cvar entries_class: :obj:`MappedEntries` subclass handling the file
+    """
+
+    pkgcore_config_type = ConfigHint(
+        types={
+            "readonly": "bool",
+            "location": "str",
+            "label": "str",
+            "auxdbkeys": "list",
+        },
+        required=["location"],
+        positional=["location"],
+        typename="cache",
+    )
+
+    chf_type = "md5"
+    eclass_chf_types = ("md5",)
+    chf_base = 16
+    filename = None
+    entries_class = None
+
+    @property
+    def path(self):
+        return pjoin(self.location, self.filename)
+
+    def _read_data(self):
+        return self.entries_class(self.path)
+
+    def _write_data(self):
+        if self.readonly:
+            raise errors.ReadOnly()
+        if not self._ensure_dirs():
+            raise errors.GeneralCacheCorruption(
+                f"error creating directory {self.location!r}"
+            )
+        tmp = pjoin(self.location, f".update.{os.getpid()}.{self.filename}")
+        try:
+            with open(tmp, "wb") as f:
+                self.data.write(f)
+            self._ensure_access(tmp)
+            os.rename(tmp, self.path)
+        except EnvironmentError as e:
+            try:
+                os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise errors.GeneralCacheCorruption(e) from e
+        self.data.reload()
+
+    def commit(self, force=False):
+        # rewriting the whole file without updates is pointless, even if forced
+        if self.readonly or not self._pending_updates:
+            return
+        self._write_data()
+        self._pending_updates = []
+        self.updates = 0
+
+    def _delitem(self, cpv):
+        self.data.remove_entry(cpv)
+        self._pending_updates.append((cpv, None))
+
+    def keys(self):
+        return iter(self.data)
+
+    def clone(self, source):
+        """Replace all entries with those from another cache using the same chksums.
+
+        Entries are copied in their serialized form, e.g. for exporting an
+        existing md5-cache.
+        """
+        if self.readonly:
+            raise errors.ReadOnly()
+        if source.chf_type != self.chf_type:
+            raise errors.CacheError(
+                f"can't clone {source.chf_type} based cache into "
+                f"{self.chf_type} based {self.filename}"
+            )
+        handler = get_handler(self.chf_type)
+        for cpv in list(self.data):
+            self.data.remove_entry(cpv)
+        for cpv in source.keys():
+            # raw entry, _eclasses_ is left serialized by _getitem()
+            values = dict(source._getitem(cpv))
+            values[self._chf_key] = handler.long2str(values[self._chf_key])
+            self._setitem(cpv, values)
+        self._write_data()
+        self._pending_updates = []
+
+
+class database(mapped_database):
+    """Stores all cache entries in a single indexed pack file.
+
+    Repo wide queries only require mapping one file instead of opening every
+    entry.
+    """
+
+    filename = "md5-pack"
+    entries_class = PackedEntries
+
+    def _getitem(self, cpv):
+        try:
+            data = self.data[cpv].decode()
+            return self._parse_data(data.splitlines())
+        except (UnicodeDecodeError, ValueError) as e:
+            raise errors.CacheCorruption(cpv, e) from e
+
+    def _parse_data(self, data):
+        d = self._cdict_kls()
+        known = self._known_keys
+        for x in data:
+            k, v = x.split("=", 1)
+            if k in known:
+                d[k] = v
+        d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        return d
+
+    def _serialize_data(self, values):
+        known = self._known_keys
+        return "".join(
+            f"{k}={v}\n" for k, v in sorted(values.items()) if k in known
+        ).encode()
+
+    def _setitem(self, cpv, values):
+        chf = values[self._chf_key]
+        self.data.update_entry(cpv, self._serialize_data(values), chf)
+        self._pending_updates.append((cpv, chf))
+
+    def validated(self, cpv, ebuild_hash_item, eclass_db):
+        # reject entries with stale ebuild chksums straight from the index
+        chf = self.data.chf(cpv)
+        try:
+            if self._chf_deserializer(chf) != getattr(
+                ebuild_hash_item, self.chf_type, None
+            ):
+                return None
+        except ValueError as e:
+            raise errors.CacheCorruption(cpv, e) from e
+        return super().validated(cpv, ebuild_hash_item, eclass_db)
+
+    def validate_entries(self, entries, eclass_db):
+        # only decode entries whose ebuild chksums in the index are current
+        stale = set()
+        remaining = []
+        for cpv, ebuild_hash_item in entries:
+            try:
+                chf = self._chf_deserializer(self.data.chf(cpv))
+            except (KeyError, ValueError):
+                stale.add(cpv)
+                continue
+            if chf != getattr(ebuild_hash_item, self.chf_type, None):
+                stale.add(cpv)
+            else:
+                remaining.append((cpv, ebuild_hash_item))
+        stale.update(super().validate_entries(remaining, eclass_db))
+        return stale
+
+
+class md5_cache(database):
+    def __init__(self, location, **config):
+        location = pjoin(location, "metadata")
+        super().__init__(location, **config)
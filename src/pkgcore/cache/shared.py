@@ -0,0 +1,183 @@
+"""
+cache backend storing decoded entries in a memory-mapped string table
+
+The store is a single file meant to live on a tmpfs such as ``/dev/shm``; every
+process maps it read only, so one copy of a repo's metadata is shared by all
+pkgcore processes on a host instead of each parsing its own. Keys and values
+are deduplicated into one string table with entries referencing them by
+index, and each process decodes a given string only once regardless of how
+many entries share it.
+
+The file consists of a header, the string offsets, the entry index (sorted by
+cpv), the key/value index pairs of all entries and finally the UTF-8 encoded
+strings. Integers use the native byte order since the store is host local.
+
+It's enabled per repo via the ``shared-cache`` repos.conf setting naming the
+directory holding the stores, e.g.::
+
+    [gentoo]
+    location = /var/db/repos/gentoo
+    shared-cache = /dev/shm/pkgcore
+
+which checks ``/dev/shm/pkgcore/gentoo`` before the repo's regular cache. The
+store is filled from the regular cache via ``pclonecache cache:gentoo
+shared-cache:gentoo``; ``pmaint regen`` only adds the entries it regenerates
+to it, so rerun ``pclonecache`` after syncing the repo.
+"""
+
+__all__ = ("SharedEntries", "database")
+
+import struct
+import sys
+from array import array
+
+from snakeoil import klass
+
+from . import errors
+from .packed import MappedEntries, mapped_database
+
+
+class SharedEntries(MappedEntries):
+    """Mapping of cpv to cache entries backed by a memory-mapped store file."""
+
+    magic = b"pkgcore-shm-meta"
+    version = 1
+    # magic, version, byte order, string count, entry count, pair count
+    _header = struct.Struct("=16sIIIII4x")
+    # views of the mapped sections, released before unmapping
+    _views = ()
+
+    def reload(self):
+        self._strings = {}
+        super().reload()
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = ()
+        super().close()
+
+    def _load(self):
+        try:
+            magic, version, byteorder, nstrings, nentries, npairs = (
+                self._header.unpack_from(self._mmap)
+            )
+            if magic != self.magic or version != self.version:
+                raise ValueError(f"unsupported store format: {magic!r} {version}")
+            if byteorder != self._byteorder():
+                raise ValueError("store was written with a different byte order")
+            view = memoryview(self._mmap)
+            self._views = sections = []
+            offset = self._header.size
+            for typecode, length in (("Q", nstrings + 1), ("I", nentries * 3)):
+                size = length * array(typecode).itemsize
+                sections.append(view[offset : offset + size].cast(typecode))
+                offset += self._padded(size)
+            size = npairs * 2 * array("I").itemsize
+            sections.append(view[offset : offset + size].cast("I"))
+            self._offsets, entries, self._pairs = sections
+            # the sections are released first, then the view they're cast from
+            sections.append(view)
+            self._blob = offset + self._padded(size)
+            if self._blob + self._offsets[-1] > len(self._mmap):
+                raise ValueError("truncated store")
+            for i in range(nentries):
+                cpv, start, count = entries[i * 3 : i * 3 + 3]
+                self._index[self._string(cpv)] = (start, count)
+        except (struct.error, TypeError, IndexError, ValueError) as e:
+            raise errors.GeneralCacheCorruption(f"{self.path!r}: {e}") from e
+
+    @staticmethod
+    def _byteorder():
+        return 1 if sys.byteorder == "little" else 2
+
+    @staticmethod
+    def _padded(size):
+        return size + (-size % 8)
+
+    def _string(self, idx):
+        # strings are decoded once per process and shared between entries
+        s = self._strings.get(idx)
+        if s is None:
+            start = self._blob + self._offsets[idx]
+            end = self._blob + self._offsets[idx + 1]
+            s = self._strings[idx] = self._mmap[start:end].decode()
+        return s
+
+    def __getitem__(self, cpv):
+        values = self._updates.get(cpv, klass.sentinel)
+        if values is None:
+            raise KeyError(cpv)
+        elif values is not klass.sentinel:
+            return dict(values)
+        start, count = self._index[cpv]
+        pairs = self._pairs[start * 2 : (start + count) * 2]
+        string = self._string
+        return {string(pairs[i]): string(pairs[i + 1]) for i in range(0, len(pairs), 2)}
+
+    def update_entry(self, cpv, values):
+        self._updates[cpv] = values
+
+    def write(self, f):
+        strings = {}
+
+        def intern(s):
+            idx = strings.get(s)
+            if idx is None:
+                idx = strings[s] = len(strings)
+            return idx
+
+        entries = array("I")
+        pairs = array("I")
+        for cpv in sorted(self):
+            values = self[cpv]
+            entries.extend((intern(cpv), len(pairs) // 2, len(values)))
+            for k, v in sorted(values.items()):
+                pairs.extend((intern(k), intern(v)))
+
+        offsets = array("Q", [0])
+        blob = []
+        for s in strings:
+            data = s.encode()
+            blob.append(data)
+            offsets.append(offsets[-1] + len(data))
+
+        f.write(
+            self._header.pack(
+                self.magic,
+                self.version,
+                self._byteorder(),
+                len(strings),
+                len(entries) // 3,
+                len(pairs) // 2,
+            )
+        )
+        for section in (offsets, entries, pairs):
+            data = section.tobytes()
+            f.write(data)
+            f.write(b"\0" * (self._padded(len(data)) - len(data)))
+        f.writelines(blob)
+
+
+class database(mapped_database):
+    """Stores cache entries in a memory-mapped, deduplicated string table.
+
+    Entries are held in their serialized form.
+    """
+
+    filename = "metadata.shm"
+    entries_class = SharedEntries
+
+    def _getitem(self, cpv):
+        known = self._known_keys
+        d = self._cdict_kls((k, v) for k, v in self.data[cpv].items() if k in known)
+        try:
+            d[self._chf_key] = self._chf_deserializer(d[self._chf_key])
+        except (KeyError, ValueError) as e:
+            raise errors.CacheCorruption(cpv, e) from e
+        return d
+
+    def _setitem(self, cpv, values):
+        known = self._known_keys
+        self.data.update_entry(cpv, {k: v for k, v in values.items() if k in known})
+        self._pending_updates.append((cpv, values))
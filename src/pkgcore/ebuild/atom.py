@@ -18,7 +18,7 @@ from ..restrictions.packages import Conditional
 from ..restrictions.values import ContainmentMatch
 from . import cpv
 from . import eapi as eapi_mod
-from . import errors, restricts
+from . import errors, parse_cache, restricts
 
 # namespace compatibility...
 MalformedAtom = errors.MalformedAtom
@@ -36,7 +36,7 @@ valid_slot_chars = frozenset(valid_slot_chars)
 valid_ops = frozenset(["<", "<=", "=", "~", ">=", ">"])
 
 
-class atom(boolean.AndRestriction, metaclass=klass.generic_equality):
+class atom(boolean.AndRestriction, metaclass=parse_cache.generic_equality):
     """Currently implements gentoo ebuild atom parsing.
 
     Should be converted into an agnostic dependency base.
@@ -81,6 +81,7 @@ class atom(boolean.AndRestriction, metaclass=klass.generic_equality):
     locals().pop("__eq__", None)
     locals().pop("__ne__", None)
     __inst_caching__ = True
+    __parse_caching__ = True
 
     # overrided in child class if it's supported
     evaluate_depset = None
@@ -453,7 +454,7 @@ class atom(boolean.AndRestriction, metaclass=klass.generic_equality):
         if c:
             return c
 
-        c = cpv.ver_cmp(self.version, self.revision, other.version, other.revision)
+        c = cmp(self._cpv.version_key, other._cpv.version_key)
         if c:
             return c
 
@@ -694,6 +695,7 @@ class atom(boolean.AndRestriction, metaclass=klass.generic_equality):
 class transitive_use_atom(atom):
     __slots__ = ()
     __inst_caching__ = True
+    __parse_caching__ = True
     _nontransitive_use_atom = atom
 
     is_simple = False
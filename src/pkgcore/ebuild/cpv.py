@@ -2,11 +2,12 @@
 
 from collections import UserString
 
+from snakeoil import klass
 from snakeoil.compatibility import cmp
 from snakeoil.demandload import demand_compile_regexp
 
 from ..package import base
-from . import atom
+from . import atom, parse_cache
 from .errors import InvalidCPV
 
 demand_compile_regexp("suffix_regexp", "^(alpha|beta|rc|pre|p)(\\d*)$")
@@ -240,6 +241,67 @@ def ver_cmp(ver1: str, rev1: str, ver2: str, rev2: str) -> int:
     return cmp(rev1, rev2)
 
 
+def _revision_int(rev) -> int:
+    if not rev:
+        return 0
+    if isinstance(rev, Revision):
+        return rev._revint
+    return int(rev)
+
+
+def _version_component_key(component: str):
+    # components with leading zeros compare as strings sans trailing zeros and
+    # always sort before other components, see ver_cmp()
+    if component[0] == "0":
+        return (0, component.rstrip("0"))
+    return (1, int(component))
+
+
+def ver_key(ver: str, rev=None) -> tuple:
+    """Return a key ordering versions and revisions the same way as :func:`ver_cmp`.
+
+    Keys are tuples of the dotted components, the letter suffix, the
+    ``_suffix`` values terminated by a neutral marker and the revision, so
+    keys of any two versions compare natively.
+    """
+    parts = ver.split("_")
+    components = parts[0].split(".")
+    letter = -1
+    if components[-1][-1].isalpha():
+        letter = ord(components[-1][-1])
+        components[-1] = components[-1][:-1]
+    suffixes = []
+    for suffix in parts[1:]:
+        match = suffix_regexp.match(suffix)
+        suffixes.append((suffix_value[match.group(1)], int("0" + match.group(2))))
+    # suffix values are never zero, a suffix list ending first ranks between
+    # ones continuing with a negative (pre-release) or positive (patch) suffix
+    suffixes.append((0, 0))
+    return (
+        tuple(_version_component_key(x) for x in components),
+        letter,
+        tuple(suffixes),
+        _revision_int(rev),
+    )
+
+
+def fullver_key(fullver: str):
+    """Return the :func:`ver_key` of a version with optional revision.
+
+    :return: key tuple or None if the version is invalid
+    """
+    ver, sep, rev = fullver.rpartition("-")
+    if not sep:
+        ver, rev = fullver, None
+    elif isvalid_rev(rev):
+        rev = rev[1:]
+    else:
+        return None
+    if not isvalid_version_re.match(ver):
+        return None
+    return ver_key(ver, rev)
+
+
 class CPV(base.base):
     """base ebuild package class
 
@@ -260,6 +322,7 @@ class CPV(base.base):
         "version",
         "revision",
         "fullver",
+        "_version_key",
     )
 
     def __init__(self, *args, versioned=None):
@@ -365,10 +428,7 @@ class CPV(base.base):
             if self.cpvstr == other.cpvstr:
                 return True
             if self.category == other.category and self.package == other.package:
-                return (
-                    ver_cmp(self.version, self.revision, other.version, other.revision)
-                    == 0
-                )
+                return self.version_key == other.version_key
         except AttributeError:
             pass
         return False
@@ -380,12 +440,7 @@ class CPV(base.base):
         try:
             if self.category == other.category:
                 if self.package == other.package:
-                    return (
-                        ver_cmp(
-                            self.version, self.revision, other.version, other.revision
-                        )
-                        < 0
-                    )
+                    return self.version_key < other.version_key
                 return self.package < other.package
             return self.category < other.category
         except AttributeError:
@@ -398,12 +453,7 @@ class CPV(base.base):
         try:
             if self.category == other.category:
                 if self.package == other.package:
-                    return (
-                        ver_cmp(
-                            self.version, self.revision, other.version, other.revision
-                        )
-                        <= 0
-                    )
+                    return self.version_key <= other.version_key
                 return self.package < other.package
             return self.category < other.category
         except AttributeError:
@@ -416,12 +466,7 @@ class CPV(base.base):
         try:
             if self.category == other.category:
                 if self.package == other.package:
-                    return (
-                        ver_cmp(
-                            self.version, self.revision, other.version, other.revision
-                        )
-                        > 0
-                    )
+                    return self.version_key > other.version_key
                 return self.package > other.package
             return self.category > other.category
         except AttributeError:
@@ -434,12 +479,7 @@ class CPV(base.base):
         try:
             if self.category == other.category:
                 if self.package == other.package:
-                    return (
-                        ver_cmp(
-                            self.version, self.revision, other.version, other.revision
-                        )
-                        >= 0
-                    )
+                    return self.version_key >= other.version_key
                 return self.package > other.package
             return self.category > other.category
         except AttributeError:
@@ -448,6 +488,16 @@ class CPV(base.base):
                 f"{self.__class__.__name__!r} and {other.__class__.__name__!r}"
             )
 
+    @klass.jit_attr_named("_version_key")
+    def version_key(self):
+        """Sortable key of the version and revision, see :func:`ver_key`.
+
+        Unversioned CPVs use an empty key, sorting before any version.
+        """
+        if self.version is None:
+            return ()
+        return ver_key(self.version, self.revision)
+
     @property
     def versioned_atom(self):
         if self.version is not None:
@@ -467,15 +517,39 @@ class CPV(base.base):
         return cls(versioned=False, *args)
 
 
+def _cached_cpv(cls, args, versioned):
+    key = (cls, args)
+    instance = parse_cache.cache.get(key)
+    if instance is None:
+        instance = object.__new__(cls)
+        CPV.__init__(instance, *args, versioned=versioned)
+        parse_cache.cache.add(key, instance)
+    return instance
+
+
 class VersionedCPV(CPV):
     __slots__ = ()
 
+    def __new__(cls, *args, **kwargs):
+        # packages derive from this, only plain instances are shared
+        if cls is not VersionedCPV or not args:
+            return super().__new__(cls)
+        return _cached_cpv(cls, args, True)
+
     def __init__(self, *args):
-        super().__init__(*args, versioned=True)
+        # shared instances are initialized on creation
+        if type(self) is not VersionedCPV or not args:
+            super().__init__(*args, versioned=True)
 
 
 class UnversionedCPV(CPV):
     __slots__ = ()
 
+    def __new__(cls, *args, **kwargs):
+        if cls is not UnversionedCPV or not args:
+            return super().__new__(cls)
+        return _cached_cpv(cls, args, False)
+
     def __init__(self, *args):
-        super().__init__(*args, versioned=False)
+        if type(self) is not UnversionedCPV or not args:
+            super().__init__(*args, versioned=False)
@@ -28,6 +28,7 @@ from snakeoil.sequences import predicate_split, split_negations, stable_unique
 
 from ..binpkg import repository as binary_repo
 from ..cache.flat_hash import md5_cache
+from ..cache.packed import md5_cache as packed_md5_cache
 from ..config import basics
 from ..config import errors as config_errors
 from ..config.domain import Failure
@@ -40,6 +41,7 @@ from ..repository import filtered
 from ..repository.util import RepositoryGroup
 from ..restrictions import packages, values
 from ..restrictions.delegated import delegate
+from ..restrictions.restriction import compile_match
 from ..util.parserestrict import ParseError, parse_match
 from . import const
 from . import repository as ebuild_repo
@@ -149,8 +151,8 @@ def package_env_splitter(basedir, iterable):
 
 def apply_mask_filter(globs, atoms, pkg, mode):
     # mode is ignored; non applicable.
-    for r in chain(globs, atoms.get(pkg.key, ())):
-        if r.match(pkg):
+    for match in chain(globs, atoms.get(pkg.key, ())):
+        if match(pkg):
             return True
     return False
 
@@ -160,9 +162,9 @@ def make_mask_filter(masks, negate=False):
     globs = []
     for m in masks:
         if isinstance(m, _atom):
-            atoms[m.key].append(m)
+            atoms[m.key].append(compile_match(m))
         else:
-            globs.append(m)
+            globs.append(compile_match(m))
     return delegate(partial(apply_mask_filter, globs, atoms), negate=negate)
 
 
@@ -761,7 +763,9 @@ class domain(config_domain):
         except OSError as e:
             raise repo_errors.InvalidRepo(str(e))
 
-        if repo_config.cache_format is not None:
+        if repo_config.cache_format == "md5-pack":
+            kwargs["cache"] = (packed_md5_cache(path),)
+        elif repo_config.cache_format is not None:
             # default to using md5 cache
             kwargs["cache"] = (md5_cache(path),)
         repo = ebuild_repo.tree(config, repo_config, **kwargs)
@@ -5,6 +5,7 @@ package class for buildable ebuilds
 __all__ = ("base", "package", "package_factory")
 
 import os
+from collections import deque
 from functools import partial
 from itertools import chain
 from sys import intern
@@ -420,7 +421,8 @@ class base(metadata.package):
         return self._parent.get_ebuild_src(self)
 
     def _fetch_metadata(self, ebp=None, force_regen=None):
-        return self._parent._get_metadata(self, ebp=ebp, force_regen=force_regen)
+        data = self._parent._get_metadata(self, ebp=ebp, force_regen=force_regen)
+        return metadata.MetadataRecord.from_metadata(data)
 
     def __str__(self):
         return f"ebuild src: {self.cpvstr}"
@@ -455,7 +457,7 @@ class package(base):
         return data_source.data_source(data, mutable=False)
 
     def _get_ebuild_environment(self, ebp=None):
-        with processor.reuse_or_request(ebp) as ebp:
+        with processor.reuse_or_request(ebp, pooled=True) as ebp:
             return ebp.get_ebuild_environment(self, self.repo.eclass_cache)
 
 
@@ -493,17 +495,27 @@ class package_factory(metadata.factory):
         return os.stat(self._get_ebuild_path(pkg)).st_mtime
 
     def _get_metadata(self, pkg, ebp=None, force_regen=False):
-        caches = self._cache
-        if force_regen:
-            caches = ()
+        if not force_regen:
+            data = self._get_cached_metadata(pkg)
+            if data is not None:
+                return data
+
+        # no cache entries, regen
+        return self._update_metadata(pkg, ebp=ebp)
+
+    def _get_cached_metadata(self, pkg, purge=True):
+        """Return the first valid cache entry for a package, None if there isn't one.
+
+        :param purge: remove stale entries from writable caches
+        """
         ebuild_hash = chksum.LazilyHashedPath(pkg.path)
-        for cache in caches:
+        for cache in self._cache:
             if cache is not None:
                 try:
-                    data = cache[pkg.cpvstr]
-                    if cache.validate_entry(data, ebuild_hash, self._ecache):
+                    data = cache.validated(pkg.cpvstr, ebuild_hash, self._ecache)
+                    if data is not None:
                         return data
-                    if not cache.readonly:
+                    if purge and not cache.readonly:
                         del cache[pkg.cpvstr]
                 except KeyError:
                     continue
@@ -511,23 +523,91 @@ class package_factory(metadata.factory):
                     logger.warning("caught cache error: %s", e)
                     del e
                     continue
+        return None
+
+    def validated_caches(self, pkgs):
+        """Determine which cache holds a valid entry for each package in one pass.
+
+        Each ebuild is hashed at most once, regardless of the number of caches
+        consulted.
+
+        :param pkgs: iterable of packages from this factory
+        :return: tuple of a mapping of cpv strings to the first cache holding a
+            valid entry and the set of cpv strings for packages requiring regen
+        """
+        pending = {pkg.cpvstr: chksum.LazilyHashedPath(pkg.path) for pkg in pkgs}
+        valid = {}
+        for cache in self._cache:
+            if not pending:
+                break
+            if cache is not None:
+                stale = cache.validate_entries(pending.items(), self._ecache)
+                valid.update((k, cache) for k in pending if k not in stale)
+                pending = {k: v for k, v in pending.items() if k in stale}
+        return valid, set(pending)
 
-        # no cache entries, regen
-        return self._update_metadata(pkg, ebp=ebp)
+    def stale_metadata(self, pkgs):
+        """Determine which packages lack a valid cache entry in one pass.
+
+        :param pkgs: iterable of packages from this factory
+        :return: set of cpv strings for packages requiring regen
+        """
+        return self.validated_caches(pkgs)[1]
 
-    def _update_metadata(self, pkg, ebp=None):
+    def _update_metadata(self, pkg, ebp=None, store=True):
         parsed_eapi = pkg.eapi
         if not parsed_eapi.is_supported:
             return {"EAPI": str(parsed_eapi)}
 
-        with processor.reuse_or_request(ebp) as my_proc:
+        with processor.reuse_or_request(ebp, pooled=True) as my_proc:
             try:
                 mydata = my_proc.get_keys(pkg, self._ecache)
             except processor.ProcessorError as e:
                 raise metadata_errors.MetadataException(
                     pkg, "data", "failed sourcing ebuild", e
                 )
+        return self._process_metadata(pkg, mydata, store=store)
+
+    def _update_metadata_pipelined(self, pkgs, ebp=None, store=True):
+        """Regenerate metadata for multiple packages, pipelining requests to the processor.
+
+        See :meth:`pkgcore.ebuild.processor.EbuildProcessor.get_keys_pipelined`.
+        Packages left over by a processor dying are resubmitted to a new one.
 
+        :return: iterator of (pkg, metadata) tuples, metadata being a
+            :obj:`pkgcore.package.errors.MetadataException` instance on failure
+        """
+        queue = deque()
+        for pkg in pkgs:
+            try:
+                eapi = pkg.eapi
+            except metadata_errors.MetadataException as e:
+                yield pkg, e
+                continue
+            if eapi.is_supported:
+                queue.append(pkg)
+            else:
+                yield pkg, {"EAPI": str(eapi)}
+
+        while queue:
+            with processor.reuse_or_request(ebp, pooled=True) as my_proc:
+                for pkg, mydata in my_proc.get_keys_pipelined(queue, self._ecache):
+                    if isinstance(mydata, processor.ProcessorError):
+                        yield pkg, metadata_errors.MetadataException(
+                            pkg, "data", "failed sourcing ebuild", mydata
+                        )
+                        continue
+                    try:
+                        mydata = self._process_metadata(pkg, mydata, store=store)
+                    except metadata_errors.MetadataException as e:
+                        mydata = e
+                    yield pkg, mydata
+            # the processor died if anything is left over
+            ebp = None
+
+    def _process_metadata(self, pkg, mydata, store=True):
+        """Convert metadata keys received from a processor into a cache entry."""
+        parsed_eapi = pkg.eapi
         # Rewrite defined_phases as needed, since we now know the EAPI.
         eapi = get_eapi(mydata.get("EAPI", "0"))
         if parsed_eapi != eapi:
@@ -555,6 +635,13 @@ class package_factory(metadata.factory):
         for x in wipes:
             del mydata[x]
 
+        if store:
+            self._store_metadata(pkg, mydata)
+
+        return mydata
+
+    def _store_metadata(self, pkg, mydata):
+        """Write regenerated metadata to the first writable cache."""
         if self._cache is not None:
             for cache in self._cache:
                 if not cache.readonly:
@@ -564,10 +651,9 @@ class package_factory(metadata.factory):
                         logger.warning("caught cache error: %s", e)
                         del e
                         continue
+                    self._parent_repo._reset_metadata_index()
                     break
 
-        return mydata
-
     def new_package(self, *args):
         if self._parent_repo.package_cache:
             inst = self._cached_instances.get(args)
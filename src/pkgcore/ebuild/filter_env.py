@@ -2,13 +2,39 @@
 
 __all__ = ("run",)
 
+import hashlib
 import io
 import re
+from collections import OrderedDict
+from functools import lru_cache
 
 from ..log import logger
 
 COMMAND_PARSING, SPACE_PARSING = list(range(2))
 
+# Scanners skip straight to the next character that changes parser state
+# instead of stepping through the buffer a character at a time in python.
+_skip_space = re.compile(r"\s*").match
+_word_end = re.compile(r"\w*").match
+_brace_special = re.compile(r"[$}]").search
+_envvar_match = re.compile(r"[ \t]*([^\0\"'()\- \t\n=]+)=").match
+_function_match = re.compile(r"\s*([^\0 \t\n=\"'()]+)[ \t]*\([ \t]*\)\s*\{").match
+
+
+# filtered output of recent runs keyed by input digest and filters, the same
+# environment dump tends to get filtered by every phase of a build
+_FILTERED_CACHE_SIZE = 16
+_filtered_cache = OrderedDict()
+
+
+@lru_cache
+def _special_chars(chars, space=False):
+    """Return a search function for the next char out of a given set."""
+    pattern = re.escape("".join(sorted(set(chars))))
+    if space:
+        pattern += r"\s"
+    return re.compile(f"[{pattern}]").search
+
 
 def run(
     out,
@@ -61,62 +87,21 @@ FUNC_LEN = len("function")
 
 def is_function(buff, pos):
     """:return: start, end, pos or None, None, None tuple."""
-    isspace = str.isspace
-    try:
-        while buff[pos] in " \t":
-            pos += 1
-        if buff[pos : pos + FUNC_LEN] == "function":
-            try:
-                if isspace(buff[pos + FUNC_LEN]):
-                    pos += FUNC_LEN + 1
-            except IndexError:
-                # insane, but it could still be a function-
-                # len('f(){:;}') <= FUNC_LEN.
-                pass
-        while isspace(buff[pos]):
-            pos += 1
-        start = pos
-        while buff[pos] not in "\0 \t\n=\"'()":
-            pos += 1
-        end = pos
-        if end == start:
-            return None, None, None
-        while buff[pos] in " \t":
-            pos += 1
-        if buff[pos] != "(":
-            return None, None, None
+    while buff[pos : pos + 1] in (" ", "\t"):
         pos += 1
-        while buff[pos] in " \t":
-            pos += 1
-        if buff[pos] != ")":
-            return None, None, None
-        pos += 1
-        while isspace(buff[pos]):
-            pos += 1
-        if buff[pos] != "{":
-            return None, None, None
-        return start, end, pos + 1
-    except IndexError:
-        # can't be a function, ran off the end
+    if buff[pos : pos + FUNC_LEN] == "function":
+        if buff[pos + FUNC_LEN : pos + FUNC_LEN + 1].isspace():
+            pos += FUNC_LEN + 1
+    if (m := _function_match(buff, pos)) is None:
         return None, None, None
+    return m.start(1), m.end(1), m.end()
 
 
 def is_envvar(buff, pos):
     """:return: start, end, pos or None, None, None tuple."""
-    try:
-        while buff[pos] in " \t":
-            pos += 1
-        start = pos
-        while True:
-            if buff[pos] in "\0\"'()- \t\n":
-                return None, None, None
-            if buff[pos] == "=":
-                if pos == start:
-                    return None, None, None
-                return start, pos, pos + 1
-            pos += 1
-    except IndexError:
+    if (m := _envvar_match(buff, pos)) is None:
         return None, None, None
+    return m.start(1), m.end(1), m.end()
 
 
 def process_scope(
@@ -144,7 +129,7 @@ def process_scope(
         com_start = pos
         ch = buff[pos]
         if isspace(ch):
-            pos += 1
+            pos = _skip_space(buff, pos).end()
             continue
 
         # Ignore comments.
@@ -235,12 +220,14 @@ def walk_statement_no_parsing(buff, pos, endchar):
 
 def walk_statement_dollared_quote_parsing(buff, pos, endchar):
     end = len(buff)
+    special = _special_chars(endchar + "\\")
     while pos < end:
+        if (m := special(buff, pos)) is None:
+            return end
+        pos = m.start()
         if buff[pos] == endchar:
             return pos
-        elif buff[pos] == "\\":
-            pos += 1
-        pos += 1
+        pos += 2
     return pos
 
 
@@ -311,7 +298,14 @@ def walk_command_complex(buff, pos, endchar, interpret_level):
     start = pos
     isspace = str.isspace
     end = len(buff)
+    if interpret_level == COMMAND_PARSING:
+        special = _special_chars(endchar + ";\n\\<#${(`\"'")
+    else:
+        special = _special_chars(endchar + "\\<#${`\"'", space=True)
     while pos < end:
+        if (m := special(buff, pos)) is None:
+            return end
+        pos = m.start()
         ch = buff[pos]
         if ch == endchar:
             if endchar != "}":
@@ -360,7 +354,14 @@ def walk_command_complex(buff, pos, endchar, interpret_level):
 
 def raw_walk_command_escaped_parsing(buff, pos, endchar):
     end = len(buff)
+    if endchar == '"':
+        special = _special_chars('"\\`$')
+    else:
+        special = _special_chars(endchar + "\\{(`\"'$#")
     while pos < end:
+        if (m := special(buff, pos)) is None:
+            return end
+        pos = m.start()
         ch = buff[pos]
         if ch == endchar:
             return pos
@@ -400,17 +401,10 @@ def walk_dollar_expansion(buff, pos, end, endchar, disable_quote=False):
         if buff[pos] == "$":
             # short circuit it.
             return pos + 1
-        while pos < end and buff[pos] != endchar:
-            if buff[pos].isspace():
-                return pos
-            if buff[pos] == "$":
-                # shouldn't this be passing disable_quote ?
-                return walk_dollar_expansion(buff, pos + 1, end, endchar)
-            if not buff[pos].isalnum():
-                if buff[pos] != "_":
-                    return pos
-            pos += 1
-
+        pos = _word_end(buff, pos).end()
+        if pos < end and buff[pos] == "$" and endchar != "$":
+            # shouldn't this be passing disable_quote ?
+            return walk_dollar_expansion(buff, pos + 1, end, endchar)
         if pos >= end:
             return end
         return pos
@@ -419,15 +413,23 @@ def walk_dollar_expansion(buff, pos, end, endchar, disable_quote=False):
     # shortcut ${$} to avoid going too deep. ${$a} isn't valid, so no concern
     if pos == "$":
         return pos + 1
-    while pos < end and buff[pos] != "}":
-        if buff[pos] == "$":
-            # disable_quote?
-            pos = walk_dollar_expansion(buff, pos + 1, end, endchar)
-        else:
-            pos += 1
+    while pos < end:
+        if (m := _brace_special(buff, pos)) is None:
+            pos = end
+            break
+        pos = m.start()
+        if buff[pos] == "}":
+            break
+        # disable_quote?
+        pos = walk_dollar_expansion(buff, pos + 1, end, endchar)
     return pos + 1
 
 
+@lru_cache(maxsize=64)
+def _build_matcher(tokens, invert):
+    return build_regex_string(tokens, invert=invert).match
+
+
 def main_run(
     out_handle,
     data,
@@ -438,21 +440,47 @@ def main_run(
     global_envvar_callback=None,
     func_callback=None,
 ):
+    if funcs_to_filter and isinstance(funcs_to_filter, str):
+        raise ValueError("funcs_str should not be a string; should be a sequence.")
+    if out_handle is None:
+        out_handle = io.BytesIO()
+
+    # callbacks need to see the parse, everything else can reuse prior output
+    key = None
+    if global_envvar_callback is None and func_callback is None:
+        key = (
+            hashlib.sha1(data.encode("utf-8", "surrogatepass")).digest(),
+            tuple(vars_to_filter or ()),
+            tuple(funcs_to_filter or ()),
+            bool(vars_is_whitelist),
+            bool(funcs_is_whitelist),
+        )
+        output = _filtered_cache.get(key)
+        if output is not None:
+            _filtered_cache.move_to_end(key)
+            out_handle.write(output)
+            return
+
     vars = funcs = None
     if vars_to_filter:
-        vars = build_regex_string(vars_to_filter, invert=vars_is_whitelist).match
-
+        vars = _build_matcher(tuple(vars_to_filter), vars_is_whitelist)
     if funcs_to_filter:
-        if isinstance(funcs_to_filter, str):
-            raise ValueError("funcs_str should not be a string; should be a sequence.")
-        funcs = build_regex_string(funcs_to_filter, invert=funcs_is_whitelist).match
+        funcs = _build_matcher(tuple(funcs_to_filter), funcs_is_whitelist)
 
     data = data + "\0"
     kwds = {"global_envvar_callback": global_envvar_callback}
 
     if func_callback:
         kwds["func_callback"] = func_callback
-    if out_handle is None:
-        out_handle = io.BytesIO()
 
-    run(out_handle, data, vars, funcs, **kwds)
+    if key is None:
+        run(out_handle, data, vars, funcs, **kwds)
+        return
+
+    out = io.BytesIO()
+    run(out, data, vars, funcs, **kwds)
+    output = out.getvalue()
+    _filtered_cache[key] = output
+    while len(_filtered_cache) > _FILTERED_CACHE_SIZE:
+        _filtered_cache.popitem(last=False)
+    out_handle.write(output)
@@ -0,0 +1,111 @@
+"""
+process wide cache of parsed atoms and CPVs
+
+Dependency strings across a repo reference the same atoms over and over, this
+keeps a bounded number of recently parsed instances around so identical
+arguments return the existing (immutable) instance instead of parsing again.
+Instances are cached per class, constructor arguments (including the EAPI)
+form the rest of the key.
+"""
+
+__all__ = ("ParseCache", "ParseCachingMeta", "generic_equality", "cache", "stats")
+
+from collections import OrderedDict, namedtuple
+
+from snakeoil import klass
+from snakeoil.caching import WeakInstMeta
+
+CacheStats = namedtuple("CacheStats", ("hits", "misses", "size", "maxsize"))
+
+
+class ParseCache:
+    """Bounded LRU mapping of constructor arguments to parsed instances.
+
+    :param maxsize: maximum number of cached instances, 0 disables caching
+    """
+
+    def __init__(self, maxsize=16384):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached instance for a key or None, updating statistics."""
+        try:
+            instance = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            # evicted by another thread
+            pass
+        return instance
+
+    def add(self, key, instance):
+        """Cache an instance, evicting the least recently used if full."""
+        if not self.maxsize:
+            return
+        entries = self._entries
+        entries[key] = instance
+        while len(entries) > self.maxsize:
+            try:
+                entries.popitem(last=False)
+            except KeyError:
+                break
+
+    def resize(self, maxsize):
+        """Change the cache size, evicting entries as required."""
+        self.maxsize = maxsize
+        while len(self._entries) > maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached instances and reset statistics."""
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """Return a :obj:`CacheStats` tuple of hits, misses, size and maxsize."""
+        return CacheStats(self.hits, self.misses, len(self._entries), self.maxsize)
+
+
+cache = ParseCache()
+stats = cache.stats
+
+
+class ParseCachingMeta(WeakInstMeta):
+    """Metaclass looking instances up in the shared parse cache.
+
+    Similar to ``__inst_caching__``, each class enables it separately by
+    setting ``__parse_caching__ = True``; passing ``disable_inst_caching=True``
+    into the constructor bypasses it.
+    """
+
+    def __new__(cls, name, bases, d):
+        d["__parse_caching__"] = bool(d.get("__parse_caching__", False))
+        return super().__new__(cls, name, bases, d)
+
+    def __call__(cls, *args, **kwargs):
+        if not cls.__parse_caching__ or kwargs.get("disable_inst_caching", False):
+            return super().__call__(*args, **kwargs)
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        try:
+            instance = cache.get(key)
+        except TypeError:
+            # unhashable arguments
+            return super().__call__(*args, **kwargs)
+        if instance is None:
+            instance = super().__call__(*args, **kwargs)
+            cache.add(key, instance)
+        return instance
+
+
+def generic_equality(name, bases, scope):
+    """:func:`snakeoil.klass.generic_equality` creating parse cached classes."""
+    return klass.generic_equality(name, bases, scope, real_type=ParseCachingMeta)
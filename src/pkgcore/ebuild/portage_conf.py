@@ -635,7 +635,10 @@ class PortageConfig(DictMixin):
         """Configure repo cache."""
         # Use md5 cache if it exists or the option is selected, otherwise default
         # to the old flat hash format in /var/cache/edb/dep/*.
-        if (
+        if cache_format == "md5-pack":
+            kls = "pkgcore.cache.packed.md5_cache"
+            cache_parent_dir = pjoin(repo_path, "metadata")
+        elif (
             os.path.exists(pjoin(repo_path, "metadata", "md5-cache"))
             or cache_format == "md5-dict"
         ):
@@ -695,11 +698,34 @@ class PortageConfig(DictMixin):
             "repo_config": "conf:" + repo_name,
         }
 
-        # metadata cache
-        if repo_obj.cache_format is not None:
+        # metadata cache, repos.conf settings override layout.conf
+        cache_format = repo_obj.cache_format
+        if (repo_cache_format := repo_opts.get("cache-format")) is not None:
+            if repo_cache_format in repo_obj.supported_cache_formats:
+                cache_format = repo_cache_format
+            else:
+                logger.warning(
+                    f"repos.conf: {repo_name!r} repo has unsupported cache-format "
+                    f"{repo_cache_format!r}, ignoring setting"
+                )
+        caches = []
+        if cache_format is not None:
             cache_name = "cache:" + repo_name
-            self[cache_name] = self._make_cache(repo_obj.cache_format, repo_path)
-            repo["cache"] = cache_name
+            self[cache_name] = self._make_cache(cache_format, repo_path)
+            caches.append(cache_name)
+        # shared memory-mapped store checked before the regular cache, it's
+        # filled from the regular cache by pclonecache
+        if (shared_cache := repo_opts.get("shared-cache")) is not None:
+            cache_name = "shared-cache:" + repo_name
+            self[cache_name] = basics.AutoConfigSection(
+                {
+                    "class": "pkgcore.cache.shared.database",
+                    "location": pjoin(shared_cache, repo_name),
+                }
+            )
+            caches.insert(0, cache_name)
+        if caches:
+            repo["cache"] = " ".join(caches)
 
         if repo_name == defaults["main-repo"]:
             repo_conf["default"] = True
@@ -17,6 +17,7 @@ design) reduces regen time by over 40% compared to portage-2.1
 __all__ = (
     "request_ebuild_processor",
     "release_ebuild_processor",
+    "set_processor_limits",
     "EbuildProcessor",
     "UnhandledCommand",
     "expected_ebuild_env",
@@ -25,8 +26,10 @@ __all__ = (
 import contextlib
 import errno
 import os
+import select
 import signal
 import threading
+import time
 import traceback
 from functools import partial, wraps
 from itertools import chain
@@ -44,6 +47,10 @@ _global_ebp_lock = threading.Lock()
 inactive_ebp_list = []
 active_ebp_list = []
 
+# limits for inactive processors, see set_processor_limits()
+_max_inactive = None
+_idle_timeout = None
+
 
 def _singled_threaded(functor):
     """Decorator that forces method to run under single thread."""
@@ -82,31 +89,112 @@ def shutdown_all_processors():
 spawn.atexit_register(shutdown_all_processors)
 
 
+def _forget_inherited_processors():
+    """Drop processors inherited across a fork.
+
+    The ebd instances and their pipes belong to the parent process, so a forked
+    child must spawn its own instead of talking to (or killing) them.
+    """
+    global _global_ebp_lock
+    _global_ebp_lock = threading.Lock()
+    for ebp in chain(active_ebp_list, inactive_ebp_list):
+        ebp.pid = None
+    del active_ebp_list[:], inactive_ebp_list[:]
+
+
+os.register_at_fork(after_in_child=_forget_inherited_processors)
+
+
+def set_processor_limits(max_inactive=None, idle_timeout=None):
+    """Limit the processors kept around for reuse.
+
+    Limits are enforced whenever processors are requested or released, the
+    least recently used processors are shut down first.
+
+    :param max_inactive: maximum number of inactive processors, None for no limit
+    :param idle_timeout: seconds an inactive processor is kept, None for no limit
+    """
+    global _max_inactive, _idle_timeout
+    _max_inactive = max_inactive
+    _idle_timeout = idle_timeout
+    with _global_ebp_lock:
+        _evict_inactive_processors()
+
+
+def _evict_inactive_processors():
+    # inactive processors are ordered by release time
+    evict = []
+    if _idle_timeout is not None:
+        deadline = time.monotonic() - _idle_timeout
+        while inactive_ebp_list and inactive_ebp_list[0]._idle_since < deadline:
+            evict.append(inactive_ebp_list.pop(0))
+    if _max_inactive is not None:
+        while len(inactive_ebp_list) > _max_inactive:
+            evict.append(inactive_ebp_list.pop(0))
+    for ebp in evict:
+        # idle processors have nothing pending, don't wait on them
+        ebp.shutdown_processor(force=True)
+
+
+def _select_inactive_processor(userpriv, sandbox, pooled, eclasses):
+    """Pick the inactive processor with the most requested eclasses preloaded."""
+    best = None
+    best_score = -1
+    for ebp in inactive_ebp_list:
+        if (
+            ebp.userpriv == userpriv
+            and (ebp.sandbox or not sandbox)
+            and (pooled or not ebp.pooled)
+        ):
+            if not eclasses:
+                return ebp
+            preloaded = ebp._preloaded_eclasses
+            score = sum(1 for x in eclasses if x in preloaded)
+            if score > best_score:
+                best, best_score = ebp, score
+                if score == len(eclasses):
+                    break
+    return best
+
+
 @_singled_threaded
-def request_ebuild_processor(userpriv=False, sandbox=None, fd_pipes=None):
+def request_ebuild_processor(
+    userpriv=False, sandbox=None, fd_pipes=None, pooled=False, eclasses=None
+):
     """Request a processor instance, creating a new one if needed.
 
     :return: :obj:`EbuildProcessor`
     :param userpriv: should the processor be deprived to
         :obj:`pkgcore.os_data.portage_gid` and :obj:`pkgcore.os_data.portage_uid`?
     :param sandbox: should the processor be sandboxed?
+    :param pooled: allow borrowing a processor from the pool server set via
+        the ``PKGCORE_EBD_POOL`` environment variable, see
+        :mod:`pkgcore.ebuild.processor_pool`. Borrowed processors don't share
+        this process's stdout and stderr so only metadata sourcing uses them.
+    :param eclasses: eclasses expected to be inherited, the inactive processor
+        with the most of them preloaded is preferred
     """
 
     if sandbox is None:
         sandbox = spawn.is_sandbox_capable()
 
-    for ebp in inactive_ebp_list:
-        if ebp.userpriv == userpriv and (ebp.sandbox or not sandbox):
-            if not ebp.is_responsive:
-                inactive_ebp_list.remove(ebp)
-                continue
-            inactive_ebp_list.remove(ebp)
+    _evict_inactive_processors()
+    while (
+        ebp := _select_inactive_processor(userpriv, sandbox, pooled, eclasses)
+    ) is not None:
+        inactive_ebp_list.remove(ebp)
+        if ebp.is_responsive:
             active_ebp_list.append(ebp)
-            break
-    else:
-        ebp = EbuildProcessor(userpriv, sandbox, fd_pipes=fd_pipes)
-        active_ebp_list.append(ebp)
+            return ebp
 
+    pool_path = os.environ.get("PKGCORE_EBD_POOL")
+    if pooled and pool_path and fd_pipes is None:
+        from .processor_pool import borrow_processor
+
+        ebp = borrow_processor(pool_path, userpriv, sandbox)
+    if ebp is None:
+        ebp = EbuildProcessor(userpriv, sandbox, fd_pipes=fd_pipes)
+    active_ebp_list.append(ebp)
     return ebp
 
 
@@ -134,7 +222,9 @@ def release_ebuild_processor(ebp):
     if ebp.is_locked or ebp.custom_fds:
         ebp.shutdown_processor()
     else:
+        ebp._idle_since = time.monotonic()
         inactive_ebp_list.append(ebp)
+        _evict_inactive_processors()
     return True
 
 
@@ -315,6 +405,9 @@ class EbuildProcessor:
     Contains the env, functions, etc that ebuilds expect.
     """
 
+    # borrowed from a pool server, see :mod:`pkgcore.ebuild.processor_pool`
+    pooled = False
+
     def __init__(self, userpriv, sandbox, fd_pipes=None):
         """
         :param sandbox: enables a sandboxed processor
@@ -328,9 +421,12 @@ class EbuildProcessor:
         self.custom_fds = fd_pipes
 
         self._preloaded_eclasses = {}
+        # eclass mtimes at preload time, eclasses may be edited in place
+        self._preloaded_mtimes = {}
         self._eclass_caching = False
         self._outstanding_expects = []
         self._metadata_paths = None
+        self._idle_since = None
         self.pid = None
 
         spawn_opts = {"umask": 0o002}
@@ -463,6 +559,9 @@ class EbuildProcessor:
         :return: True for success, False for everything else
         """
 
+        if self._preloaded_eclasses:
+            # eclasses preloaded for metadata sourcing aren't used for builds
+            self._drop_preloaded_eclasses()
         self.write(f"process_ebuild {phase}")
         if not self.send_env(env, tmpdir=tmpdir):
             return False
@@ -505,8 +604,10 @@ class EbuildProcessor:
         self._outstanding_expects = []
         return ret
 
-    def _timeout_ebp(self, signum, frame):
-        raise TimeoutError("ebp for pid '%i' appears dead, timing out" % self.pid)
+    def _wait_for_data(self, timeout):
+        """Wait for the daemon to send data, raising TimeoutError if it doesn't."""
+        if not select.select([self.ebd_read], [], [], timeout)[0]:
+            raise TimeoutError("ebp for pid '%i' appears dead, timing out" % self.pid)
 
     def expect(self, want, async_req=False, flush=False, timeout=0):
         """Read from the daemon, check if the returned string is expected.
@@ -514,10 +615,6 @@ class EbuildProcessor:
         :param want: string we're expecting
         :return: boolean, was what was read == want?
         """
-        if timeout:
-            signal.signal(signal.SIGALRM, self._timeout_ebp)
-            signal.setitimer(signal.ITIMER_REAL, timeout)
-
         if async_req:
             self._outstanding_expects.append((flush, want))
             return True
@@ -525,13 +622,12 @@ class EbuildProcessor:
             self.ebd_write.flush()
         if not self._outstanding_expects:
             try:
+                if timeout:
+                    # select based so it works from any thread, unlike SIGALRM
+                    self._wait_for_data(timeout)
                 return want == self.read().rstrip("\n")
             except TimeoutError:
                 return False
-            finally:
-                if timeout:
-                    signal.setitimer(signal.ITIMER_REAL, 0)
-                    signal.signal(signal.SIGALRM, signal.SIG_DFL)
 
         self._outstanding_expects.append((flush, want))
         return self._consume_async_expects()
@@ -609,10 +705,11 @@ class EbuildProcessor:
     def clear_preloaded_eclasses(self):
         if self.is_responsive:
             self.write("clear_preloaded_eclasses")
-            if not self.expect("clear_preload_eclasses succeeded", flush=True):
+            if not self.expect("clear_preloaded_eclasses succeeded", flush=True):
                 self.shutdown_processor()
                 return False
         self._preloaded_eclasses.clear()
+        self._preloaded_mtimes.clear()
         return True
 
     def preload_eclasses(self, cache, async_req=False, limited_to=None):
@@ -630,19 +727,58 @@ class EbuildProcessor:
             i = ((eclass, ec[eclass]) for eclass in limited_to)
         else:
             i = cache.eclasses.items()
+        preloaded, mtimes = self._preloaded_eclasses, self._preloaded_mtimes
         for eclass, data in i:
-            if data.path != self._preloaded_eclasses.get(eclass):
+            modified = data.mtime != mtimes.get(eclass, data.mtime)
+            if modified or data.path != preloaded.get(eclass):
                 if self._preload_eclass(data.path, async_req=True):
-                    self._preloaded_eclasses[eclass] = data.path
+                    preloaded[eclass] = data.path
+                    mtimes[eclass] = data.mtime
         if not async_req:
             return self._consume_async_expects()
         return True
 
+    def _drop_preloaded_eclasses(self):
+        """Clear preloaded eclasses without waiting for the daemon to confirm."""
+        self.write("clear_preloaded_eclasses")
+        self.expect("clear_preloaded_eclasses succeeded", async_req=True)
+        self._preloaded_eclasses.clear()
+        self._preloaded_mtimes.clear()
+
+    def _verify_preloaded_eclasses(self, cache):
+        """Drop preloaded eclasses that don't match an eclass cache's view.
+
+        Processors are reused across repos (or borrowed from a pool server) so
+        a preloaded eclass may differ from the one an inherit would resolve to.
+        """
+        ec = cache.eclasses
+        mtimes = self._preloaded_mtimes
+        valid = {}
+        for eclass, path in self._preloaded_eclasses.items():
+            data = ec.get(eclass)
+            if (
+                data is not None
+                and data.path == path
+                and data.mtime == mtimes.get(eclass, data.mtime)
+            ):
+                valid[eclass] = path
+        if len(valid) != len(self._preloaded_eclasses):
+            # bash can only drop all preloaded eclasses at once
+            self._drop_preloaded_eclasses()
+            if valid:
+                self.preload_eclasses(cache, async_req=True, limited_to=valid)
+
     def allow_eclass_caching(self):
         self._eclass_caching = True
 
-    def disable_eclass_caching(self):
-        self.clear_preloaded_eclasses()
+    def disable_eclass_caching(self, clear=True):
+        """Stop preloading inherited eclasses.
+
+        :param clear: drop the eclasses already preloaded, otherwise they're
+            kept for reuse by later metadata requests
+        """
+        if clear:
+            self.clear_preloaded_eclasses()
         self._eclass_caching = False
 
     def _preload_eclass(self, ec_file, async_req=False):
@@ -820,14 +956,31 @@ class EbuildProcessor:
     def _run_depend_like_phase(
         self, command, package_inst, eclass_cache, env=None, extra_commands={}
     ):
-        # ebuild is not allowed to run any external programs during
-        # depend phases; use /dev/null since "" == "."
-        self._ensure_metadata_paths(("/dev/null",))
+        request = self._depend_like_request(command, package_inst, env=env)
+        self._send_depend_like_request(request, eclass_cache)
+        self._receive_depend_like_results(eclass_cache, extra_commands)
+
+    def _depend_like_request(self, command, package_inst, env=None, seq=None):
+        """Serialize a depend-like phase request for sending later on.
 
+        :param seq: optional sequence tag, echoed back by the daemon in the
+            request's final reply
+        """
         env = expected_ebuild_env(package_inst, env, depends=True)
         data = self._generate_env_str(env)
-        self.write(f"{command} {len(data)}\n{data}", append_newline=False)
+        if seq is not None:
+            command = f"{command} seq={seq}"
+        return f"{command} {len(data)}\n{data}"
+
+    def _send_depend_like_request(self, request, eclass_cache):
+        # ebuild is not allowed to run any external programs during
+        # depend phases; use /dev/null since "" == "."
+        self._ensure_metadata_paths(("/dev/null",))
+        if self._preloaded_eclasses:
+            self._verify_preloaded_eclasses(eclass_cache)
+        self.write(request, append_newline=False)
 
+    def _receive_depend_like_results(self, eclass_cache, extra_commands):
         updates = None
         if self._eclass_caching:
             updates = set()
@@ -887,28 +1040,91 @@ class EbuildProcessor:
         :return: dict when successful, None when failed
         """
         metadata_keys = {}
+        self._run_depend_like_phase(
+            "gen_metadata",
+            package_inst,
+            eclass_cache,
+            env=self._metadata_env(package_inst),
+            extra_commands={"key": partial(_receive_key, metadata_keys)},
+        )
+        return metadata_keys
 
-        def receive_key(self, line):
-            line = line.split("=", 1)
-            if len(line) != 2:
-                raise FinishedProcessing(True)
-            metadata_keys[line[0]] = line[1]
-
+    @staticmethod
+    def _metadata_env(package_inst):
         # pass down phase and metadata key lists to avoid hardcoding them on the bash side
-        env = {
+        return {
             "PKGCORE_EBUILD_PHASES": tuple(package_inst.eapi.phases.values()),
             "PKGCORE_METADATA_KEYS": tuple(package_inst.eapi.metadata_keys),
         }
 
-        self._run_depend_like_phase(
-            "gen_metadata",
-            package_inst,
-            eclass_cache,
-            env=env,
-            extra_commands={"key": receive_key},
-        )
+    def get_keys_pipelined(self, queue, eclass_cache):
+        """Regenerate metadata for a queue of ebuilds.
 
-        return metadata_keys
+        The daemon sources one ebuild at a time since it reads inherit replies
+        from the same pipe as its requests, but the next request is
+        serialized while the current ebuild is being sourced and sent as soon
+        as its results are in; results are yielded while the daemon works on
+        the following ebuild. Requests are tagged with sequence numbers that
+        are verified against the daemon's replies.
+
+        :param queue: :obj:`collections.deque` of
+            :obj:`pkgcore.ebuild.ebuild_src.package` instances, packages are
+            removed as their requests are sent so the ones left over when the
+            processor dies can be resubmitted elsewhere
+        :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache` instance to use
+            for eclass access
+        :return: iterator of (package, metadata) tuples, metadata being a
+            :obj:`ProcessorError` instance when sourcing failed
+        """
+        if not queue:
+            return
+        seq = 0
+        pkg = queue.popleft()
+        self._send_depend_like_request(self._metadata_request(pkg, seq), eclass_cache)
+        pending = True
+        try:
+            while pending:
+                next_pkg = request = None
+                if queue:
+                    next_pkg = queue[0]
+                    request = self._metadata_request(next_pkg, seq + 1)
+                metadata_keys = {}
+                commands = {
+                    "key": partial(_receive_key, metadata_keys),
+                    "phases": partial(_receive_tagged_phases, seq),
+                }
+                pending = False
+                try:
+                    self._receive_depend_like_results(eclass_cache, commands)
+                except ProcessorError as e:
+                    if not self.pid:
+                        # processor died, leave the rest queued
+                        yield pkg, e
+                        return
+                    metadata_keys = e
+                if request is not None:
+                    self._send_depend_like_request(request, eclass_cache)
+                    queue.popleft()
+                    pending = True
+                yield pkg, metadata_keys
+                if pending:
+                    pkg = next_pkg
+                    seq += 1
+        finally:
+            if pending and self.pid:
+                # consumer bailed out early, drain the request in flight
+                self._receive_depend_like_results(
+                    eclass_cache,
+                    {
+                        "key": partial(_receive_key, {}),
+                        "phases": partial(_receive_tagged_phases, seq + 1),
+                    },
+                )
+
+    def _metadata_request(self, package_inst, seq):
+        return self._depend_like_request(
+            "gen_metadata", package_inst, env=self._metadata_env(package_inst), seq=seq
+        )
 
     # this basically handles all hijacks from the daemon, whether
     # confcache or portageq.
@@ -981,6 +1197,22 @@ class EbuildProcessor:
             self.unlock()
 
 
+def _receive_key(metadata_keys, ebp, line):
+    """Callback collecting metadata keys sent by the daemon."""
+    line = line.split("=", 1)
+    if len(line) != 2:
+        raise FinishedProcessing(True)
+    metadata_keys[line[0]] = line[1]
+
+
+def _receive_tagged_phases(seq, ebp, line):
+    """Callback verifying the final reply to a request tagged with a sequence number."""
+    tag, _, line = line.partition(" ")
+    if tag != f"seq={seq}":
+        raise InternalError(line, f"expected reply to request seq={seq}, got {tag!r}")
+    chuck_StoppingCommand(ebp, line)
+
+
 def inherit_handler(ecache, ebp, line=None, updates=None):
     """Callback for implementing inherit digging into eclass_cache.
 
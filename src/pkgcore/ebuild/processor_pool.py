@@ -0,0 +1,355 @@
+"""
+long lived pool of ebuild processors shared across pkgcore invocations
+
+A :class:`PoolServer` keeps a number of :obj:`EbuildProcessor` instances
+running with eclasses already preloaded and lends them out over a unix socket,
+passing along the file descriptors of their control pipes. Clients opt in by
+pointing the ``PKGCORE_EBD_POOL`` environment variable at the socket; metadata
+generation in short lived commands then skips spawning bash and preloading
+eclasses.
+
+Only processors requested for metadata sourcing are borrowed. Their stdout and
+stderr are bound to the pool server at spawn time so phases with custom file
+descriptors or visible output keep using locally spawned processors.
+"""
+
+__all__ = ("PoolServer", "LentProcessor", "borrow_processor", "default_socket_path")
+
+import json
+import os
+import selectors
+import socket
+
+from snakeoil.osutils import pjoin
+from snakeoil.process import spawn
+
+from .. import const
+from ..log import logger
+from . import const as e_const
+from .processor import EbuildProcessor
+
+# maximum size of a single protocol message
+_MSG_SIZE = 1 << 20
+
+
+def default_socket_path():
+    """Return the default location of the pool server socket."""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", const.USER_CACHE_PATH)
+    return pjoin(runtime_dir, "pkgcore-ebd-pool.sock")
+
+
+def _processor_state(ebp):
+    return {
+        "preloaded": ebp._preloaded_eclasses,
+        "metadata_paths": ebp._metadata_paths,
+    }
+
+
+class LentProcessor(EbuildProcessor):
+    """Client side of a processor borrowed from a :class:`PoolServer`.
+
+    The bash process belongs to the pool server, shutting the processor down
+    hands it back instead of terminating it.
+    """
+
+    pooled = True
+
+    def __init__(self, conn, info, fds):
+        self.lock()
+        self.ebd = e_const.EBUILD_DAEMON_PATH
+        self.sandbox = info["sandbox"]
+        self.userpriv = info["userpriv"]
+        self.custom_fds = None
+        self.pid = info["pid"]
+
+        self._conn = conn
+        self._preloaded_eclasses = dict(info["preloaded"])
+        # the server refreshes modified eclasses before lending processors
+        self._preloaded_mtimes = {}
+        self._eclass_caching = False
+        self._outstanding_expects = []
+        metadata_paths = info["metadata_paths"]
+        if metadata_paths is not None:
+            metadata_paths = tuple(metadata_paths)
+        self._metadata_paths = metadata_paths
+        self._idle_since = None
+        self._readonly_vars = frozenset(info["readonly_vars"])
+        # attribute is name mangled by the parent class
+        self._EbuildProcessor__sandbox_log = info["sandbox_log"]
+
+        self.ebd_read = os.fdopen(fds[0], "r")
+        self.ebd_write = os.fdopen(fds[1], "w")
+        self.unlock()
+
+    def disable_eclass_caching(self, clear=True):
+        # preloaded eclasses are verified against the eclass cache on use so
+        # they're kept for the next borrower
+        self._eclass_caching = False
+
+    @property
+    def is_alive(self):
+        """Return whether the processor is alive."""
+        # the pool server is the parent of the bash process, it can't be reaped here
+        current_pid = self.pid
+        if current_pid:
+            try:
+                os.kill(current_pid, 0)
+                return True
+            except ProcessLookupError:
+                self.pid = False
+            except PermissionError:
+                return True
+        return False
+
+    def shutdown_processor(self, force=False, ignore_keyboard_interrupt=False):
+        """Hand the processor back to the pool server."""
+        if self.pid is None:
+            return
+        try:
+            # without a state update the server discards the processor
+            if not force and self.is_responsive:
+                self._conn.send(json.dumps(_processor_state(self)).encode())
+        except (EnvironmentError, ValueError):
+            pass
+        finally:
+            self._conn.close()
+            for f in (self.ebd_write, self.ebd_read):
+                try:
+                    f.close()
+                except EnvironmentError:
+                    pass
+            self.pid = None
+
+
+def borrow_processor(path, userpriv, sandbox, timeout=10):
+    """Borrow a processor from the pool server listening at a given path.
+
+    :return: :obj:`LentProcessor` instance or None if the server couldn't
+        supply one
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    try:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        conn.send(json.dumps({"userpriv": userpriv, "sandbox": sandbox}).encode())
+        msg, fds, _flags, _addr = socket.recv_fds(conn, _MSG_SIZE, 2)
+        info = json.loads(msg)
+        if len(fds) != 2:
+            for fd in fds:
+                os.close(fd)
+            logger.debug(
+                "ebd pool %r failed lending a processor: %s", path, info.get("error")
+            )
+            conn.close()
+            return None
+    except (EnvironmentError, ValueError) as e:
+        logger.debug("ebd pool %r unavailable: %s", path, e)
+        conn.close()
+        return None
+    conn.settimeout(None)
+    return LentProcessor(conn, info, fds)
+
+
+class PoolServer:
+    """Serve preloaded ebuild processors over a unix socket.
+
+    :param path: socket location
+    :param eclass_cache: :obj:`pkgcore.ebuild.eclass_cache.base` instance whose
+        eclasses are preloaded into each processor
+    :param size: maximum number of processors, lent or idle
+    """
+
+    def __init__(self, path, eclass_cache=None, size=None):
+        self.path = path
+        self.eclass_cache = eclass_cache
+        self.size = max(size or os.cpu_count() or 1, 1)
+        self._idle = []
+        self._lent = {}
+        # eclass file mtimes as preloaded by each processor
+        self._preload_mtimes = {}
+        # accepted connections that haven't sent their request yet
+        self._pending = set()
+        self._selector = None
+
+    def _spawn(self, userpriv=False, sandbox=None):
+        if sandbox is None:
+            sandbox = spawn.is_sandbox_capable()
+        ebp = EbuildProcessor(userpriv, sandbox)
+        self._preload_mtimes[ebp] = {}
+        if not self._refresh(ebp):
+            self._discard(ebp)
+            raise OSError(f"failed preloading eclasses for ebd pid {ebp.pid}")
+        return ebp
+
+    def _discard(self, ebp, force=True):
+        self._preload_mtimes.pop(ebp, None)
+        ebp.shutdown_processor(force=force)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self, ebp):
+        """Verify a processor is usable and its preloaded eclasses are current."""
+        if not ebp.is_responsive:
+            return False
+        mtimes = self._preload_mtimes[ebp]
+        preloaded = ebp._preloaded_eclasses
+        if any(mtimes.get(path) != self._mtime(path) for path in preloaded.values()):
+            # bash can't drop single eclasses, start from scratch
+            if not ebp.clear_preloaded_eclasses():
+                return False
+            mtimes.clear()
+        if self.eclass_cache is not None:
+            if not ebp.preload_eclasses(self.eclass_cache):
+                return False
+        for path in preloaded.values():
+            if path not in mtimes:
+                mtimes[path] = self._mtime(path)
+        return True
+
+    def _get_processor(self, userpriv, sandbox):
+        for ebp in self._idle:
+            if ebp.userpriv == userpriv and (ebp.sandbox or not sandbox):
+                self._idle.remove(ebp)
+                if self._refresh(ebp):
+                    return ebp
+                self._discard(ebp)
+                break
+        if len(self._idle) + len(self._lent) >= self.size:
+            if not self._idle:
+                return None
+            # make room by dropping the least recently used mismatched processor
+            self._discard(self._idle.pop(0), force=False)
+        return self._spawn(userpriv, sandbox)
+
+    def _lend(self, conn, ebp):
+        info = _processor_state(ebp)
+        info.update(
+            pid=ebp.pid,
+            userpriv=ebp.userpriv,
+            sandbox=ebp.sandbox,
+            sandbox_log=getattr(ebp, "_EbuildProcessor__sandbox_log", None),
+            readonly_vars=sorted(ebp._readonly_vars),
+        )
+        fds = [ebp.ebd_read.fileno(), ebp.ebd_write.fileno()]
+        socket.send_fds(conn, [json.dumps(info).encode()], fds)
+        self._lent[conn] = ebp
+        self._selector.register(conn, selectors.EVENT_READ, self._reclaim)
+
+    @staticmethod
+    def _reply_error(conn, error):
+        try:
+            conn.send(json.dumps({"error": error}).encode())
+        except EnvironmentError:
+            pass
+        conn.close()
+
+    def _accept(self, sock):
+        conn, _addr = sock.accept()
+        conn.settimeout(10)
+        # requests are read once they arrive, stalled clients can't hold up others
+        self._pending.add(conn)
+        self._selector.register(conn, selectors.EVENT_READ, self._request)
+
+    def _request(self, conn):
+        self._pending.discard(conn)
+        self._selector.unregister(conn)
+        try:
+            request = json.loads(conn.recv(_MSG_SIZE))
+            ebp = self._get_processor(
+                bool(request.get("userpriv")), request.get("sandbox")
+            )
+        except (EnvironmentError, ValueError) as e:
+            logger.error("failed supplying ebd: %s", e)
+            self._reply_error(conn, str(e))
+            return
+        if ebp is None:
+            # clients fall back to spawning their own instead of queueing
+            self._reply_error(conn, "all processors in use")
+            return
+        try:
+            self._lend(conn, ebp)
+        except EnvironmentError:
+            conn.close()
+            self._idle.append(ebp)
+
+    def _reclaim(self, conn):
+        ebp = self._lent.pop(conn)
+        self._selector.unregister(conn)
+        try:
+            state = json.loads(conn.recv(_MSG_SIZE))
+        except (EnvironmentError, ValueError):
+            # client exited or dropped the processor mid-command
+            state = None
+        conn.close()
+        if state is None:
+            self._discard(ebp)
+        else:
+            ebp._preloaded_eclasses = state["preloaded"]
+            # eclass freshness is tracked by the server via _refresh()
+            ebp._preloaded_mtimes = {}
+            metadata_paths = state["metadata_paths"]
+            if metadata_paths is not None:
+                metadata_paths = tuple(metadata_paths)
+            ebp._metadata_paths = metadata_paths
+            self._idle.append(ebp)
+
+    def _bind(self):
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as probe:
+                try:
+                    probe.connect(self.path)
+                except ConnectionRefusedError:
+                    # stale socket from a server that didn't shut down cleanly
+                    os.unlink(self.path)
+                else:
+                    raise OSError(f"ebd pool already running at {self.path!r}")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        # processors run as the server's user, don't lend them to others
+        old_umask = os.umask(0o077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen()
+        return sock
+
+    def serve(self, ready=None):
+        """Serve processors until interrupted.
+
+        :param ready: optional callable invoked once the socket is listening
+        """
+        sock = self._bind()
+        self._selector = selectors.DefaultSelector()
+        try:
+            while len(self._idle) < self.size:
+                self._idle.append(self._spawn())
+            self._selector.register(sock, selectors.EVENT_READ, self._accept)
+            if ready is not None:
+                ready()
+            while True:
+                for key, _events in self._selector.select():
+                    key.data(key.fileobj)
+        finally:
+            self._selector.close()
+            sock.close()
+            for conn in self._pending:
+                conn.close()
+            self._pending.clear()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            while self._idle:
+                self._discard(self._idle.pop(), force=False)
+            # borrowed processors exit once their borrower closes the pipes
+            for conn, ebp in self._lent.items():
+                conn.close()
+                ebp.ebd_write.close()
+                ebp.ebd_read.close()
+                ebp.pid = None
+            self._lent.clear()
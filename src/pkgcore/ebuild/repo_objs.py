@@ -747,7 +747,7 @@ class RepoConfig(syncable.tree, klass.ImmutableInstance, metaclass=WeakInstMeta)
         "profile-bashrcs",
         "profile-set",
     )
-    supported_cache_formats = ("md5-dict", "pms")
+    supported_cache_formats = ("md5-pack", "md5-dict", "pms")
 
     __inst_caching__ = True
 
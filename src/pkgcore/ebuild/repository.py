@@ -6,8 +6,11 @@ __all__ = ("UnconfiguredTree", "ConfiguredTree", "ProvidesRepo", "tree")
 
 import locale
 import os
+import re
+from contextlib import contextmanager
 from functools import partial, wraps
-from itertools import chain, filterfalse
+from itertools import chain, filterfalse, groupby, product
+from operator import attrgetter
 from random import shuffle
 from sys import intern
 from weakref import WeakValueDictionary
@@ -16,6 +19,7 @@ from snakeoil import chksum, klass
 from snakeoil.bash import read_dict
 from snakeoil.containers import InvertedContains
 from snakeoil.data_source import local_source
+from snakeoil.demandload import demand_compile_regexp
 from snakeoil.fileutils import readlines_utf8
 from snakeoil.mappings import ImmutableDict
 from snakeoil.obj import make_kls
@@ -24,6 +28,7 @@ from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism
 
 from .. import fetch
+from ..cache import errors as cache_errors
 from ..config.hint import ConfigHint, configurable
 from ..log import logger
 from ..operations import OperationError
@@ -40,6 +45,8 @@ from . import processor, repo_objs, restricts
 from .atom import atom
 from .eapi import get_eapi
 
+demand_compile_regexp("_inherit_regex", r"^[\t ]*inherit[\t ]+([^\n#;&|]+)", re.M)
+
 
 class repo_operations(_repo_ops.operations):
     def _cmd_implementation_manifest(
@@ -285,6 +292,7 @@ class UnconfiguredTree(prototype.tree):
     configured = False
     configurables = ("domain", "settings")
     package_factory = staticmethod(ebuild_src.generate_new_factory)
+    indexed_attrs = frozenset(["inherit", "inherited", "keywords", "license"])
     enable_gpg = False
     extension = ".ebuild"
 
@@ -526,10 +534,14 @@ class UnconfiguredTree(prototype.tree):
             return categories
         return self.category_dirs
 
+    @klass.jit_attr
+    def _layout_index(self):
+        return prototype.LayoutIndex(self.location, owner=self)
+
     def _get_packages(self, category):
         cpath = pjoin(self.base, category.lstrip(os.path.sep))
         try:
-            return tuple(listdir_dirs(cpath))
+            return self._layout_index.listing(category, cpath, listdir_dirs)
         except FileNotFoundError:
             if category in self.categories:
                 # ignore it, since it's PMS mandated that it be allowed.
@@ -550,12 +562,16 @@ class UnconfiguredTree(prototype.tree):
         lp = len(pkg)
         extension = self.extension
         ext_len = -len(extension)
-        try:
-            return tuple(
+
+        def versions(path):
+            return (
                 x[lp:ext_len]
-                for x in listdir_files(cppath)
+                for x in listdir_files(path)
                 if x[ext_len:] == extension and x[:lp] == pkg
             )
+
+        try:
+            return self._layout_index.listing("/".join(catpkg), cppath, versions)
         except EnvironmentError as e:
             raise KeyError(
                 "failed fetching versions for package %s: %s"
@@ -575,11 +591,9 @@ class UnconfiguredTree(prototype.tree):
 
             if raw:
                 yield pkg
-            elif (
-                self._bad_masked.has_match(pkg.versioned_atom)
-                and error_callback is not None
-            ):
-                error_callback(self._bad_masked[pkg.versioned_atom])
+            elif self._bad_masked.has_match(pkg.versioned_atom):
+                if error_callback is not None:
+                    error_callback(self._bad_masked[pkg.versioned_atom])
             else:
                 # check pkgs for unsupported/invalid EAPIs and bad metadata
                 try:
@@ -694,6 +708,105 @@ class UnconfiguredTree(prototype.tree):
             stabilization_groups[group_name] = frozenset(pkgs)
         return ImmutableDict(stabilization_groups)
 
+    def stale_metadata(self, pkgs=None):
+        """Return the cpvs of packages requiring metadata regen.
+
+        :param pkgs: packages to check, defaults to all packages in the repo
+        """
+        if pkgs is None:
+            pkgs = self.itermatch(packages.AlwaysTrue, pkg_filter=None)
+        return self.package_class.stale_metadata(pkgs)
+
+    @klass.jit_attr_named("_jit_reset_metadata_index", uncached_val=None)
+    def _metadata_index(self):
+        """Secondary indexes of cached metadata used to narrow queries.
+
+        Maps indexed package attributes to their values and the cpvs having
+        them, packages lacking valid cache entries are tracked separately and
+        always considered candidates. Dropped by :meth:`_reset_metadata_index`
+        when cache entries are written.
+        """
+        valid, unindexed = self.package_class.validated_caches(
+            self.itermatch(packages.AlwaysTrue, pkg_filter=None)
+        )
+        indexes = {attr: {} for attr in self.indexed_attrs}
+        for cpvstr, cache in valid.items():
+            try:
+                data = cache._getitem(cpvstr)
+            except (KeyError, cache_errors.CacheError):
+                unindexed.add(cpvstr)
+                continue
+            license = data.get("LICENSE", "").split()
+            attrs = {
+                "inherit": data.get("INHERIT", "").split(),
+                "inherited": cache._eclass_names(data.get("_eclasses_", "")),
+                "keywords": data.get("KEYWORDS", "").split(),
+                "license": (
+                    x for x in license if x not in ("(", ")", "||") and x[-1] != "?"
+                ),
+            }
+            for attr, vals in attrs.items():
+                index = indexes[attr]
+                for val in vals:
+                    index.setdefault(val, set()).add(cpvstr)
+        return {attr: (index, unindexed) for attr, index in indexes.items()}
+
+    def _reset_metadata_index(self):
+        """Drop the secondary indexes, they're rebuilt when next used."""
+        self._jit_reset_metadata_index = None
+
+    def _attr_index(self, attr):
+        if attr not in self.indexed_attrs or all(x is None for x in self.cache):
+            return None
+        return self._metadata_index[attr]
+
+    def changed_metadata(self, paths):
+        """Determine the packages affected by changes to the given repo files.
+
+        Ebuild changes affect their own packages while eclass changes affect
+        every package whose cache entries record inheriting them.
+
+        :param paths: iterable of paths relative to the repo root, eclasses of
+            the repo's masters are passed by absolute path
+        :return: (pkgs, removed) tuple of packages requiring regen and cpv
+            strings of removed packages, or None if the changes could affect
+            any package
+        """
+        cpvs = set()
+        eclasses = set()
+        ext_len = len(self.extension)
+        master_eclass_dirs = {pjoin(x.location, "eclass") for x in self.masters}
+        for path in paths:
+            chunks = path.split("/")
+            if os.path.isabs(path):
+                dirname, filename = os.path.split(path)
+                if dirname in master_eclass_dirs and filename.endswith(".eclass"):
+                    eclasses.add(filename[: -len(".eclass")])
+            elif path == "metadata/layout.conf":
+                # masters or eclass overrides may have changed
+                return None
+            elif len(chunks) == 2 and chunks[0] == "eclass":
+                if chunks[1].endswith(".eclass"):
+                    eclasses.add(chunks[1][: -len(".eclass")])
+            elif len(chunks) == 3 and chunks[2].endswith(self.extension):
+                if chunks[2].startswith(f"{chunks[1]}-"):
+                    cpvs.add(f"{chunks[0]}/{chunks[2][:-ext_len]}")
+
+        for cache in self.cache:
+            cpvs.update(cache.eclass_consumers(eclasses))
+
+        pkgs, removed = [], set()
+        for cpvstr in sorted(cpvs):
+            try:
+                pkg = cpv.VersionedCPV(cpvstr)
+            except ebuild_errors.InvalidCPV:
+                continue
+            if pkg.fullver in self.versions.get((pkg.category, pkg.package), ()):
+                pkgs.append(self.package_class(pkg.category, pkg.package, pkg.fullver))
+            else:
+                removed.add(cpvstr)
+        return pkgs, removed
+
     def _regen_operation_helper(self, **kwds):
         return _RegenOpHelper(
             self,
@@ -787,29 +900,121 @@ def tree(
 
 
 class _RegenOpHelper:
+    """Regenerate package metadata, sourcing each ebuild in the processor best suited for it.
+
+    Processors are requested per package so that packages get routed to
+    whichever inactive processor already has most of their eclasses preloaded.
+    """
+
     def __init__(self, repo, force=False, eclass_caching=True):
         self.force = force
         self.eclass_caching = eclass_caching
-        self.ebp = self.request_ebp()
 
-    def request_ebp(self):
-        ebp = processor.request_ebuild_processor()
+    @staticmethod
+    def _inherits(pkg):
+        """Return the eclasses an ebuild inherits directly, used as a routing hint."""
+        try:
+            with open(pkg.path) as f:
+                data = f.read()
+        except (UnicodeDecodeError, OSError):
+            return frozenset()
+        return frozenset(
+            chain.from_iterable(x.split() for x in _inherit_regex.findall(data))
+        )
+
+    @contextmanager
+    def _processor(self, pkg=None):
+        eclasses = None
+        if pkg is not None and self.eclass_caching:
+            eclasses = self._inherits(pkg)
+        ebp = processor.request_ebuild_processor(pooled=True, eclasses=eclasses)
         if self.eclass_caching:
             ebp.allow_eclass_caching()
-        return ebp
+        try:
+            yield ebp
+        finally:
+            if self.eclass_caching:
+                # keep the preloaded eclasses around for routing later requests
+                ebp.disable_eclass_caching(clear=False)
+            # dead processors were already dropped
+            processor.release_ebuild_processor(ebp)
 
     def __call__(self, pkg):
-        try:
-            return pkg._fetch_metadata(ebp=self.ebp, force_regen=self.force)
-        except pkg_errors.MetadataException as e:
-            # ebuild processor is dead, so force a replacement request
-            self.ebp = self.request_ebp()
-            raise
+        factory = pkg._parent
+        if not self.force:
+            data = factory._get_cached_metadata(pkg)
+            if data is not None:
+                return data
+        with self._processor(pkg) as ebp:
+            return factory._update_metadata(pkg, ebp=ebp)
 
-    def __del__(self):
-        if self.eclass_caching:
-            self.ebp.disable_eclass_caching()
-        processor.release_ebuild_processor(self.ebp)
+    def generate(self, pkg):
+        """Regenerate metadata for a package without writing it to the cache.
+
+        Used by process based regen where workers hand entries back to the
+        parent for storage via :meth:`store`.
+
+        :return: metadata mapping if the package required regen, otherwise None
+        """
+        factory = pkg._parent
+        if (
+            not self.force
+            and factory._get_cached_metadata(pkg, purge=False) is not None
+        ):
+            return None
+        with self._processor(pkg) as ebp:
+            data = factory._update_metadata(pkg, ebp=ebp, store=False)
+        return self._prepare_entry(factory, data)
+
+    def generate_pipelined(self, pkgs):
+        """Regenerate metadata for multiple packages without writing it to the cache.
+
+        Like :meth:`generate`, but stale packages are pipelined through a
+        single processor instead of requesting one per package.
+
+        :return: iterator of (pkg, metadata) tuples, metadata being None if
+            the package didn't require regen or an exception if regen failed
+        """
+        stale = []
+        for pkg in pkgs:
+            if (
+                not self.force
+                and pkg._parent._get_cached_metadata(pkg, purge=False) is not None
+            ):
+                yield pkg, None
+            else:
+                stale.append(pkg)
+        for factory, group in groupby(stale, attrgetter("_parent")):
+            with self._processor() as ebp:
+                for pkg, data in factory._update_metadata_pipelined(
+                    group, ebp=ebp, store=False
+                ):
+                    if not isinstance(data, Exception):
+                        data = self._prepare_entry(factory, data)
+                    yield pkg, data
+
+    @staticmethod
+    def _prepare_entry(factory, data):
+        if (ebuild_hash := data.get("_chf_")) is None:
+            # unsupported EAPI, nothing gets cached
+            return None
+        # hash the ebuild and eclasses here instead of in the process storing the entry
+        eclasses = data.get("_eclasses_", {}).values()
+        for cache in factory._cache:
+            getattr(ebuild_hash, cache.chf_type, None)
+            for eclass, chf in product(eclasses, cache.eclass_chf_types):
+                getattr(eclass, chf, None)
+        return data
+
+    @staticmethod
+    def store(pkg, data):
+        """Write metadata returned by :meth:`generate` to the package's cache."""
+        pkg._parent._store_metadata(pkg, data)
+
+    @staticmethod
+    def finish():
+        """Shut down the processors of a regen worker process that's exiting."""
+        processor.shutdown_all_processors()
 
 
 class ConfiguredTree(configured.tree):
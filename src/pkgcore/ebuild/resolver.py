@@ -8,7 +8,7 @@ from functools import partial
 from itertools import chain
 
 from ..repository import misc, multiplex
-from ..resolver import plan
+from ..resolver import plan, sat
 from ..restrictions import packages, values
 from .atom import atom
 
@@ -151,6 +151,10 @@ class empty_tree_merge_plan(plan.merge_plan):
         )
 
 
+class empty_tree_sat_merge_plan(sat.sat_merge_plan, empty_tree_merge_plan):
+    """:obj:`empty_tree_merge_plan` using the SAT based resolver."""
+
+
 def generate_replace_resolver_kls(resolver_kls):
     class replace_resolver(resolver_kls):
         overriding_resolver_kls = resolver_kls
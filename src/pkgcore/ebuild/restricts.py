@@ -16,6 +16,7 @@ __all__ = (
     "VersionMatch",
 )
 
+from snakeoil.compatibility import cmp
 from snakeoil.klass import generic_equality
 
 from ..restrictions import packages, restriction, values
@@ -32,7 +33,7 @@ class _VersionMatch(restriction.base, metaclass=generic_equality):
     self.vals, see intersect for reason why. vals also must be a tuple.
     """
 
-    __slots__ = ("ver", "rev", "vals", "droprev", "negate")
+    __slots__ = ("ver", "rev", "vals", "droprev", "negate", "_key")
 
     __attr_comparison__ = ("negate", "rev", "droprev", "vals")
 
@@ -80,17 +81,24 @@ class _VersionMatch(restriction.base, metaclass=generic_equality):
         else:
             sf(self, "droprev", False)
             sf(self, "vals", self._convert_str2op[operator])
-
-    def match(self, pkg, *args, **kwargs):
-        if self.droprev:
-            r1, r2 = None, None
+        if ver is not None:
+            # revisions are compared separately when dropped
+            sf(self, "_key", cpv.ver_key(ver, None if self.droprev else rev))
         else:
-            r1, r2 = self.rev, pkg.revision
+            sf(self, "_key", None)
 
+    def match(self, pkg, *args, **kwargs):
         if pkg.version is None:
             return False
 
-        return (cpv.ver_cmp(pkg.version, r2, self.ver, r1) in self.vals) != self.negate
+        try:
+            key = pkg.version_key
+        except AttributeError:
+            key = cpv.ver_key(pkg.version, pkg.revision)
+        if self.droprev:
+            key = key[:-1]
+            return (cmp(key, self._key[:-1]) in self.vals) != self.negate
+        return (cmp(key, self._key) in self.vals) != self.negate
 
     def __str__(self):
         s = self._convert_op2str[self.vals]
@@ -153,6 +161,9 @@ class VersionMatch(packages.PackageRestriction):
     def match(self, pkg, *args, **kwds):
         return self.restriction.match(pkg)
 
+    def _compile(self):
+        return self.restriction.compile()
+
 
 class SlotDep(packages.PackageRestriction):
     __slots__ = ()
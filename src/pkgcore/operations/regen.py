@@ -1,8 +1,24 @@
+import json
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from multiprocessing.util import Finalize
+from urllib.parse import quote
+
 from snakeoil.compatibility import IGNORED_EXCEPTIONS
+from snakeoil.fileutils import AtomicWriteFile
+from snakeoil.osutils import ensure_dirs, pjoin
 
+from .. import const
+from ..log import logger
 from ..package.errors import MetadataException
 from ..util.thread_pool import map_async
 
+# per worker process state for process based regen, set by _regen_process_init()
+_regen_process_state = None
+
 
 def regen_iter(iterable, regen_func, observer):
     for pkg in iterable:
@@ -12,15 +28,134 @@ def regen_iter(iterable, regen_func, observer):
             if isinstance(e, KeyboardInterrupt):
                 return
             raise
-        except MetadataException:
-            # handled at a higher level by scanning for metadata masked pkgs
-            # after regen has completed
-            pass
         except Exception as e:
             yield pkg, e
 
 
-def regen_repository(repo, pkgs, observer, threads=1, pkg_attr="keywords", **kwargs):
+def _regen_process_init(repo, pkgs, kwargs):
+    """Set up a worker process with its own regen helper."""
+    global _regen_process_state
+    helper = repo._regen_operation_helper(**kwargs)
+    if hasattr(helper, "finish"):
+        # pool workers exit without running atexit handlers
+        Finalize(None, helper.finish, exitpriority=10)
+    _regen_process_state = (pkgs, helper)
+
+
+def _regen_process_pkg(pkg, generate):
+    """Regenerate a package via a given helper method.
+
+    :return: (metadata, exception) tuple, metadata is None if the cache entry
+        was valid or regen failed; metadata failures are passed as a tuple of
+        :obj:`MetadataException` arguments
+    """
+    try:
+        return _regen_process_result(generate(pkg))
+    except IGNORED_EXCEPTIONS:
+        raise
+    except Exception as e:
+        return _regen_process_result(e)
+
+
+def _regen_process_result(data):
+    if isinstance(data, MetadataException):
+        # the package isn't pickled, it's rebuilt in the parent by regen_processes()
+        return None, (data.attr, data.error, data.verbose)
+    elif isinstance(data, Exception):
+        try:
+            pickle.dumps(data)
+        except Exception:
+            data = Exception(str(data))
+        return None, data
+    return data, None
+
+
+def _regen_process_chunk(indices):
+    """Regenerate a chunk of packages by their indices in the inherited package list.
+
+    Packages are pipelined through the worker's processor when the helper
+    supports it.
+
+    :return: list of (metadata, exception) tuples matching the indices
+    """
+    pkgs, helper = _regen_process_state
+    chunk = [pkgs[i] for i in indices]
+    results = {}
+    if hasattr(helper, "generate_pipelined"):
+        try:
+            for pkg, data in helper.generate_pipelined(chunk):
+                results[pkg] = _regen_process_result(data)
+        except IGNORED_EXCEPTIONS:
+            raise
+        except Exception:
+            # fall back to regenerating the remainder one by one
+            pass
+    return [
+        results[pkg] if pkg in results else _regen_process_pkg(pkg, helper.generate)
+        for pkg in chunk
+    ]
+
+
+def regen_processes(repo, pkgs, processes, **kwargs):
+    """Regenerate metadata in worker processes, storing the results in this one.
+
+    Each worker owns its own regen helper (and ebuild processor) so metadata
+    parsing and hashing isn't serialized by the GIL; finished entries are
+    streamed back in chunks and written to the cache by the calling process.
+
+    Workers are forked so the repo and package list are inherited instead of
+    pickled; only package indices and the resulting metadata cross processes.
+    """
+    pkgs = list(pkgs)
+    if not pkgs:
+        return
+    processes = max(min(len(pkgs), processes), 1)
+    chunksize = max(min(len(pkgs) // (processes * 16), 100), 1)
+    writer = repo._regen_operation_helper(**kwargs)
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_regen_process_init,
+        initargs=(repo, pkgs, kwargs),
+    )
+    chunks = (
+        range(i, min(i + chunksize, len(pkgs))) for i in range(0, len(pkgs), chunksize)
+    )
+    try:
+        results = chain.from_iterable(executor.map(_regen_process_chunk, chunks))
+        for pkg, (data, e) in zip(pkgs, results):
+            if isinstance(e, tuple):
+                yield pkg, MetadataException(pkg, *e)
+            elif e is not None:
+                yield pkg, e
+            elif data is not None:
+                try:
+                    writer.store(pkg, data)
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    yield pkg, e
+    except KeyboardInterrupt:
+        return
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def regen_repository(
+    repo, pkgs, observer, threads=1, pkg_attr="keywords", processes=False, **kwargs
+):
+    """Regenerate the metadata for the given packages of a repo.
+
+    :param threads: number of parallel workers to use
+    :param processes: use worker processes instead of threads if the repo
+        supports it
+    :return: iterable of (pkg, exception) tuples for failed packages, including
+        :obj:`MetadataException` failures of packages with bad metadata
+    """
+    if processes and hasattr(repo, "_regen_operation_helper"):
+        yield from regen_processes(repo, pkgs, threads, **kwargs)
+        return
+
     helpers = []
 
     def _get_repo_helper():
@@ -38,3 +173,163 @@ def regen_repository(repo, pkgs, observer, threads=1, pkg_attr="keywords", **kwa
 
     # yield any errors that occurred during metadata generation
     yield from errors
+
+
+def _tree_state_path(location):
+    name = quote(os.path.realpath(location), safe="")
+    return pjoin(const.USER_CACHE_PATH, "regen", f"{name}.json")
+
+
+def _load_tree_state(location):
+    path = _tree_state_path(location)
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (EnvironmentError, ValueError) as e:
+        logger.warning(f"ignoring invalid regen state {path!r}: {e}")
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def _save_tree_state(location, state):
+    path = _tree_state_path(location)
+    ensure_dirs(os.path.dirname(path), mode=0o755)
+    with AtomicWriteFile(path) as f:
+        json.dump(state, f)
+
+
+def _snapshot_path(path, extension):
+    chunks = path.split("/")
+    if len(chunks) == 2:
+        return chunks[0] == "eclass" and chunks[1].endswith(".eclass")
+    return len(chunks) == 3 and chunks[2].endswith(extension)
+
+
+def _scandir(path):
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except (FileNotFoundError, NotADirectoryError):
+        return ()
+
+
+def _eclass_snapshot(location, absolute=False):
+    prefix = pjoin(location, "eclass") if absolute else "eclass"
+    return {
+        f"{prefix}/{entry.name}": entry.stat().st_mtime_ns
+        for entry in _scandir(pjoin(location, "eclass"))
+        if entry.name.endswith(".eclass")
+    }
+
+
+def masters_snapshot(masters):
+    """Return a mapping of the absolute eclass paths of master repos to their mtimes.
+
+    :param masters: master repo locations
+    """
+    snapshot = {}
+    for location in masters:
+        snapshot.update(_eclass_snapshot(location, absolute=True))
+    return snapshot
+
+
+def tree_snapshot(location, extension=".ebuild", masters=()):
+    """Return a mapping of a repo's relative ebuild and eclass paths to their mtimes.
+
+    :param masters: master repo locations, their eclasses are tracked by
+        absolute path since they're inherited by the repo's ebuilds as well
+    """
+    snapshot = _eclass_snapshot(location)
+    snapshot.update(masters_snapshot(masters))
+    for category in _scandir(location):
+        if category.name.startswith(".") or not category.is_dir():
+            continue
+        for package in _scandir(category.path):
+            if not package.is_dir():
+                continue
+            for entry in _scandir(package.path):
+                if entry.name.endswith(extension):
+                    path = f"{category.name}/{package.name}/{entry.name}"
+                    snapshot[path] = entry.stat().st_mtime_ns
+    return snapshot
+
+
+def record_synced_paths(location, paths):
+    """Record paths changed by syncing a repo for the next incremental regen.
+
+    :param paths: repo relative paths, None if unknown
+    """
+    state = _load_tree_state(location)
+    if "synced" not in state:
+        # incremental regen hasn't been used for the repo or an earlier
+        # sync's changes are unknown
+        return
+    if paths is None:
+        # fall back to comparing against the snapshot
+        del state["synced"]
+    else:
+        state["synced"] = sorted(set(state["synced"]).union(paths))
+    _save_tree_state(location, state)
+
+
+def incremental_changes(repo):
+    """Determine the paths changed in a repo since its last incremental regen.
+
+    Changes recorded by syncing the repo are preferred, otherwise the repo is
+    compared against a snapshot of its ebuild and eclass mtimes. Eclasses of
+    the repo's masters are always compared against the snapshot since their
+    syncs are recorded for the masters themselves; they're reported by
+    absolute path.
+
+    :return: (paths, state) tuple where paths is None if unknown, requiring
+        a full regen; state is passed to :func:`save_incremental_state` once
+        regen succeeds
+    """
+    location = repo.location
+    extension = repo.extension
+    masters = [x.location for x in getattr(repo, "masters", ())]
+    caches = sorted(getattr(cache, "location", repr(cache)) for cache in repo.cache)
+    state = _load_tree_state(location)
+    if state.get("caches") != caches or "snapshot" not in state:
+        snapshot = tree_snapshot(location, extension, masters)
+        return None, {"caches": caches, "snapshot": snapshot}
+
+    snapshot = state["snapshot"]
+    # without syncs local changes are picked up via the snapshot
+    if synced := state.pop("synced", None):
+        changed = set(synced)
+        for path in synced:
+            if not _snapshot_path(path, extension):
+                continue
+            try:
+                snapshot[path] = os.stat(pjoin(location, path)).st_mtime_ns
+            except FileNotFoundError:
+                snapshot.pop(path, None)
+        current = masters_snapshot(masters)
+        previous = {k: v for k, v in snapshot.items() if os.path.isabs(k)}
+        changed.update(
+            path
+            for path in previous.keys() | current.keys()
+            if previous.get(path) != current.get(path)
+        )
+        for path in previous:
+            del snapshot[path]
+        snapshot.update(current)
+        changed = frozenset(changed)
+    else:
+        current = tree_snapshot(location, extension, masters)
+        changed = frozenset(
+            path
+            for path in snapshot.keys() | current.keys()
+            if snapshot.get(path) != current.get(path)
+        )
+        state["snapshot"] = current
+    return changed, state
+
+
+def save_incremental_state(repo, state):
+    """Store the state returned by :func:`incremental_changes` after regen."""
+    # start tracking sync changes
+    _save_tree_state(repo.location, dict(state, synced=[]))
@@ -21,6 +21,7 @@ from snakeoil.dependant_methods import ForcedDepends
 from .. import operations as operations_mod
 from ..exceptions import PkgcoreException
 from ..log import logger
+from ..package.errors import MetadataException
 from ..package.mutated import MutatedPkg
 from ..restrictions import packages
 from ..sync import base as _sync_base
@@ -145,6 +146,11 @@ class sync_operations(operations_mod.base):
         self.repo._pre_sync()
         ret = syncer.sync(**kwargs)
         self.repo._post_sync()
+        if ret:
+            try:
+                regen.record_synced_paths(syncer.basedir, syncer.changed_paths)
+            except EnvironmentError as e:
+                logger.warning(f"failed recording changes for {syncer.basedir}: {e}")
         return ret
 
     def _get_syncer(self, lazy=False):
@@ -227,31 +233,66 @@ class operations(sync_operations):
                 del cache[p]
 
     @operations_mod.is_standalone
-    def _cmd_api_regen_cache(self, observer=None, threads=1, **kwargs):
+    def _cmd_api_regen_cache(
+        self, observer=None, threads=1, changed_paths=None, **kwargs
+    ):
+        """Regenerate the repo's metadata cache.
+
+        :param changed_paths: repo relative paths changed since the cache was
+            last regenerated; if given and supported by the repo, only the
+            affected packages are regenerated
+        """
         cache = getattr(self.repo, "cache", None)
         if not cache and not kwargs.get("force", False):
             return
-        sync_rate = getattr(cache, "sync_rate", None)
+        changes = None
+        if changed_paths is not None and hasattr(self.repo, "changed_metadata"):
+            changes = self.repo.changed_metadata(changed_paths)
+        # batch cache writes, committing them when done
+        sync_rates = [
+            (cache, cache.sync_rate)
+            for cache in self._get_caches()
+            if not cache.readonly
+        ]
         try:
-            if sync_rate is not None:
+            for cache, _sync_rate in sync_rates:
                 cache.set_sync_rate(1000000)
             errors = 0
 
-            # Force usage of unfiltered repo to include pkgs with metadata issues.
-            # Matches are collapsed directly to a list to avoid threading issues such
-            # as EBADF since the repo iterator isn't thread-safe.
-            pkgs = list(self.repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+            if changes is not None:
+                pkgs, removed = changes
+                affected = pkgs
+            else:
+                # Force usage of unfiltered repo to include pkgs with metadata issues.
+                # Matches are collapsed directly to a list to avoid threading issues such
+                # as EBADF since the repo iterator isn't thread-safe.
+                pkgs = list(self.repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+            if not kwargs.get("force", False) and hasattr(self.repo, "stale_metadata"):
+                # validate the cache in bulk; regen then skips per-package checks
+                stale = self.repo.stale_metadata(pkgs)
+                pkgs = [pkg for pkg in pkgs if pkg.cpvstr in stale]
+                kwargs["force"] = True
 
             observer = self._get_observer(observer)
             for pkg, e in regen.regen_repository(
                 self.repo, pkgs, observer=observer, threads=threads, **kwargs
             ):
+                if isinstance(e, MetadataException):
+                    # reported by the scan below, masking the pkg avoids
+                    # sourcing it again
+                    self.repo._bad_masked[pkg.versioned_atom] = e
+                    continue
                 observer.error(f"caught exception {e} while processing {pkg.cpvstr}")
                 errors += 1
 
             # report pkgs with bad metadata -- relies on iterating over the
             # unfiltered repo to populate the masked repo
-            pkgs = frozenset(pkg.cpvstr for pkg in self.repo)
+            if changes is None:
+                pkgs = frozenset(pkg.cpvstr for pkg in self.repo)
+            else:
+                # only the affected packages can have changed state
+                for pkg in affected:
+                    self.repo.match(pkg.versioned_atom)
             for pkg in sorted(self.repo._bad_masked):
                 observer.error(
                     f"{pkg.cpvstr}: {pkg.data.msg(verbosity=observer.verbosity)}"
@@ -259,11 +300,19 @@ class operations(sync_operations):
                 errors += 1
 
             # remove old/invalid cache entries
-            self._cmd_implementation_clean_cache(pkgs)
+            if changes is None:
+                self._cmd_implementation_clean_cache(pkgs)
+            else:
+                for cache in self._get_caches():
+                    if not cache.readonly:
+                        for cpv in removed:
+                            if cpv in cache:
+                                del cache[cpv]
 
             return errors
         finally:
-            if sync_rate is not None:
+            for cache, sync_rate in sync_rates:
+                cache.commit()
                 cache.set_sync_rate(sync_rate)
             self.repo.operations.run_if_supported("flush_cache")
 
@@ -1,15 +1,179 @@
 """package with its metadata accessible (think 'no longer abstract')"""
 
-__all__ = ("DeriveMetadataKls", "factory", "package")
-
+__all__ = (
+    "DeriveMetadataKls",
+    "factory",
+    "package",
+    "MetadataSchema",
+    "MetadataRecord",
+)
+
+from collections.abc import MutableMapping
+from sys import intern
 from weakref import WeakValueDictionary
 
 from snakeoil import klass
 
 from ..ebuild import cpv
 from ..ebuild.atom import atom
+from ..ebuild.const import metadata_keys
+from ..ebuild.eapi import get_eapi
 from . import base
 
+# keys whose values commonly repeat across packages
+interned_metadata_keys = frozenset(
+    (
+        "DEFINED_PHASES",
+        "DESCRIPTION",
+        "EAPI",
+        "HOMEPAGE",
+        "INHERIT",
+        "INHERITED",
+        "IUSE",
+        "KEYWORDS",
+        "LICENSE",
+        "PROPERTIES",
+        "RESTRICT",
+        "SLOT",
+    )
+)
+
+# cache specific keys stored alongside the EAPI's metadata keys
+internal_metadata_keys = frozenset(("_eclasses_", "_chf_", "_md5_", "_mtime_"))
+
+
+class MetadataSchema:
+    """Fixed set of metadata keys mapped to record slot indexes.
+
+    Schemas are shared by all records using the same set of keys.
+    """
+
+    __slots__ = ("keys", "index")
+    _schemas = {}
+
+    def __init__(self, keys):
+        self.keys = tuple(sorted(keys))
+        self.index = {k: i for i, k in enumerate(self.keys)}
+
+    @classmethod
+    def get(cls, keys):
+        """Return the shared schema for an iterable of keys."""
+        keys = frozenset(keys)
+        schema = cls._schemas.get(keys)
+        if schema is None:
+            schema = cls._schemas.setdefault(keys, cls(keys))
+        return schema
+
+    @classmethod
+    def for_eapi(cls, eapi=None):
+        """Return the schema for an EAPI's metadata, all known keys if None."""
+        keys = metadata_keys if eapi is None else eapi.metadata_keys
+        return cls.get(internal_metadata_keys.union(keys))
+
+    def __reduce__(self):
+        return (self.get, (self.keys,))
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} keys={self.keys!r} @{id(self):#x}>"
+
+
+class MetadataRecord(MutableMapping):
+    """Compact mapping of a package's metadata.
+
+    Values are held in a list indexed by a shared :obj:`MetadataSchema`
+    instead of a dict per package and commonly repeated values are interned,
+    keys outside the schema fall back to a dict.
+    """
+
+    __slots__ = ("_schema", "_values", "_extra")
+
+    def __init__(self, schema, data=()):
+        self._schema = schema
+        self._values = [klass.sentinel] * len(schema.keys)
+        self._extra = None
+        self.update(data)
+
+    @classmethod
+    def from_metadata(cls, data):
+        """Create a record for metadata using the schema of its EAPI."""
+        try:
+            eapi = get_eapi(data.get("EAPI") or "0")
+        except ValueError:
+            eapi = None
+        return cls(MetadataSchema.for_eapi(eapi), data)
+
+    def __getitem__(self, key):
+        idx = self._schema.index.get(key)
+        if idx is None:
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra[key]
+        value = self._values[idx]
+        if value is klass.sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        idx = self._schema.index.get(key)
+        if idx is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        else:
+            if key in interned_metadata_keys and value.__class__ is str:
+                value = intern(value)
+            self._values[idx] = value
+
+    def __delitem__(self, key):
+        idx = self._schema.index.get(key)
+        if idx is None:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+        elif self._values[idx] is klass.sentinel:
+            raise KeyError(key)
+        else:
+            self._values[idx] = klass.sentinel
+
+    def __contains__(self, key):
+        idx = self._schema.index.get(key)
+        if idx is None:
+            return self._extra is not None and key in self._extra
+        return self._values[idx] is not klass.sentinel
+
+    def __iter__(self):
+        for key, value in zip(self._schema.keys, self._values):
+            if value is not klass.sentinel:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        extra = 0 if self._extra is None else len(self._extra)
+        return len(self._values) - self._values.count(klass.sentinel) + extra
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def __reduce__(self):
+        return (self.__class__, (self._schema, dict(self)))
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
 
 def DeriveMetadataKls(original_kls):
     if getattr(original_kls, "_derived_metadata_kls", False):
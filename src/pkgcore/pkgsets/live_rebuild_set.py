@@ -3,6 +3,8 @@
 Note: HACK. Quick proof of concept, could do with cleaning up.
 """
 
+from collections import defaultdict
+
 from ..config.hint import ConfigHint
 from ..repository.util import RepositoryGroup
 from .installed import VersionedInstalled
@@ -19,13 +21,41 @@ class EclassConsumerSet(VersionedInstalled):
         self.repos = RepositoryGroup(repos)
         self.eclasses = frozenset(eclasses)
 
+    def _consumers(self, pkgs):
+        """Return the cpvs of packages inheriting any of the eclasses.
+
+        Packages with valid cache entries are checked against the eclass index
+        of their cache, the rest fall back to their metadata.
+        """
+        repos = defaultdict(list)
+        for pkg in pkgs:
+            repos[pkg.repo].append(pkg)
+        consumers = set()
+        for repo, repo_pkgs in repos.items():
+            valid = {}
+            if hasattr(getattr(repo, "package_class", None), "validated_caches"):
+                valid = repo.package_class.validated_caches(repo_pkgs)[0]
+            indexes = {}
+            for pkg in repo_pkgs:
+                if (cache := valid.get(pkg.cpvstr)) is not None:
+                    if cache not in indexes:
+                        indexes[cache] = cache.eclass_consumers(self.eclasses)
+                    if pkg.cpvstr in indexes[cache]:
+                        consumers.add(pkg.cpvstr)
+                elif not self.eclasses.isdisjoint(pkg.inherited):
+                    consumers.add(pkg.cpvstr)
+        return consumers
+
     def __iter__(self):
+        pkgs = {}
         for atom in VersionedInstalled.__iter__(self):
-            pkgs = self.repos.match(atom)
-            if not pkgs:
+            matches = self.repos.match(atom)
+            if not matches:
                 # pkg is installed but no longer in any repo, just ignore it.
                 continue
-            assert len(pkgs) == 1, f"I do not know what I am doing: {pkgs}"
-            pkg = pkgs[0]
-            if self.eclasses.isdisjoint(pkg.data.get("_eclasses_", ())):
+            assert len(matches) == 1, f"I do not know what I am doing: {matches}"
+            pkgs[atom] = matches[0]
+        consumers = self._consumers(pkgs.values())
+        for atom, pkg in pkgs.items():
+            if pkg.cpvstr not in consumers:
                 yield atom
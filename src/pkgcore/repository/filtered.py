@@ -45,7 +45,8 @@ class tree(prototype.tree):
         # (determined by repo's attributes) versus what does cost
         # (metadata pull for example).
         return self._filterfunc(
-            self.restrict.match, self.raw_repo.itermatch(restrict, **kwds)
+            restriction.compile_match(self.restrict),
+            self.raw_repo.itermatch(restrict, **kwds),
         )
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
@@ -5,6 +5,9 @@ repository that combines multiple repos together
 __all__ = ("tree", "operations")
 
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from itertools import chain
 from operator import itemgetter
@@ -67,6 +70,8 @@ class tree(prototype.tree):
 
     Args:
         trees (list): :obj:`pkgcore.repository.prototype.tree` instances
+        threads (int): number of repos to query concurrently via itermatch,
+            by default repos are queried sequentially
 
     Attributes:
         frozen_settable (bool): controls whether frozen is able to be set
@@ -78,10 +83,14 @@ class tree(prototype.tree):
 
     frozen_settable = False
     operations_kls = operations
+    # matches each worker queues ahead of the consumer when threaded
+    match_buffer = 256
 
-    pkgcore_config_type = ConfigHint(types={"repos": "refs:repo"}, typename="repo")
+    pkgcore_config_type = ConfigHint(
+        types={"repos": "refs:repo", "threads": "int"}, typename="repo"
+    )
 
-    def __init__(self, *trees, repos=()):
+    def __init__(self, *trees, repos=(), threads=None):
         super().__init__()
         trees = trees + tuple(repos)
         for x in trees:
@@ -90,6 +99,7 @@ class tree(prototype.tree):
                     f"{x} is not a repository tree derivative"
                 )
         self.trees = trees
+        self.threads = threads
 
     def _get_categories(self):
         d = set()
@@ -148,13 +158,34 @@ class tree(prototype.tree):
         raise ValueError(f"no repo contains: {path!r}")
 
     def itermatch(self, restrict, **kwds):
-        sorter = kwds.get("sorter", iter)
+        merge = partial(self._merge_matches, sorter=kwds.get("sorter", iter))
+        if self.threads and len(self.trees) > 1:
+            return self._threaded_itermatch(restrict, kwds, merge)
+        return merge(repo.itermatch(restrict, **kwds) for repo in self.trees)
+
+    def itermatch_trees(self, restrict, **kwds):
+        """Match each tree separately, yielding (tree, matches) pairs in order.
+
+        Takes the same arguments as :obj:`itermatch`, but matches aren't
+        merged across trees. Trees are only queried once their matches are
+        consumed, or concurrently when threads are enabled.
+        """
+        if self.threads and len(self.trees) > 1:
+            return self._threaded_itermatch(restrict, kwds, partial(zip, self.trees))
+        return (
+            (repo, self._deferred_itermatch(repo, restrict, kwds))
+            for repo in self.trees
+        )
+
+    @staticmethod
+    def _deferred_itermatch(repo, restrict, kwds):
+        yield from repo.itermatch(restrict, **kwds)
+
+    @staticmethod
+    def _merge_matches(matches, sorter):
+        """Combine per repo match iterators, retaining repo priority order."""
         if sorter is iter:
-            return (
-                match
-                for repo in self.trees
-                for match in repo.itermatch(restrict, **kwds)
-            )
+            return chain.from_iterable(matches)
 
         # ugly, and a bit slow, but works.
         def f(x, y):
@@ -164,7 +195,59 @@ class tree(prototype.tree):
             return -1
 
         f = post_curry(sorted_cmp, f, key=itemgetter(0))
-        return iter_sort(f, *[repo.itermatch(restrict, **kwds) for repo in self.trees])
+        return iter_sort(f, *matches)
+
+    def _threaded_itermatch(self, restrict, kwds, combine):
+        """Query repos concurrently, yielding matches in the sequential order.
+
+        Each repo is matched in a worker thread feeding its own bounded queue
+        so slow repos, e.g. ones regenerating metadata, don't hold up the
+        others. Workers stop once the consumer abandons their repo's matches.
+        """
+        done = object()
+
+        def collect(repo, results, stop):
+            def put(item):
+                while not stop.is_set():
+                    try:
+                        results.put(item, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        pass
+                return False
+
+            try:
+                for pkg in repo.itermatch(restrict, **kwds):
+                    if not put((pkg, None)):
+                        return
+            except BaseException as e:
+                put((done, e))
+            else:
+                put((done, None))
+
+        def drain(results, stop):
+            try:
+                while True:
+                    pkg, exc = results.get()
+                    if pkg is done:
+                        if exc is not None:
+                            raise exc
+                        return
+                    yield pkg
+            finally:
+                stop.set()
+
+        queues = [queue.Queue(self.match_buffer) for _ in self.trees]
+        stops = [threading.Event() for _ in self.trees]
+        executor = ThreadPoolExecutor(max_workers=min(self.threads, len(self.trees)))
+        try:
+            for args in zip(self.trees, queues, stops):
+                executor.submit(collect, *args)
+            yield from combine([drain(*args) for args in zip(queues, stops)])
+        finally:
+            for stop in stops:
+                stop.set()
+            executor.shutdown(cancel_futures=True)
 
     itermatch.__doc__ = prototype.tree.itermatch.__doc__.replace(
         "@param", "@keyword"
@@ -215,7 +298,7 @@ class tree(prototype.tree):
                 self.trees += (other,)
             return self
         elif isinstance(other, tree):
-            return tree(*(self.trees + other.trees))
+            return tree(*(self.trees + other.trees), threads=self.threads)
         raise TypeError(
             f"cannot add {other.__class__.__name__!r} and {self.__class__.__name__!r} objects"
         )
@@ -226,7 +309,7 @@ class tree(prototype.tree):
                 self.trees = (other,) + self.trees
             return self
         elif isinstance(other, tree):
-            return tree(*(other.trees + self.trees))
+            return tree(*(other.trees + self.trees), threads=self.threads)
         raise TypeError(
             f"cannot add {other.__class__.__name__!r} and {self.__class__.__name__!r} objects"
         )
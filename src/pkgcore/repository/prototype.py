@@ -2,16 +2,34 @@
 base repository template
 """
 
-__all__ = ("CategoryLazyFrozenSet", "PackageMapping", "VersionMapping", "tree")
-
+__all__ = (
+    "CategoryLazyFrozenSet",
+    "LayoutIndex",
+    "PackageMapping",
+    "VersionMapping",
+    "tree",
+)
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+import time
+import weakref
 from pathlib import Path
 import typing
+from urllib.parse import quote
 
+from snakeoil.fileutils import AtomicWriteFile
 from snakeoil.klass import jit_attr
 from snakeoil.mappings import DictMixin, LazyValDict
+from snakeoil.osutils import ensure_dirs, pjoin
 from snakeoil.sequences import iflatten_instance
 
+from .. import const
 from ..ebuild.atom import atom
+from ..ebuild.cpv import VersionedCPV, fullver_key
+from ..log import logger
 from ..operations import repo
 from ..restrictions import boolean, packages, restriction, values
 from ..restrictions.util import collect_package_restrictions
@@ -72,6 +90,7 @@ class VersionMapping(DictMixin):
         self._cache = {}
         self._parent = parent_mapping
         self._pull_vals = pull_vals
+        self._keys = {}
 
     def __getitem__(self, key):
         o = self._cache.get(key)
@@ -88,13 +107,114 @@ class VersionMapping(DictMixin):
             for pkg in pkgs:
                 yield (cat, pkg)
 
+    def version_keys(self, key):
+        """Return the versions of a package ordered by version.
+
+        :return: tuple of the sorted :func:`pkgcore.ebuild.cpv.fullver_key`
+            keys, the versions in the same order and the versions that
+            couldn't be parsed
+        """
+        versions = self[key]
+        o = self._keys.get(key)
+        if o is None or o[0] is not versions:
+            keyed, invalid = [], []
+            for ver in versions:
+                if (ver_key := fullver_key(ver)) is None:
+                    invalid.append(ver)
+                else:
+                    keyed.append((ver_key, ver))
+            keyed.sort()
+            o = (versions, [x[0] for x in keyed], [x[1] for x in keyed], invalid)
+            self._keys[key] = o
+        return o[1:]
+
     def force_regen(self, key, val):
+        self._keys.pop(key, None)
         if val:
             self._cache[key] = val
         else:
             self._cache.pop(key, None)
 
 
+class LayoutIndex:
+    """Directory listings of a repo persisted across runs.
+
+    Listings are stored along with the mtime of the directory they were
+    taken from, an unchanged directory is only stat'd instead of listed
+    again. The index is loaded on first use and written back when the owning
+    repo goes away or the interpreter exits.
+
+    :param location: repo location the index is kept for
+    :param owner: object whose lifetime determines when the index gets saved
+    """
+
+    version = 1
+    # directories modified more recently aren't recorded since further
+    # changes within the filesystem's timestamp granularity would go unnoticed
+    settle_time = 2 * 10**9
+
+    def __init__(self, location, owner=None):
+        name = quote(os.path.realpath(location), safe="")
+        self.path = pjoin(const.USER_CACHE_PATH, "repo-index", f"{name}.json")
+        self._owner = owner
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        self._entries = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") == self.version:
+                self._entries = {
+                    key: (mtime, tuple(names))
+                    for key, (mtime, names) in data["dirs"].items()
+                }
+        except FileNotFoundError:
+            pass
+        except (EnvironmentError, AttributeError, KeyError, TypeError, ValueError):
+            logger.debug("ignoring invalid repo index %r", self.path)
+        weakref.finalize(self if self._owner is None else self._owner, self.save)
+        self._owner = None
+
+    def listing(self, key, path, pull):
+        """Return the listing of a directory, reusing it if unchanged.
+
+        :param key: repo relative identifier of the directory
+        :param path: directory path
+        :param pull: callable returning the listing of a given path
+        :raise: :obj:`EnvironmentError` if the directory can't be accessed
+        """
+        if self._entries is None:
+            self._load()
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        names = tuple(pull(path))
+        if time.time_ns() - mtime >= self.settle_time:
+            self._entries[key] = (mtime, names)
+            self._dirty = True
+        elif entry is not None:
+            del self._entries[key]
+            self._dirty = True
+        return names
+
+    def save(self):
+        """Write the index out if it changed."""
+        if not self._dirty:
+            return
+        data = {"version": self.version, "dirs": self._entries}
+        try:
+            ensure_dirs(os.path.dirname(self.path), mode=0o755)
+            with AtomicWriteFile(self.path) as f:
+                json.dump(data, f)
+        except EnvironmentError as e:
+            logger.debug("failed writing repo index %r: %s", self.path, e)
+            return
+        self._dirty = False
+
+
 class tree(abc.ABC):
     """ABC for all repository variants.
 
@@ -122,6 +242,11 @@ class tree(abc.ABC):
     is_supported = True
     livefs = False
     package_class = None
+    # package attributes secondary indexes are available for, see _attr_index()
+    indexed_attrs = frozenset()
+    # number of packages a query has to span before indexes are used, building
+    # them costs more than checking a few packages directly
+    indexed_min_candidates = 64
     configured = True
     frozen_settable = True
     operations_kls = repo.operations
@@ -262,17 +387,36 @@ class tree(abc.ABC):
             else:
                 raw_pkg_cls = lambda *args: args
 
+        cpvs = versions = None
         if isinstance(restrict, atom):
             candidates = [(restrict.category, restrict.package)]
+            if versioned:
+                versions = self._atom_versions(restrict)
         else:
             candidates = self._identify_candidates(restrict, sorter)
+            if self.indexed_attrs:
+                candidates = iter(candidates)
+                head = list(islice(candidates, self.indexed_min_candidates))
+                candidates = chain(head, candidates)
+                if len(head) == self.indexed_min_candidates:
+                    cpvs = self._plan_candidates(restrict)
+            if cpvs is not None:
+                cps = {(x.category, x.package) for x in map(VersionedCPV, cpvs)}
+                candidates = (cp for cp in candidates if cp in cps)
 
         if force is None:
-            match = restrict.match
+            match = restrict.compile()
         elif force:
             match = restrict.force_True
         else:
             match = restrict.force_False
+        if cpvs is not None and versioned:
+            restrict_match = match
+
+            def match(pkg):
+                # skip loading metadata of versions ruled out by the indexes
+                return pkg.cpvstr in cpvs and restrict_match(pkg)
+
         return self._internal_match(
             candidates,
             match,
@@ -282,16 +426,108 @@ class tree(abc.ABC):
             sorter=sorter,
             pkg_filter=pkg_filter,
             versioned=versioned,
+            versions=versions,
         )
 
+    def _atom_versions(self, restrict):
+        """Select the versions of an atom's package within its version range.
+
+        Versions are bisected by their sort keys so packages only get
+        created for versions that can match, the atom is still matched
+        against them in full.
+
+        :return: mapping of the atom's package to the selected versions or
+            None if the versions can't be selected this way
+        """
+        op = restrict.op
+        if (
+            not op
+            or op == "=*"
+            or restrict.negate_vers
+            or not isinstance(self.versions, VersionMapping)
+        ):
+            return None
+        cp = (restrict.category, restrict.package)
+        try:
+            keys, sorted_versions, invalid = self.versions.version_keys(cp)
+        except KeyError:
+            return None
+        key = restrict.version_key
+        if op == "~":
+            # any revision of the version
+            start = bisect_left(keys, key[:-1])
+            end = bisect_left(keys, key[:-1] + (float("inf"),))
+        elif op == "=":
+            start, end = bisect_left(keys, key), bisect_right(keys, key)
+        elif op == "<":
+            start, end = 0, bisect_left(keys, key)
+        elif op == "<=":
+            start, end = 0, bisect_right(keys, key)
+        elif op == ">":
+            start, end = bisect_right(keys, key), len(keys)
+        else:
+            start, end = bisect_left(keys, key), len(keys)
+        # unparsable versions are left for the regular package handling
+        selected = set(sorted_versions[start:end]).union(invalid)
+        return {cp: tuple(x for x in self.versions[cp] if x in selected)}
+
+    def _attr_index(self, attr):
+        """Return the secondary index of a package attribute.
+
+        :return: tuple of a mapping of attribute values to the cpv strings of
+            packages having them and the cpv strings of packages lacking index
+            data, or None if the attribute isn't indexed
+        """
+        return None
+
+    def _plan_candidates(self, restrict):
+        """Narrow the packages a restriction can match via secondary indexes.
+
+        Only restrictions requiring specific values of indexed attributes
+        narrow the candidates, the result is a superset of the matches.
+
+        :return: set of cpv strings or None if the candidates couldn't be narrowed
+        """
+        if restrict.negate:
+            return None
+        if isinstance(restrict, boolean.base):
+            if isinstance(restrict, boolean.OrRestriction):
+                plans = [self._plan_candidates(x) for x in restrict]
+                if not plans or None in plans:
+                    return None
+                return set().union(*plans)
+            elif isinstance(restrict, boolean.AndRestriction):
+                cpvs = None
+                for plan in map(self._plan_candidates, restrict):
+                    if plan is not None:
+                        cpvs = plan if cpvs is None else cpvs.intersection(plan)
+                return cpvs
+            return None
+        if (
+            type(restrict) is not packages.PackageRestriction
+            or restrict.attr not in self.indexed_attrs
+        ):
+            return None
+        value_restrict = restrict.restriction
+        if (
+            type(value_restrict) is not values.ContainmentMatch
+            or value_restrict.negate
+            or not value_restrict.vals
+        ):
+            return None
+        if (index := self._attr_index(restrict.attr)) is None:
+            return None
+        index, unindexed = index
+        return set(unindexed).union(*(index.get(x, ()) for x in value_restrict.vals))
+
     def _internal_gen_candidates(
-        self, candidates, sorter, raw_pkg_cls, pkg_filter, versioned
+        self, candidates, sorter, raw_pkg_cls, pkg_filter, versioned, versions=None
     ):
+        if versions is None:
+            versions = self.versions
         for cp in sorter(candidates):
             if versioned:
-                pkgs = (
-                    raw_pkg_cls(cp[0], cp[1], ver) for ver in self.versions.get(cp, ())
-                )
+                pkgs = (raw_pkg_cls(cp[0], cp[1], ver) for ver in versions.get(cp, ()))
             else:
                 if self.versions.get(cp, ()):
                     pkgs = (raw_pkg_cls(cp[0], cp[1]),)
@@ -9,6 +9,10 @@ class PigeonHoledSlots:
     """class for tracking slotting to a specific atom/obj key
     no atoms present, just prevents conflicts of obj.key; atom present, assumes
     it's a blocker and ensures no obj matches the atom for that key
+
+    Objs and limiters are bucketed by key and slot (limiters without a slot
+    constraint go into the None bucket of their key), each bucket maps the
+    id of its entries to the entries for removal by identity.
     """
 
     def __init__(self):
@@ -23,24 +27,36 @@ class PigeonHoledSlots:
 
         l = self.check_limiters(obj)
 
-        key = obj.key
-        dslot = obj.slot
-        l.extend(x for x in self.slot_dict.get(key, ()) if x.slot == dslot)
+        slots = self.slot_dict.get(obj.key)
+        if slots is not None:
+            l.extend(slots.get(obj.slot, {}).values())
 
         if not l or force:
-            self.slot_dict.setdefault(key, []).append(obj)
+            slots = self.slot_dict.setdefault(obj.key, {})
+            slots.setdefault(obj.slot, {})[id(obj)] = obj
         return l
 
     def get_conflicting_slot(self, pkg):
-        for x in self.slot_dict.get(pkg.key, ()):
-            if pkg.slot == x.slot:
-                return x
+        slot = self.slot_dict.get(pkg.key, {}).get(pkg.slot)
+        if slot:
+            return next(iter(slot.values()))
         return None
 
     def find_atom_matches(self, atom, key=None):
         if key is None:
             key = atom.key
-        return list(filter(atom.match, self.slot_dict.get(key, ())))
+        slots = self.slot_dict.get(key)
+        if not slots:
+            return []
+        slot = self._limiter_slot(atom)
+        if slot is not None:
+            return list(filter(atom.match, slots.get(slot, {}).values()))
+        return [x for objs in slots.values() for x in objs.values() if atom.match(x)]
+
+    @staticmethod
+    def _limiter_slot(atom):
+        """Return the slot a limiter is restricted to, None if unrestricted."""
+        return getattr(atom, "slot", None)
 
     def add_limiter(self, atom, key=None):
         """add a limiter, returning any conflicting objs"""
@@ -52,38 +68,42 @@ class PigeonHoledSlots:
 
         if key is None:
             key = atom.key
-        self.limiters.setdefault(key, []).append(atom)
+        slots = self.limiters.setdefault(key, {})
+        slots.setdefault(self._limiter_slot(atom), {})[id(atom)] = atom
         return self.find_atom_matches(atom, key=key)
 
     def check_limiters(self, obj):
         """return any limiters conflicting w/ the passed in obj"""
-        key = obj.key
-        return [x for x in self.limiters.get(key, ()) if x.match(obj)]
+        slots = self.limiters.get(obj.key)
+        if not slots:
+            return []
+        l = [x for x in slots.get(None, {}).values() if x.match(obj)]
+        if obj.slot is not None:
+            l.extend(x for x in slots.get(obj.slot, {}).values() if x.match(obj))
+        return l
 
-    def remove_slotting(self, obj):
-        key = obj.key
+    @staticmethod
+    def _remove(buckets, key, slot, obj):
         # let the key error be thrown if they screwed up.
-        slots = self.slot_dict.get(key, ())
-        l = [x for x in slots if x is not obj]
-        if len(l) == len(slots):
+        slots = buckets.get(key, {})
+        objs = slots.get(slot, {})
+        if objs.pop(id(obj), None) is None:
             raise KeyError(f"obj {obj} isn't slotted")
-        if l:
-            self.slot_dict[key] = l
-        else:
-            del self.slot_dict[key]
+        if not objs:
+            del slots[slot]
+            if not slots:
+                del buckets[key]
+
+    def remove_slotting(self, obj):
+        self._remove(self.slot_dict, obj.key, getattr(obj, "slot", None), obj)
 
     def remove_limiter(self, atom, key=None):
         if key is None:
             key = atom.key
-        l = [x for x in self.limiters[key] if x is not atom]
-        if len(l) == len(self.limiters[key]):
-            raise KeyError(f"obj {atom} isn't slotted")
-        if not l:
-            del self.limiters[key]
-        else:
-            self.limiters[key] = l
+        self._remove(self.limiters, key, self._limiter_slot(atom), atom)
 
     def __contains__(self, obj):
         if isinstance(obj, restriction.base):
-            return obj in self.limiters.get(obj.key, ())
-        return obj in self.slot_dict.get(obj.key, ())
+            objs = self.limiters.get(obj.key, {}).get(self._limiter_slot(obj), {})
+            return obj in objs.values()
+        return any(obj in x.values() for x in self.slot_dict.get(obj.key, {}).values())
@@ -3,6 +3,7 @@ __all__ = ("resolver_frame", "resolver_stack", "merge_plan")
 import operator
 import sys
 from collections import deque
+from copy import copy
 from functools import partial
 from itertools import chain, filterfalse, islice
 
@@ -13,7 +14,7 @@ from snakeoil.iterables import caching_iter
 from ..ebuild import atom as _atom
 from ..repository import filtered, misc, multiplex, util
 from ..restrictions import packages, restriction, values
-from . import state
+from . import speculative, state
 from .choice_point import choice_point
 
 limiters = set(["cycle"])
@@ -42,19 +43,16 @@ def highest_iter_sort(l, pkg_grabber=pkg_grabber):
     :return: sorted list of packages
     """
 
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return 1
-        elif y.repo.livefs:
-            return -1
-        return 0
+    def key(x):
+        pkg = pkg_grabber(x)
+        return (
+            pkg.category,
+            pkg.package,
+            pkg.version_key,
+            bool(getattr(pkg.repo, "livefs", False)),
+        )
 
-    sort_cmp(l, f, key=pkg_grabber, reverse=True)
+    l.sort(key=key, reverse=True)
     return l
 
 
@@ -94,19 +92,16 @@ def lowest_iter_sort(l, pkg_grabber=pkg_grabber):
     :return: sorted list of packages
     """
 
-    def f(x, y):
-        c = cmp(x, y)
-        if c:
-            return c
-        elif x.repo.livefs:
-            if y.repo.livefs:
-                return 0
-            return -1
-        elif y.repo.livefs:
-            return 1
-        return 0
+    def key(x):
+        pkg = pkg_grabber(x)
+        return (
+            pkg.category,
+            pkg.package,
+            pkg.version_key,
+            not getattr(pkg.repo, "livefs", False),
+        )
 
-    sort_cmp(l, f, key=pkg_grabber)
+    l.sort(key=key)
     return l
 
 
@@ -134,6 +129,9 @@ class resolver_frame:
         "vdb_limited",
         "events",
         "succeeded",
+        "cacheable",
+        "reusable",
+        "culprits",
     )
 
     def __init__(
@@ -162,6 +160,12 @@ class resolver_frame:
         self.vdb_limited = vdb_limited
         self.events = []
         self.succeeded = None
+        # cleared if the outcome depends on ancestor frames
+        self.cacheable = True
+        # cleared if a choice within failed, see _mark_state_dependent()
+        self.reusable = True
+        # planned facts failed choices depended on, None if unknown
+        self.culprits = set()
 
     def reduce_solutions(self, nodes):
         if isinstance(nodes, (list, tuple)):
@@ -292,6 +296,15 @@ class merge_plan:
         "repo.livefs", values.EqualityMatch(True)
     )
 
+    # ops that can be replayed when reusing a cached solution
+    _replayable_ops = (
+        state.add_op,
+        state.add_backref_op,
+        state.replace_op,
+        state.incref_forward_block_op,
+        state.decref_forward_block_op,
+    )
+
     def __init__(
         self,
         dbs,
@@ -303,6 +316,7 @@ class merge_plan:
         debug=False,
         debug_handle=None,
         pdb_intercept=None,
+        jobs=1,
     ):
         if debug:
             if debug_handle is None:
@@ -343,10 +357,19 @@ class merge_plan:
         )
 
         self.insoluble = set()
+        # successfully resolved subtrees and failures, see _record_solution()
+        self._solutions = {}
+        self._failures = {}
+        # learned failures bound to the planned facts causing them
+        self._nogoods = {}
+        # facts the last failed atom depended on, see _culprits()
+        self._failure_culprits = None
         self.vdb_preloaded = False
         self._ensure_livefs_is_loaded = self._ensure_livefs_is_loaded_nonpreloaded
         self.drop_cycles = drop_cycles
         self.process_built_depends = process_built_depends
+        # worker processes resolving independent requests, see add_atoms()
+        self.jobs = jobs
         self._debugging = debug
         if debug:
             self._rec_add_atom = partial(
@@ -428,20 +451,29 @@ class merge_plan:
 
     def add_atoms(self, restricts, finalize=False):
         if restricts:
-            stack = resolver_stack()
             for restrict in restricts:
                 state.add_hardref_op(restrict).apply(self.state)
-            dbs = self.default_dbs
-            for restrict in restricts:
-                ret = self._add_atom(restrict, stack, dbs)
-                if ret:
-                    return ret
+            if self.jobs > 1 and len(restricts) > 1 and not self._debugging:
+                # groups that fail or conflict are redone serially below
+                restricts = speculative.resolve(self, restricts, self.jobs)
+            ret = self._add_restricts(restricts)
+            if ret:
+                return ret
         if finalize:
             # note via this being outside the recursion, backtracking
             # is excluded... inline it somehow.
             self.process_finalize()
         return ()
 
+    def _add_restricts(self, restricts):
+        stack = resolver_stack()
+        dbs = self.default_dbs
+        for restrict in restricts:
+            ret = self._add_atom(restrict, stack, dbs)
+            if ret:
+                return ret
+        return ()
+
     def process_finalize(self):
         pass
 
@@ -490,6 +522,7 @@ class merge_plan:
 
         matches = self._viable(stack, mode, atom, dbs, drop_cycles, limit_to_vdb)
         if matches is None:
+            self._failure_culprits = frozenset([(None, atom)])
             stack.pop_frame(False)
             return [atom]
         elif matches is True:
@@ -515,14 +548,36 @@ class merge_plan:
 
         ret = self.check_for_cycles(stack, stack.current_frame)
         if ret is not True:
+            self._failure_culprits = None
             stack.pop_frame(ret is None)
             return ret
 
+        frame = stack.current_frame
+        if frame.cacheable and not drop_cycles:
+            cached = self._failures.get(self._failure_key(frame))
+            if cached is None:
+                cached = self._learned_failure(frame)
+            if cached is not None:
+                failures, events, self._failure_culprits = cached
+                self._dprint("cached fail  %s%s", (depth * 2 * " ", atom))
+                frame.events.extend(events)
+                stack.pop_frame(False)
+                return list(failures)
+            if self._splice_solution(frame):
+                self._dprint("reused       %s%s", (depth * 2 * " ", atom))
+                stack.add_event(("debug", "reused cached solution"))
+                stack.pop_frame(True)
+                return None
+
         failures = []
 
         debugging = self._debugging
         last_state = None
+        first_choice = True
         while choices:
+            if not first_choice:
+                self._mark_state_dependent(stack)
+            first_choice = False
             if debugging:
                 new_state = choices.state
                 if last_state == new_state:
@@ -548,6 +603,20 @@ class merge_plan:
 
             self.notify_trying_choice(stack, atom, choices)
 
+            if conflicts := self._doomed(stack, choices.current_pkg):
+                # inserting the pkg is bound to fail, skip resolving its deps
+                self.notify_choice_failed(
+                    stack,
+                    atom,
+                    choices,
+                    "conflicts with %s",
+                    ", ".join(map(str, conflicts)),
+                )
+                self._blame(frame, self._culprits(conflicts))
+                failures = []
+                choices.force_next_pkg()
+                continue
+
             if not choices.current_pkg.built or self.process_built_depends:
                 new_additions, failures = self.process_dependencies_and_blocks(
                     stack, choices, "depend", atom, depth
@@ -582,6 +651,7 @@ class merge_plan:
             if l is False:
                 # this means somehow the node already slipped in.
                 # so we exit now, we are satisfied
+                self._mark_context_dependent(stack)
                 self.notify_choice_succeeded(
                     stack, atom, choices, "already exists in the state plan"
                 )
@@ -592,6 +662,7 @@ class merge_plan:
                 self.notify_choice_failed(
                     stack, atom, choices, "failed inserting: %s", l
                 )
+                self._blame(frame, self._culprits(l))
                 self.state.backtrack(stack.current_frame.start_point)
                 choices.force_next_pkg()
                 continue
@@ -604,6 +675,7 @@ class merge_plan:
             additions += new_additions
 
             self.notify_choice_succeeded(stack, atom, choices)
+            self._record_solution(frame)
             stack.pop_frame(True)
             return None
 
@@ -625,12 +697,15 @@ class merge_plan:
             self._dprint("trying saving throw for %s ignoring cycles", atom, "cycle")
             # note everything is retored to a pristine state prior also.
             stack[-1].ignored = True
+            frame.culprits = None
             l = self._rec_add_atom(atom, stack, dbs, mode=mode, drop_cycles=True)
             if not l:
                 stack.pop_frame(True)
                 return None
+        failures = [atom] + failures
+        self._record_failure(frame, failures)
         stack.pop_frame(False)
-        return [atom] + failures
+        return failures
 
     def _viable(self, stack, mode, atom, dbs, drop_cycles, limit_to_vdb):
         """
@@ -711,6 +786,7 @@ class merge_plan:
         """
         force_vdb = False
         for frame in stack.slot_cycles(cur_frame, reverse=True):
+            self._mark_context_dependent(stack)
             if not any(
                 f.mode == "pdepend"
                 for f in islice(stack, stack.index(frame), stack.index(cur_frame))
@@ -771,6 +847,7 @@ class merge_plan:
                 "resetting for %s%s because of %s: %s",
                 (depth * 2 * " ", atom, attr, l[0]),
             )
+            self._blame(stack.current_frame, self._failure_culprits)
             self.state.backtrack(stack.current_frame.start_point)
             return [], l[0]
 
@@ -779,6 +856,7 @@ class merge_plan:
 
     def process_dependencies(self, stack, choices, mode, depset, atom):
         failure = []
+        culprits = frozenset()
         (
             additions,
             blocks,
@@ -810,6 +888,7 @@ class merge_plan:
                     # XXX this is whacky tacky fantastically crappy
                     # XXX kill it; purpose seems... questionable.
                     if cur_frame.drop_cycles:
+                        self._mark_context_dependent(stack)
                         self._dprint(
                             "%s level cycle: %s: " "dropping cycle for %s from %s",
                             (mode, cur_frame.atom, or_node, cur_frame.current_pkg),
@@ -818,12 +897,19 @@ class merge_plan:
                         failure = None
                         break
 
+                self._mark_state_dependent(stack)
+                if self._failure_culprits is None:
+                    culprits = None
+                elif culprits is not None:
+                    culprits |= self._failure_culprits
                 if cur_frame.reduce_solutions(or_node):
                     # pkg changed.
+                    self._failure_culprits = culprits
                     return [failure]
                 continue
             else:  # didn't find any solutions to this or block.
                 cur_frame.reduce_solutions(potentials)
+                self._failure_culprits = culprits
                 return [potentials]
         else:  # all potentials were usable.
             return additions, blocks
@@ -832,6 +918,7 @@ class merge_plan:
         ret = self.insert_blockers(stack, choices, [blocker])
         if ret is None:
             return []
+        self._failure_culprits = self._culprits(ret[1])
         self.notify_choice_failed(
             stack,
             atom,
@@ -967,6 +1054,7 @@ class merge_plan:
                     (stack[-1].mode, x, l, stack[-1].atom, choices.current_pkg),
                 )
                 if x.weak_blocker:
+                    self._mark_context_dependent(stack)
                     # note that we use the top frame of the stacks' dbs; this
                     # is to allow us to upgrade as needed.
                     # For this to match, it's *only* possible if the blocker is resolved
@@ -988,9 +1076,213 @@ class merge_plan:
                 return x, l
         return None
 
+    @staticmethod
+    def _mark_context_dependent(stack):
+        """Disable caching the outcome of all frames on the stack.
+
+        Used when resolution relies on ancestor frames (cycles) or on state
+        that can't be validated when replaying a solution.
+        """
+        for frame in stack:
+            frame.cacheable = False
+
+    @staticmethod
+    def _mark_state_dependent(stack):
+        """Disable caching the solutions of all frames on the stack.
+
+        Used when a choice fails; the choices resolved instead may only be
+        picked due to the current plan state, so replaying them elsewhere
+        could skip preferred choices viable there.
+        """
+        for frame in reversed(stack):
+            if not frame.reusable:
+                # its ancestors were marked along with it
+                break
+            frame.reusable = False
+
+    def _failure_key(self, frame):
+        # the plan is a stack of ops; the same op at the same depth implies
+        # nothing below it changed either, thus the same plan state
+        start = frame.start_point
+        return frame.atom, frame.dbs, start, self.state[start - 1] if start else None
+
+    def _record_failure(self, frame, failures):
+        """Cache the failure to resolve a frame's atom for the current plan state.
+
+        If the failure only depended on planned facts (see :meth:`_culprits`)
+        it's also learned as a nogood applying to any plan state holding them.
+        """
+        self._failure_culprits = None
+        if not frame.cacheable or frame.drop_cycles:
+            return
+        culprits = frame.culprits
+        if culprits is not None:
+            culprits = frozenset(culprits)
+            culprits |= {(None, frame.atom)}
+            # facts planned by the frame itself were reverted, its failure
+            # depends on decisions made within it
+            if self._holds(culprits):
+                self._failure_culprits = culprits
+        entry = (tuple(failures), tuple(frame.events), self._failure_culprits)
+        self._failures[self._failure_key(frame)] = entry
+        if self._failure_culprits is not None:
+            self._nogoods.setdefault((frame.atom, frame.dbs), []).append(entry)
+
+    def _learned_failure(self, frame):
+        """Return a learned failure for the frame's atom applying to the current plan."""
+        for entry in self._nogoods.get((frame.atom, frame.dbs), ()):
+            if self._holds(entry[2]):
+                return entry
+        return None
+
+    @staticmethod
+    def _blame(frame, culprits):
+        """Add the facts a failed choice depended on to its frame."""
+        if culprits is None or frame.culprits is None:
+            frame.culprits = None
+        else:
+            frame.culprits.update(culprits)
+
+    def _blocker_owners(self, blocker):
+        return [
+            choices
+            for choices, blockers in self.state.rev_blockers.items()
+            if any(x is blocker for x, _key in blockers)
+        ]
+
+    def _culprits(self, conflicts):
+        """Return the planned facts responsible for conflicting pkgs and blockers.
+
+        Facts are (choices, pkg) pairs for planned pkgs, (choices, blocker)
+        pairs for blockers added by a choice and (None, atom) pairs for
+        atoms that failed to resolve, requiring them to remain unmatched.
+
+        :return: frozenset of facts, None if they can't be determined
+        """
+        culprits = set()
+        for x in conflicts:
+            if isinstance(x, restriction.base):
+                owners = self._blocker_owners(x)
+                if not owners:
+                    return None
+                culprits.update((choices, x) for choices in owners)
+            else:
+                choices = self.state.pkg_choices.get(x)
+                if choices is None:
+                    return None
+                culprits.add((choices, x))
+        return frozenset(culprits)
+
+    def _holds(self, culprits):
+        """Determine if all facts of a failure apply to the current plan."""
+        plan = self.state
+        for choices, x in culprits:
+            if choices is None:
+                if plan.match_atom(x):
+                    return False
+            elif isinstance(x, restriction.base):
+                if not any(b is x for b, _key in plan.rev_blockers.get(choices, ())):
+                    return False
+            elif plan.pkg_choices.get(x) is not choices:
+                return False
+        return True
+
+    def _doomed(self, stack, pkg):
+        """Return planned pkgs and blockers bound to make inserting a pkg fail.
+
+        Only conflicts that can't be resolved while processing the pkg's deps
+        are considered, i.e. ones that don't involve vdb pkgs which may be
+        replaced nor pkgs planned within the open frames of the stack which
+        may be backtracked over.
+        """
+        if not pkg.package_is_real:
+            return []
+        plan = self.state
+        open_choices = {
+            op.choices for op in plan[stack[0].start_point :] if op.choices is not None
+        }
+
+        def settled(choices):
+            return choices not in open_choices and not self.vdb_restrict.match(
+                choices.current_pkg
+            )
+
+        slots = plan.state
+        conflicts = [
+            x
+            for x in slots.check_limiters(pkg)
+            if (owners := self._blocker_owners(x)) and all(map(settled, owners))
+        ]
+        planned = slots.get_conflicting_slot(pkg)
+        if (
+            planned is not None
+            and planned != pkg
+            and planned.package_is_real
+            and not self.vdb_restrict.match(planned)
+            and plan.pkg_choices.get(planned) not in open_choices
+        ):
+            conflicts.append(planned)
+        return conflicts
+
+    def _record_solution(self, frame):
+        """Cache the ops added to the plan while resolving a frame's atom.
+
+        Contrary to failures solutions aren't bound to a plan state, the ops
+        are validated against the current state when they're replayed by
+        :meth:`_splice_solution`. Thus only solutions made of preferred
+        choices are cached, validating them can't tell if a choice that
+        failed before would succeed in the current state.
+        """
+        if not (frame.cacheable and frame.reusable) or frame.drop_cycles:
+            return
+        ops = self.state[frame.start_point :]
+        if all(isinstance(op, self._replayable_ops) for op in ops):
+            self._solutions[frame.atom, frame.dbs] = tuple(ops)
+
+    def _splice_solution(self, frame):
+        """Replay a cached solution for a frame's atom instead of resolving it.
+
+        Replaying stops at the first op that wouldn't have been added by
+        resolving the atom from scratch in the current plan state, e.g. a
+        dependency now satisfied by an already planned package.
+
+        :return: True if the solution was applied, False if there isn't one or
+            it doesn't apply to the current state which is left untouched
+        """
+        ops = self._solutions.get((frame.atom, frame.dbs))
+        if ops is None:
+            return False
+        plan = self.state
+        slots = plan.state
+        start = plan.current_state
+        for op in ops:
+            if isinstance(op, state.decref_forward_block_op):
+                # regenerated by the replace op removing the blocker's owner
+                continue
+            elif isinstance(op, state.add_backref_op):
+                if op.pkg not in slots:
+                    break
+            elif isinstance(op, state.replace_op):
+                if slots.get_conflicting_slot(op.pkg) is not op.old_pkg:
+                    break
+            elif isinstance(op, state.add_op):
+                if plan.match_atom(op.choices.atom) or (
+                    op.force and slots.get_conflicting_slot(op.pkg) is not None
+                ):
+                    break
+            if copy(op).apply(plan):
+                break
+        else:
+            return True
+        plan.backtrack(start)
+        return False
+
     def free_caches(self):
         for repo in self.all_raw_dbs:
             repo.clear()
+        self._solutions.clear()
+        self._failures.clear()
+        self._nogoods.clear()
 
     # selection strategies for atom matches
 
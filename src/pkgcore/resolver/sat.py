@@ -0,0 +1,537 @@
+"""
+boolean satisfiability based resolver
+
+:obj:`sat_merge_plan` is an alternative to the depth first search of
+:obj:`pkgcore.resolver.plan.merge_plan`. The matches of all requests and,
+transitively, of their dependencies are pulled from the resolver's caching
+repos up front and encoded as clauses:
+
+- a request needs one of its matches,
+- a package needs a match of one alternative of each ``||`` block of its deps,
+- a slot holds at most one package, installed packages keep theirs unless
+  replaced,
+- blocked packages can't be installed alongside their blocker,
+- packages failing their REQUIRED_USE can't be installed.
+
+The formula is solved by a small conflict driven clause learning solver.
+Decisions follow the resolver strategy's ordering of matches so the highest
+(or the installed, depending on the strategy) version is tried first just
+as the default resolver does. The resulting model is replayed as regular
+:obj:`pkgcore.resolver.state` ops, so anything consuming the plan state
+works unchanged.
+"""
+
+__all__ = ("Solver", "sat_merge_plan")
+
+from collections import deque
+
+from . import plan, state
+from .choice_point import choice_point
+
+
+class Solver:
+    """Conflict driven clause learning SAT solver.
+
+    Variables are positive integers, literals are signed variables as in the
+    DIMACS format. Decisions can be steered by a callable returning the
+    next literal to try, variables left unassigned by it are set false.
+    """
+
+    def __init__(self):
+        self.nvars = 0
+        self.clauses = []
+        self.conflicts = 0
+        self._watches = {}
+        self._values = [None]
+        self._levels = [0]
+        self._reasons = [None]
+        self._trail = []
+        self._trail_lim = []
+        self._qhead = 0
+        self._free = 1
+        self._unsat = False
+
+    def new_var(self):
+        """Allocate a new variable."""
+        self.nvars += 1
+        self._values.append(None)
+        self._levels.append(0)
+        self._reasons.append(None)
+        return self.nvars
+
+    def value(self, lit):
+        """Return the current truth value of a literal, None if unassigned."""
+        value = self._values[abs(lit)]
+        if value is None or lit > 0:
+            return value
+        return not value
+
+    def add_clause(self, lits):
+        """Add a clause, a disjunction of literals."""
+        self._backtrack(0)
+        clause = []
+        for lit in lits:
+            if -lit in clause:
+                return
+            value = self.value(lit)
+            if value:
+                return
+            elif value is None and lit not in clause:
+                clause.append(lit)
+        if not clause:
+            self._unsat = True
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+        else:
+            self._attach(clause)
+
+    def solve(self, assumptions=(), decide=None):
+        """Search for a model.
+
+        :param assumptions: literals forced true for this search only
+        :param decide: callable passed :meth:`value`, returning the next
+            literal to assign or None to fall back to setting variables false
+        :return: list mapping variables to their value, None if the clauses
+            can't be satisfied under the given assumptions
+        """
+        if self._unsat:
+            return None
+        self._backtrack(0)
+        while True:
+            confl = self._propagate()
+            if confl is not None:
+                self.conflicts += 1
+                if not self._trail_lim:
+                    self._unsat = True
+                    return None
+                learnt, level = self._analyze(confl)
+                self._backtrack(level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self._enqueue(learnt[0], self._attach(learnt))
+                continue
+
+            level = len(self._trail_lim)
+            if level < len(assumptions):
+                lit = assumptions[level]
+                value = self.value(lit)
+                if value is False:
+                    return None
+                self._trail_lim.append(len(self._trail))
+                if value is None:
+                    self._enqueue(lit, None)
+                continue
+
+            lit = decide(self.value) if decide is not None else None
+            if lit is None:
+                while self._free <= self.nvars and self._values[self._free] is not None:
+                    self._free += 1
+                if self._free > self.nvars:
+                    return list(self._values)
+                lit = -self._free
+            self._trail_lim.append(len(self._trail))
+            self._enqueue(lit, None)
+
+    def _attach(self, clause):
+        idx = len(self.clauses)
+        self.clauses.append(clause)
+        self._watches.setdefault(clause[0], []).append(idx)
+        self._watches.setdefault(clause[1], []).append(idx)
+        return idx
+
+    def _enqueue(self, lit, reason):
+        var = abs(lit)
+        self._values[var] = lit > 0
+        self._levels[var] = len(self._trail_lim)
+        self._reasons[var] = reason
+        self._trail.append(lit)
+
+    def _propagate(self):
+        """Propagate queued assignments, returning a conflicting clause if any."""
+        value = self.value
+        while self._qhead < len(self._trail):
+            false_lit = -self._trail[self._qhead]
+            self._qhead += 1
+            watchers = self._watches.get(false_lit)
+            if not watchers:
+                continue
+            kept = []
+            confl = None
+            for i, idx in enumerate(watchers):
+                clause = self.clauses[idx]
+                # keep the falsified watch in the second position
+                if clause[0] == false_lit:
+                    clause[0], clause[1] = clause[1], false_lit
+                if value(clause[0]):
+                    kept.append(idx)
+                    continue
+                for k in range(2, len(clause)):
+                    if value(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], false_lit
+                        self._watches.setdefault(clause[1], []).append(idx)
+                        break
+                else:
+                    kept.append(idx)
+                    if value(clause[0]) is False:
+                        kept.extend(watchers[i + 1 :])
+                        confl = idx
+                        break
+                    self._enqueue(clause[0], idx)
+            self._watches[false_lit] = kept
+            if confl is not None:
+                return confl
+        return None
+
+    def _analyze(self, confl):
+        """Derive the first UIP clause of a conflict and its backjump level."""
+        level = len(self._trail_lim)
+        seen = set()
+        learnt = [None]
+        pending = 0
+        lit = None
+        idx = len(self._trail)
+        clause = self.clauses[confl]
+        while True:
+            for q in clause:
+                var = abs(q)
+                # reason clauses start with the literal they implied
+                if q == lit or var in seen or not self._levels[var]:
+                    continue
+                seen.add(var)
+                if self._levels[var] == level:
+                    pending += 1
+                else:
+                    learnt.append(q)
+            while True:
+                idx -= 1
+                lit = self._trail[idx]
+                if abs(lit) in seen:
+                    break
+            pending -= 1
+            if not pending:
+                break
+            clause = self.clauses[self._reasons[abs(lit)]]
+        learnt[0] = -lit
+
+        if len(learnt) == 1:
+            return learnt, 0
+        # the second watch has to be the literal unassigned last on backjumping
+        highest = max(range(1, len(learnt)), key=lambda i: self._levels[abs(learnt[i])])
+        learnt[1], learnt[highest] = learnt[highest], learnt[1]
+        return learnt, self._levels[abs(learnt[1])]
+
+    def _backtrack(self, level):
+        if len(self._trail_lim) <= level:
+            return
+        start = self._trail_lim[level]
+        for lit in self._trail[start:]:
+            var = abs(lit)
+            self._values[var] = None
+            self._reasons[var] = None
+        del self._trail[start:]
+        del self._trail_lim[level:]
+        self._qhead = start
+        self._free = 1
+
+
+class _formula:
+    """CNF encoding of the packages reachable from a set of requests."""
+
+    def __init__(self, resolver, requests, preload=()):
+        self.resolver = resolver
+        self.solver = Solver()
+        self._vars = {}
+        self._pkgs = {}
+        self._choices = {}
+        self._keys = {}
+        self._deps = {}
+        self._blockers = {}
+        self._matches = {}
+        self._preferences = []
+        self._queue = deque()
+
+        self.preloaded = [self._expand(pkg, pkg.versioned_atom) for pkg in preload]
+        self._preferences.extend((None, [x]) for x in self.preloaded)
+        self.restricts = list(requests)
+        self.requests = []
+        for restrict in requests:
+            selector = self.solver.new_var()
+            lits = [self._expand(pkg, restrict) for pkg in self.matches(restrict)]
+            self.solver.add_clause([-selector] + lits)
+            self._preferences.append((selector, lits))
+            self.requests.append((selector, lits))
+        while self._queue:
+            self._encode_deps(self._queue.popleft())
+        self._encode_slots()
+        self._encode_blockers()
+
+    def matches(self, restrict):
+        """Return the matches of a restriction in resolver strategy order."""
+        l = self._matches.get(restrict)
+        if l is None:
+            l = self._matches[restrict] = list(
+                self.resolver.default_dbs.itermatch(restrict)
+            )
+        return l
+
+    def var(self, pkg, restrict=None):
+        """Return the variable for a package, allocating it if needed."""
+        key = (pkg, pkg.repo)
+        var = self._vars.get(key)
+        if var is not None:
+            return var
+        var = self._vars[key] = self.solver.new_var()
+        self._pkgs[var] = pkg
+        if restrict is None:
+            restrict = pkg.slotted_atom
+        self._choices[var] = choice_point(restrict, [pkg])
+        self._keys.setdefault(pkg.key, []).append(var)
+        if not pkg.repo.livefs:
+            if not self._required_use_satisfied(pkg):
+                self.solver.add_clause([-var])
+            # installed packages in the slot are replaced by it
+            for installed in self.resolver.livefs_dbs.itermatch(pkg.slotted_atom):
+                self.var(installed)
+        return var
+
+    def _expand(self, pkg, restrict):
+        var = self.var(pkg, restrict)
+        if var not in self._deps:
+            self._deps[var] = []
+            self._queue.append(var)
+        return var
+
+    @staticmethod
+    def _required_use_satisfied(pkg):
+        eapi = getattr(pkg, "eapi", None)
+        if eapi is None or not eapi.options.has_required_use:
+            return True
+        try:
+            required_use = pkg.required_use
+            use = pkg.use
+        except AttributeError:
+            return True
+        if getattr(required_use, "has_conditionals", False):
+            required_use = required_use.evaluate_depset(use)
+        return all(node.match(use) for node in required_use)
+
+    def _encode_deps(self, var):
+        pkg = self._pkgs[var]
+        choices = self._choices[var]
+        resolver = self.resolver
+        modes = ("rdepend", "idepend", "pdepend")
+        if not pkg.built or resolver.process_built_depends:
+            modes = ("depend", "bdepend") + modes
+        deps = self._deps[var]
+        for mode in modes:
+            depset = getattr(pkg, mode).cnf_solutions()
+            for or_block in resolver.depset_reorder(depset, mode):
+                lits = []
+                for atom in or_block:
+                    if atom.blocks:
+                        blocker = self.solver.new_var()
+                        self._blockers[blocker] = (
+                            resolver.generate_mangled_blocker(choices, atom),
+                            atom.key,
+                        )
+                        for installed in resolver.livefs_dbs.itermatch(atom):
+                            self.var(installed)
+                        lits.append(blocker)
+                    else:
+                        lits.extend(self._expand(x, atom) for x in self.matches(atom))
+                self.solver.add_clause([-var] + lits)
+                self._preferences.append((var, lits))
+                deps.append((mode, lits))
+
+    def _encode_slots(self):
+        self._slots = {}
+        for var, pkg in self._pkgs.items():
+            self._slots.setdefault((pkg.key, pkg.slot), []).append(var)
+        for slotted in self._slots.values():
+            for i, var in enumerate(slotted):
+                for other in slotted[i + 1 :]:
+                    self.solver.add_clause([-var, -other])
+            installed = [x for x in slotted if self._pkgs[x].repo.livefs]
+            if installed:
+                # installed slots stay filled, preferably by what's there
+                lits = installed + [x for x in slotted if x not in installed]
+                self.solver.add_clause(lits)
+                self._preferences.append((None, lits))
+
+    def _encode_blockers(self):
+        for blocker_var, (blocker, key) in self._blockers.items():
+            for var in self._keys.get(key, ()):
+                if blocker.match(self._pkgs[var]):
+                    self.solver.add_clause([-blocker_var, -var])
+
+    def _decide(self, value):
+        for guard, lits in self._preferences:
+            if guard is not None and not value(guard):
+                continue
+            candidate = None
+            for lit in lits:
+                satisfied = value(lit)
+                if satisfied:
+                    break
+                elif satisfied is None and candidate is None:
+                    candidate = lit
+            else:
+                if candidate is not None:
+                    return candidate
+        return None
+
+    def solve(self, assumptions=()):
+        return self.solver.solve(assumptions, self._decide)
+
+    def install_order(self, model):
+        """Yield packages to install in dependency order.
+
+        Each package comes with its choices, the blockers it adds and the
+        installed package and choices it replaces, if any.
+        """
+        order = []
+        seen = set()
+
+        def visit(var):
+            if var in seen:
+                return
+            seen.add(var)
+            blockers = []
+            post = []
+            for mode, lits in self._deps.get(var, ()):
+                lit = next(x for x in lits if model[x])
+                if lit in self._blockers:
+                    blockers.append(self._blockers[lit])
+                elif mode == "pdepend":
+                    post.append(lit)
+                else:
+                    visit(lit)
+            order.append((var, blockers))
+            for lit in post:
+                visit(lit)
+
+        for var in self.preloaded:
+            visit(var)
+        for _selector, lits in self.requests:
+            visit(next(x for x in lits if model[x]))
+
+        for var, blockers in order:
+            pkg = self._pkgs[var]
+            replaced = None
+            if not pkg.repo.livefs:
+                for other in self._slots[(pkg.key, pkg.slot)]:
+                    if not model[other] and self._pkgs[other].repo.livefs:
+                        replaced = (self._pkgs[other], self._choices[other])
+            yield pkg, self._choices[var], blockers, replaced
+
+    def explain(self, idx):
+        """Return the events describing why a request can't be satisfied.
+
+        :param idx: index of the first request that fails when added to the
+            ones before it
+        """
+        events = []
+        for lit in self.requests[idx][1]:
+            pkg = self._pkgs[lit]
+            events.append(("inspecting", pkg))
+            if self.solve([lit]) is None:
+                msg = "dependencies can't be satisfied"
+            else:
+                msg = "conflicts with %s" % ", ".join(
+                    str(restrict) for restrict in self.restricts[:idx]
+                )
+            events.append(("choice", str(pkg), False, msg))
+        return events
+
+    @property
+    def stats(self):
+        return (self.solver.nvars, len(self.solver.clauses), self.solver.conflicts)
+
+
+class sat_merge_plan(plan.merge_plan):
+    """Resolver solving the complete dependency graph as a boolean formula.
+
+    Takes the same arguments as :obj:`pkgcore.resolver.plan.merge_plan`,
+    cycle dropping is irrelevant since dependency cycles don't make a
+    formula unsatisfiable. All requests are solved again on every call to
+    :meth:`add_atoms`.
+    """
+
+    def load_vdb_state(self):
+        self.vdb_preloaded = True
+        self._ensure_livefs_is_loaded = self._ensure_livefs_is_loaded_preloaded
+        ret = self._resolve(self._requests())
+        if ret:
+            raise Exception("couldn't load vdb state, %s" % (ret[0],))
+
+    def add_atoms(self, restricts, finalize=False):
+        if restricts:
+            ret = self._resolve(self._requests() + list(restricts))
+            if ret:
+                return ret
+        if finalize:
+            self.process_finalize()
+        return ()
+
+    def _requests(self):
+        return [
+            op.restriction
+            for op in self.state.plan
+            if isinstance(op, state.add_hardref_op)
+        ]
+
+    def _resolve(self, restricts):
+        self.state.backtrack(0)
+        preload = list(self.livefs_dbs) if self.vdb_preloaded else ()
+        formula = _formula(self, restricts, preload)
+        for restrict in restricts:
+            state.add_hardref_op(restrict).apply(self.state)
+
+        model = formula.solve([x for x, _lits in formula.requests])
+        self._dprint("sat: %i vars, %i clauses, %i conflicts", formula.stats, "sat")
+        if model is None:
+            return self._failure(formula, restricts)
+
+        for pkg, choices, blockers, replaced in formula.install_order(model):
+            if replaced is not None:
+                old_pkg, old_choices = replaced
+                state.add_op(old_choices, old_pkg, force=True).apply(self.state)
+                op = state.replace_op(choices, pkg)
+            else:
+                op = state.add_op(choices, pkg)
+            if l := op.apply(self.state):
+                raise Exception(f"internal error, {op} conflicts with {l}")
+            for blocker, key in blockers:
+                if l := self.state.add_blocker(choices, blocker, key=key):
+                    raise Exception(f"internal error, {blocker} blocks {l}")
+        return ()
+
+    def _failure(self, formula, restricts):
+        selectors = [x for x, _lits in formula.requests]
+        idx = next(
+            (
+                i
+                for i in range(len(selectors))
+                if formula.solve(selectors[: i + 1]) is None
+            ),
+            None,
+        )
+        if idx is None:
+            raise Exception("installed packages can't be resolved")
+        restrict = restricts[idx]
+        stack = plan.resolver_stack()
+        stack.add_frame(
+            "none",
+            restrict,
+            choice_point(restrict, formula.matches(restrict)),
+            self.default_dbs,
+            0,
+            False,
+        )
+        if not formula.matches(restrict):
+            self.notify_viable(stack, restrict, False, "no matches")
+        for event in formula.explain(idx):
+            stack.add_event(event)
+        stack.pop_frame(False)
+        return [restrict], stack.events[-1]
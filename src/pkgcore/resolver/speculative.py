@@ -0,0 +1,232 @@
+"""
+speculative parallel resolution of independent requests
+
+Requests are partitioned into groups whose dependency closures, following
+the packages the resolver prefers for each dependency, don't share any
+package key. Each group is resolved by forked worker processes against
+their copy of the resolver's plan state; the ops they add are shipped back
+as a log referencing packages by index and replayed into the real plan
+state. Replaying validates each op like a serial resolution would, groups
+that fail or conflict are left for the caller to resolve serially.
+"""
+
+__all__ = ("speculation", "resolve")
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from snakeoil.sequences import iflatten_instance
+
+from ..ebuild.atom import atom
+from . import state
+from .choice_point import choice_point
+
+# per worker process speculation, set by _worker_init()
+_worker_state = None
+
+
+def _worker_init(speculation):
+    global _worker_state
+    _worker_state = speculation
+
+
+def _resolve_group(idx):
+    """Resolve a group of requests in a worker, returning its op log."""
+    speculation = _worker_state
+    plan_state = speculation.resolver.state
+    start = plan_state.current_state
+    try:
+        if speculation.resolver._add_restricts(speculation.groups[idx]):
+            return None
+        return speculation.export(start)
+    finally:
+        plan_state.backtrack(start)
+
+
+class speculation:
+    """Requests of a resolver partitioned into independent groups.
+
+    :ivar groups: lists of requests, in order of their first request
+    :ivar pkgs: the preferred packages the groups can pull in, op logs
+        reference packages by their index
+    """
+
+    _op_kinds = {
+        state.add_op: "add",
+        state.add_backref_op: "backref",
+        state.replace_op: "replace",
+        state.incref_forward_block_op: "incref",
+        state.decref_forward_block_op: "decref",
+    }
+    _op_kls = {v: k for k, v in _op_kinds.items()}
+    _dep_attrs = ("depend", "bdepend", "rdepend", "idepend", "pdepend")
+
+    def __init__(self, resolver, restricts):
+        self.resolver = resolver
+        self.pkgs = []
+        self._index = {}
+        self._parents = {}
+        self.groups = self._partition(restricts)
+
+    def _find(self, key):
+        parents = self._parents
+        while parents[key] != key:
+            parents[key] = parents[parents[key]]
+            key = parents[key]
+        return key
+
+    def _union(self, key1, key2):
+        self._parents[self._find(key1)] = self._find(key2)
+
+    def _add_key(self, key):
+        self._parents.setdefault(key, key)
+
+    def _preferred(self, restrict):
+        """Yield the packages tried first for a restriction.
+
+        That's the first match in the resolver's strategy order along with
+        the first installed match, used by vdb limited resolution.
+        """
+        for dbs in (self.resolver.default_dbs, self.resolver.livefs_dbs):
+            for pkg in dbs.itermatch(restrict):
+                yield pkg
+                break
+
+    def _walk(self, restrict):
+        """Add the dependency closure of the packages preferred for a restriction.
+
+        Only the preferred packages of each dependency are followed instead
+        of all their versions. Ops involving other candidates reference
+        packages missing from the index, so their groups are left for serial
+        resolution.
+
+        :return: key of the package preferred for the restriction, None if
+            nothing matches
+        """
+        root = None
+        pending = [restrict]
+        seen = {restrict}
+        while pending:
+            restrict = pending.pop()
+            for pkg in self._preferred(restrict):
+                if root is None:
+                    root = pkg.key
+                self._add_key(pkg.key)
+                if (pkg, pkg.repo) in self._index:
+                    continue
+                self._index[(pkg, pkg.repo)] = len(self.pkgs)
+                self.pkgs.append(pkg)
+                for attr in self._dep_attrs:
+                    for dep in iflatten_instance(getattr(pkg, attr), atom):
+                        self._add_key(dep.key)
+                        self._union(pkg.key, dep.key)
+                        # blocked packages aren't pulled in
+                        if not dep.blocks and dep not in seen:
+                            seen.add(dep)
+                            pending.append(dep)
+        return root
+
+    def _partition(self, restricts):
+        roots = [self._walk(restrict) for restrict in restricts]
+        groups = {}
+        for idx, (restrict, root) in enumerate(zip(restricts, roots)):
+            # unresolvable requests are left on their own
+            root = idx if root is None else self._find(root)
+            groups.setdefault(root, []).append(restrict)
+        return list(groups.values())
+
+    def _pkg_index(self, pkg):
+        return self._index.get((pkg, pkg.repo))
+
+    def export(self, start):
+        """Return a log of the plan state ops added since a given state.
+
+        None is returned if the ops reference packages unknown to the
+        speculation.
+        """
+        log = []
+        choices = {}
+        for op in self.resolver.state.plan[start:]:
+            kind = self._op_kinds.get(type(op))
+            if kind is None:
+                return None
+            idx = choices.get(op.choices)
+            if idx is None:
+                try:
+                    pkg = self._pkg_index(op.choices.current_pkg)
+                except IndexError:
+                    pkg = None
+                if pkg is None:
+                    return None
+                idx = choices[op.choices] = len(choices)
+                log.append(("choices", op.choices.atom, pkg))
+            if isinstance(op, state.blocker_base_op):
+                log.append((kind, idx, op.blocker, op.key))
+            else:
+                pkg = self._pkg_index(op.pkg)
+                if pkg is None:
+                    return None
+                log.append((kind, idx, pkg, op.force))
+        return log
+
+    def replay(self, log):
+        """Apply an op log to the resolver's plan state.
+
+        :return: True if all ops applied, else False with the state left
+            unmodified
+        """
+        plan_state = self.resolver.state
+        start = plan_state.current_state
+        choices = []
+        for kind, *args in log:
+            if kind == "choices":
+                restrict, pkg = args
+                choices.append(choice_point(restrict, [self.pkgs[pkg]]))
+                continue
+            op_kls = self._op_kls[kind]
+            if issubclass(op_kls, state.blocker_base_op):
+                idx, blocker, key = args
+                op = op_kls(choices[idx], blocker, key)
+            else:
+                idx, pkg, force = args
+                op = op_kls(choices[idx], self.pkgs[pkg], force=force)
+            if op.apply(plan_state):
+                plan_state.backtrack(start)
+                return False
+        return True
+
+
+def resolve(resolver, restricts, jobs):
+    """Resolve independent groups of requests in parallel.
+
+    :param resolver: :obj:`pkgcore.resolver.plan.merge_plan` instance, the
+        requests' hardrefs must already be applied
+    :param jobs: maximum number of worker processes
+    :return: list of the requests left for serial resolution, either since
+        their group failed to resolve or conflicted with the plan state
+    """
+    spec = speculation(resolver, restricts)
+    if len(spec.groups) < 2:
+        return restricts
+    executor = ProcessPoolExecutor(
+        max_workers=min(jobs, len(spec.groups)),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_worker_init,
+        initargs=(spec,),
+    )
+    serial = []
+    try:
+        futures = [
+            executor.submit(_resolve_group, idx) for idx in range(len(spec.groups))
+        ]
+        for group, future in zip(spec.groups, futures):
+            try:
+                log = future.result()
+            except Exception:
+                # unpicklable results or a broken worker
+                log = None
+            if log is None or not spec.replay(log):
+                serial.extend(group)
+    finally:
+        executor.shutdown(cancel_futures=True)
+    return sorted(serial, key=restricts.index)
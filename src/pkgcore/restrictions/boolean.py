@@ -148,6 +148,84 @@ class base(restriction.base, metaclass=generic_equality):
 
     force_False, force_True = match, match
 
+    @property
+    def cost(self):
+        return sum(r.cost for r in self.restrictions)
+
+    @staticmethod
+    def _combined_ratio(restricts, conjunction):
+        """Estimate the fraction of candidates matching all or any restrictions."""
+        ratio = 1.0
+        if conjunction:
+            for r in restricts:
+                ratio *= r.selectivity
+            return ratio
+        for r in restricts:
+            ratio *= 1 - r.selectivity
+        return 1 - ratio
+
+    def _compile_children(self, decisive):
+        """Compile the children of an and/or grouping.
+
+        Nested non-negated groupings of the same kind are flattened and
+        restrictions supporting it are combined so each attribute is fetched
+        once per match. Children are ordered by their cost relative to the
+        chance of them deciding the result, so cheap and selective checks
+        run first.
+
+        :param decisive: child result deciding the grouping's result, False
+            for and, True for or
+        :return: tuple of compiled children or None if a constant child
+            decides the result
+        """
+        kls = type(self)
+        groups, shared = [], {}
+        stack = [iter(self.restrictions)]
+        while stack:
+            for r in stack[-1]:
+                if (
+                    isinstance(r, kls)
+                    and type(r).match is kls.match
+                    and not r.negate
+                    and isinstance(r.restrictions, tuple)
+                ):
+                    stack.append(iter(r.restrictions))
+                    break
+                elif isinstance(r, restriction.AlwaysBool):
+                    if r.negate == decisive:
+                        return None
+                    continue
+                attr = getattr(r, "_compile_attr", None)
+                if attr is None:
+                    groups.append([r])
+                elif attr in shared:
+                    shared[attr].append(r)
+                else:
+                    groups.append(shared.setdefault(attr, [r]))
+            else:
+                stack.pop()
+
+        conjunction = not decisive
+
+        def rank(restricts):
+            ratio = self._combined_ratio(restricts, conjunction)
+            # chance of the child deciding the result
+            ratio = 1 - ratio if conjunction else ratio
+            cost = sum(r.cost for r in restricts)
+            return cost / ratio if ratio > 0 else float("inf")
+
+        groups.sort(key=rank)
+        return tuple(
+            r[0].compile() if len(r) == 1 else r[0]._compile_shared(r, conjunction)
+            for r in groups
+        )
+
+    def _compile_constant(self, result):
+        def match(vals):
+            return result
+
+        return match
+
     def dnf_solutions(self, full_solution_expansion=False):
         raise NotImplementedError()
 
@@ -278,12 +356,36 @@ class AndRestriction(base):
 
     _evaluate_collapsible = True
 
+    @property
+    def _match_ratio(self):
+        return self._combined_ratio(self.restrictions, True)
+
     def match(self, vals):
         for rest in self.restrictions:
             if not rest.match(vals):
                 return self.negate
         return not self.negate
 
+    def _compile(self):
+        if type(self).match is not AndRestriction.match or not isinstance(
+            self.restrictions, tuple
+        ):
+            return self.match
+        negate = self.negate
+        funcs = self._compile_children(False)
+        if funcs is None:
+            return self._compile_constant(negate)
+        elif len(funcs) == 1 and not negate:
+            return funcs[0]
+
+        def match(vals):
+            for func in funcs:
+                if not func(vals):
+                    return negate
+            return not negate
+
+        return match
+
     def force_True(self, pkg, *vals):
         pvals = [pkg]
         pvals.extend(vals)
@@ -453,12 +555,36 @@ class OrRestriction(base):
 
     _evaluate_collapsible = True
 
+    @property
+    def _match_ratio(self):
+        return self._combined_ratio(self.restrictions, False)
+
     def match(self, vals):
         for rest in self.restrictions:
             if rest.match(vals):
                 return not self.negate
         return self.negate
 
+    def _compile(self):
+        if type(self).match is not OrRestriction.match or not isinstance(
+            self.restrictions, tuple
+        ):
+            return self.match
+        negate = self.negate
+        funcs = self._compile_children(True)
+        if funcs is None:
+            return self._compile_constant(not negate)
+        elif len(funcs) == 1 and not negate:
+            return funcs[0]
+
+        def match(vals):
+            for func in funcs:
+                if func(vals):
+                    return not negate
+            return negate
+
+        return match
+
     def cnf_solutions(self, full_solution_expansion=False):
         """Returns a list in CNF (conjunctive normalized form) of this instance.
 
@@ -9,6 +9,25 @@ from snakeoil.klass import generic_equality, static_attrgetter
 from ..log import logger
 from . import boolean, restriction
 
+# package attributes available without loading metadata
+cpv_attrs = frozenset(
+    [
+        "category",
+        "package",
+        "key",
+        "cpvstr",
+        "version",
+        "revision",
+        "fullver",
+        "unversioned_atom",
+        "versioned_atom",
+        "repo",
+        "repo.repo_id",
+    ]
+)
+# relative cost of pulling an attribute requiring metadata
+metadata_attr_cost = 16
+
 
 class PackageRestriction(restriction.base, metaclass=generic_equality):
     """Package data restriction."""
@@ -71,6 +90,90 @@ class PackageRestriction(restriction.base, metaclass=generic_equality):
             return self.negate
         return self.restriction.match(attr) != self.negate
 
+    @property
+    def cost(self):
+        attr_cost = sum(
+            1 if attr in cpv_attrs else metadata_attr_cost for attr in self.attrs
+        )
+        return attr_cost + self.restriction.cost
+
+    @property
+    def _match_ratio(self):
+        return self.restriction.selectivity
+
+    @property
+    def _compile_attr(self):
+        """Attribute fetched by the compiled form, None if it can't be shared."""
+        kls = type(self)
+        if (
+            kls.match is not PackageRestriction.match
+            or kls._pull_attr is not PackageRestriction._pull_attr
+        ):
+            return None
+        return self.attr
+
+    def _compile(self):
+        if self._compile_attr is None:
+            return super()._compile()
+        return self._compile_shared((self,), True)
+
+    @staticmethod
+    def _compile_shared(restricts, conjunction):
+        """Compile restrictions on the same attribute, fetching it once.
+
+        :param restricts: restrictions sharing a :attr:`_compile_attr`
+        :param conjunction: whether all or any of the restrictions must match
+        """
+        pull_attr = restricts[0]._pull_attr_func
+        checks = tuple((r.restriction.compile(), r.negate) for r in restricts)
+
+        def fallback(pkg):
+            # leave handling the failure to the regular matching
+            results = (r.match(pkg) for r in restricts)
+            return all(results) if conjunction else any(results)
+
+        if len(checks) == 1:
+            ((value_match, negate),) = checks
+
+            def match(pkg):
+                try:
+                    attr = pull_attr(pkg)
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception:
+                    return fallback(pkg)
+                return value_match(attr) != negate
+
+        elif conjunction:
+
+            def match(pkg):
+                try:
+                    attr = pull_attr(pkg)
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception:
+                    return fallback(pkg)
+                for value_match, negate in checks:
+                    if value_match(attr) == negate:
+                        return False
+                return True
+
+        else:
+
+            def match(pkg):
+                try:
+                    attr = pull_attr(pkg)
+                except IGNORED_EXCEPTIONS:
+                    raise
+                except Exception:
+                    return fallback(pkg)
+                for value_match, negate in checks:
+                    if value_match(attr) != negate:
+                        return True
+                return False
+
+        return match
+
     def _handle_exception(self, pkg, exc, attr_split):
         if isinstance(exc, AttributeError):
             if not self.ignore_missing:
@@ -18,14 +18,52 @@ class base(klass.SlotsPicklingMixin, metaclass=caching.WeakInstMeta):
     __inst_caching__ = True
 
     # __weakref__ here is implicit via the metaclass
-    __slots__ = ()
+    __slots__ = ("_compiled",)
     package_matching = False
 
+    # relative cost of a match and the estimated fraction of candidates
+    # matching when not negated, boolean restrictions evaluate their children
+    # in the order these suggest
+    cost = 4
+    _match_ratio = 0.5
+
     klass.inject_immutable_instance(locals())
 
     def match(self, *arg, **kwargs):
         raise NotImplementedError
 
+    def compile(self):
+        """Return a callable equivalent to :meth:`match`.
+
+        Derivatives specialize it via :meth:`_compile`, e.g. flattening
+        nested restrictions into closures with negation folded in. The result
+        is built once per instance.
+        """
+        try:
+            return self._compiled
+        except AttributeError:
+            pass
+        func = self._compile()
+        # bound methods of the instance aren't stored to avoid reference cycles
+        if getattr(func, "__self__", None) is not self:
+            object.__setattr__(self, "_compiled", func)
+        return func
+
+    def _compile(self):
+        return self.match
+
+    @property
+    def selectivity(self):
+        """Estimated fraction of candidates matching."""
+        if getattr(self, "negate", False):
+            return 1 - self._match_ratio
+        return self._match_ratio
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop("_compiled", None)
+        return state
+
     def force_False(self, *arg, **kwargs):
         return not self.match(*arg, **kwargs)
 
@@ -42,6 +80,8 @@ class AlwaysBool(base):
     __slots__ = ("type", "negate")
 
     __inst_caching__ = True
+    cost = 0
+    _match_ratio = 0.0
 
     def __init__(self, node_type=None, negate=False):
         """
@@ -56,6 +96,14 @@ class AlwaysBool(base):
     def match(self, *a, **kw):
         return self.negate
 
+    def _compile(self):
+        result = self.negate
+
+        def match(*a, **kw):
+            return result
+
+        return match
+
     def force_True(self, *a, **kw):
         return self.negate
 
@@ -98,6 +146,22 @@ class Negate(base):
     def match(self, *a, **kw):
         return not self._restrict.match(*a, **kw)
 
+    @property
+    def cost(self):
+        return self._restrict.cost
+
+    @property
+    def selectivity(self):
+        return 1 - self._restrict.selectivity
+
+    def _compile(self):
+        restrict_match = self._restrict.compile()
+
+        def match(*a, **kw):
+            return not restrict_match(*a, **kw)
+
+        return match
+
     def __str__(self):
         return "not (%s)" % self._restrict
 
@@ -121,6 +185,17 @@ class FakeType(base):
     def match(self, *a, **kw):
         return self._restrict.match(*a, **kw)
 
+    @property
+    def cost(self):
+        return self._restrict.cost
+
+    @property
+    def selectivity(self):
+        return self._restrict.selectivity
+
+    def _compile(self):
+        return self._restrict.compile()
+
     def __str__(self):
         return f"Faked type({self.type}): {self._restrict}"
 
@@ -156,6 +231,17 @@ class AnyMatch(base):
         return f"<{self.__class__.__name__} restriction={self.restriction!r} @{id(self):#8x}>"
 
 
+def compile_match(restrict):
+    """Return a match callable for a restriction.
+
+    Uses :meth:`base.compile` if available, falling back to the ``match``
+    method of restriction-like objects not deriving from :obj:`base`.
+    """
+    if (compile := getattr(restrict, "compile", None)) is None:
+        return restrict.match
+    return compile()
+
+
 def curry_node_type(cls, node_type, extradoc=None):
     """Helper function for creating restrictions of a certain type.
 
@@ -79,6 +79,7 @@ class StrRegex(base, metaclass=hashed_base):
 
     __slots__ = ("_hash", "flags", "regex", "_matchfunc", "ismatch", "negate")
     __inst_caching__ = True
+    cost = 8
 
     def __init__(self, regex, case_sensitive=True, match=False, negate=False):
         """
@@ -143,6 +144,8 @@ class StrExactMatch(base, metaclass=generic_equality):
 
     __slots__ = __attr_comparison__ = ("_hash", "exact", "case_sensitive", "negate")
     __inst_caching__ = True
+    cost = 1
+    _match_ratio = 0.1
 
     def __init__(self, exact, case_sensitive=True, negate=False):
         """
@@ -167,6 +170,18 @@ class StrExactMatch(base, metaclass=generic_equality):
         else:
             return (self.exact == value.lower()) != self.negate
 
+    def _compile(self):
+        if type(self).match is not StrExactMatch.match or not self.case_sensitive:
+            return self.match
+        exact, negate = self.exact, self.negate
+
+        def match(value):
+            if value.__class__ is not str:
+                value = str(value)
+            return (exact == value) != negate
+
+        return match
+
     def intersect(self, other):
         s1, s2 = self.exact, other.exact
         if other.case_sensitive and not self.case_sensitive:
@@ -198,6 +213,8 @@ class StrGlobMatch(base, metaclass=hashed_base):
     """globbing matches; essentially startswith and endswith matches"""
 
     __slots__ = ("_hash", "glob", "prefix", "negate", "flags")
+    cost = 2
+    _match_ratio = 0.2
     __inst_caching__ = True
 
     def __init__(self, glob, case_sensitive=True, prefix=True, negate=False):
@@ -258,6 +275,8 @@ class StrGlobMatch(base, metaclass=hashed_base):
 class EqualityMatch(base, metaclass=generic_equality):
     __slots__ = ("negate", "data")
     __attr_comparison__ = __slots__
+    cost = 1
+    _match_ratio = 0.1
 
     def __init__(self, data, negate=False):
         """
@@ -293,6 +312,8 @@ class ContainmentMatch(base, metaclass=hashed_base):
 
     __slots__ = ("_hash", "vals", "all", "negate")
     __inst_caching__ = True
+    cost = 2
+    _match_ratio = 0.3
 
     def __init__(self, vals, match_all=False, negate=False):
         """
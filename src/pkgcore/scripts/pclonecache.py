@@ -32,6 +32,14 @@ def main(options, out, err):
         )
 
     source, target = options.source, options.target
+    if hasattr(target, "clone"):
+        # backends such as packed caches can copy serialized entries directly
+        start = time.time()
+        target.clone(source)
+        if options.verbosity > 0:
+            out.write("took %i seconds" % int(time.time() - start))
+        return
+
     if not target.autocommits:
         target.sync_rate = 1000
     if options.verbosity > 0:
@@ -53,6 +61,7 @@ def main(options, out, err):
             if options.verbosity > 0:
                 out.write(f"deleting {x}")
             del target[x]
+    target.commit()
 
     if options.verbosity > 0:
         out.write("took %i seconds" % int(time.time() - start))
@@ -281,6 +281,25 @@ class eclass_usage_kls(histo_data):
     summary_format = "eclass: %(key)r %(val)s pkgs found, %(percent)s of all repos"
 
     def get_data(self, repo, options):
+        if hasattr(getattr(repo, "package_class", None), "validated_caches"):
+            pkgs = list(repo)
+            valid, stale = repo.package_class.validated_caches(pkgs)
+            cache_cpvs = defaultdict(set)
+            for cpv, cache in valid.items():
+                cache_cpvs[cache].add(cpv)
+            data = defaultdict(lambda: 0)
+            # use the eclass index of the caches for packages with valid entries
+            for cache, cpvs in cache_cpvs.items():
+                for eclass, consumers in cache.eclass_index().items():
+                    # corrupted entries are never valid
+                    if eclass is not None:
+                        data[eclass] += len(cpvs.intersection(consumers))
+            for pkg in pkgs:
+                if pkg.cpvstr in stale:
+                    for eclass in getattr(pkg, "inherited", ()):
+                        data[eclass] += 1
+            return {k: v for k, v in data.items() if v}, len(pkgs)
+
         pos, data = 0, defaultdict(lambda: 0)
         for pos, pkg in enumerate(repo):
             for eclass in getattr(pkg, "inherited", ()):
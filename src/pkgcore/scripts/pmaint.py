@@ -5,6 +5,7 @@ import logging
 import os
 import textwrap
 import time
+from functools import partial
 from multiprocessing import cpu_count
 
 from snakeoil.cli import arghparse
@@ -15,7 +16,7 @@ from snakeoil.sequences import iter_stable_unique
 
 from ..cache.flat_hash import md5_cache
 from ..ebuild import repository as ebuild_repo
-from ..ebuild import triggers
+from ..ebuild import processor, processor_pool, triggers
 from ..ebuild.cpv import CPV
 from ..ebuild.eclass import EclassDoc
 from ..exceptions import PkgcoreUserException
@@ -23,6 +24,7 @@ from ..fs import contents, livefs
 from ..merge import triggers as merge_triggers
 from ..operations import OperationError
 from ..operations import observer as observer_mod
+from ..operations import regen as regen_ops
 from ..package import mutated
 from ..package.errors import MetadataException
 from ..util import commandline
@@ -337,12 +339,62 @@ regen_opts.add_argument(
         available processors.
     """,
 )
+regen_opts.add_argument(
+    "--use-processes",
+    dest="processes",
+    action="store_true",
+    default=False,
+    help="run regen workers as processes instead of threads",
+    docs="""
+        Run the workers requested via --threads as separate processes, each
+        with its own ebuild processor, instead of threads. Metadata parsing
+        and hashing then scale with the number of workers instead of being
+        serialized by the GIL; finished entries are written to the cache by
+        the main process.
+    """,
+)
+regen_opts.add_argument(
+    "--max-idle-processors",
+    type=partial(arghparse.bounded_int, lambda n: n >= 0, ">= 0"),
+    metavar="NUM",
+    help="maximum number of idle ebuild processors kept for reuse",
+    docs="""
+        Maximum number of idle ebuild processors kept around for reuse,
+        defaults to no limit. Processors are routed packages by the eclasses
+        they have preloaded, so keeping more of them around avoids sourcing
+        eclasses again at the cost of memory; the least recently used ones
+        are shut down first.
+    """,
+)
+regen_opts.add_argument(
+    "--processor-idle-timeout",
+    type=arghparse.positive_int,
+    metavar="SECONDS",
+    help="shut down ebuild processors idle for longer than the given time",
+)
 regen_opts.add_argument(
     "--force",
     action="store_true",
     default=False,
     help="force regeneration to occur regardless of staleness checks or repo settings",
 )
+regen_opts.add_argument(
+    "--incremental",
+    action="store_true",
+    default=False,
+    help="only regenerate packages affected by changes since the last incremental regen",
+    docs="""
+        Only regenerate packages whose ebuilds changed since the last
+        incremental regen of the repo, along with all packages inheriting
+        changed eclasses.
+
+        Changes are taken from the repo's syncs in the meantime when the
+        syncer reports them (git and rsync), otherwise from comparing the
+        repo's ebuild and eclass mtimes to a snapshot recorded by the previous
+        incremental regen. The first run, and any run where the changes can't
+        be determined, regenerates the whole repo.
+    """,
+)
 regen_opts.add_argument(
     "--dir",
     dest="cache_dir",
@@ -375,6 +427,10 @@ def regen_main(options, out, err):
     ret = []
 
     observer = observer_mod.formatter_output(out)
+    processor.set_processor_limits(
+        max_inactive=options.max_idle_processors,
+        idle_timeout=options.processor_idle_timeout,
+    )
     for repo in iter_stable_unique(options.repos):
         if options.cache_dir is not None:
             # recreate new repo object with cache dir override
@@ -388,14 +444,20 @@ def regen_main(options, out, err):
             continue
 
         start_time = time.time()
-        ret.append(
-            repo.operations.regen_cache(
-                threads=options.threads,
-                observer=observer,
-                force=options.force,
-                eclass_caching=(not options.disable_eclass_caching),
-            )
+        changed_paths = state = None
+        if options.incremental and hasattr(repo, "changed_metadata"):
+            changed_paths, state = regen_ops.incremental_changes(repo)
+        errors = repo.operations.regen_cache(
+            threads=options.threads,
+            processes=options.processes,
+            observer=observer,
+            force=options.force,
+            eclass_caching=(not options.disable_eclass_caching),
+            changed_paths=changed_paths,
         )
+        ret.append(errors)
+        if state is not None and not errors:
+            regen_ops.save_incremental_state(repo, state)
         end_time = time.time()
 
         if options.verbosity > 0:
@@ -422,6 +484,68 @@ def regen_main(options, out, err):
     return int(any(ret))
 
 
+ebd_pool = subparsers.add_parser(
+    "ebd-pool",
+    parents=shared_options_domain,
+    description="serve preloaded ebuild processors to other pkgcore commands",
+    docs="""
+        Run a long lived pool of ebuild processors with the eclasses of the
+        given repo preloaded. Commands run with the ``PKGCORE_EBD_POOL``
+        environment variable set to the pool's socket borrow processors from
+        it for metadata generation instead of spawning and preloading their
+        own. Output from sourcing ebuilds is shown by the pool, not the
+        borrowing command.
+    """,
+)
+ebd_pool.add_argument(
+    "repo",
+    nargs="?",
+    action=commandline.StoreRepoObject,
+    repo_type="source-raw",
+    allow_external_repos=True,
+    help="repo to preload eclasses from",
+)
+ebd_pool_opts = ebd_pool.add_argument_group("subcommand options")
+ebd_pool_opts.add_argument(
+    "--socket",
+    help="socket path to listen on",
+    docs="""
+        Socket path to listen on, defaults to ``pkgcore-ebd-pool.sock`` in
+        ``$XDG_RUNTIME_DIR``.
+    """,
+)
+ebd_pool_opts.add_argument(
+    "-j",
+    "--jobs",
+    type=arghparse.positive_int,
+    default=arghparse.DelayedValue(_get_default_jobs, 100),
+    help="maximum number of processors",
+)
+
+
+@ebd_pool.bind_main_func
+def ebd_pool_main(options, out, err):
+    """Serve preloaded ebuild processors."""
+    path = options.socket
+    if path is None:
+        path = processor_pool.default_socket_path()
+    eclass_cache = getattr(options.repo, "eclass_cache", None)
+    server = processor_pool.PoolServer(path, eclass_cache, size=options.jobs)
+
+    def ready():
+        out.write(f"serving {server.size} ebuild processors at {path!r}")
+        out.write(f"enable with: export PKGCORE_EBD_POOL={path}")
+        out.flush()
+
+    try:
+        server.serve(ready=ready)
+    except OSError as e:
+        ebd_pool.error(str(e))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 env_update = subparsers.add_parser(
     "env-update", description="update env.d and ldconfig", parents=shared_options_domain
 )
@@ -10,6 +10,7 @@ from functools import partial
 from textwrap import dedent
 from time import time
 
+from snakeoil.cli import arghparse
 from snakeoil.cli.exceptions import ExitException
 from snakeoil.sequences import iflatten_instance, stable_unique
 from snakeoil.strings import pluralism
@@ -22,6 +23,7 @@ from ..merge import errors as merge_errors
 from ..operations import format, observer
 from ..repository.util import get_raw_repos
 from ..repository.virtual import RestrictionRepo
+from ..resolver import sat
 from ..resolver.util import reduce_to_failures
 from ..restrictions import packages
 from ..restrictions.boolean import OrRestriction
@@ -340,6 +342,31 @@ resolution_options.add_argument(
         the graph of the requested operation.
     """,
 )
+resolution_options.add_argument(
+    "--resolver-engine",
+    choices=("default", "sat"),
+    default="default",
+    help="dependency resolution engine to use",
+    docs="""
+        Select the engine used for dependency resolution. The default engine
+        is the backtracking resolver; ``sat`` encodes the dependency graph as
+        a boolean formula and solves it with a SAT solver, preferring the same
+        package versions as the default engine.
+    """,
+)
+resolution_options.add_argument(
+    "--resolver-jobs",
+    type=arghparse.positive_int,
+    default=1,
+    metavar="JOBS",
+    help="resolve independent targets in parallel",
+    docs="""
+        Number of worker processes used to speculatively resolve groups of
+        targets whose dependencies don't overlap. Groups that fail or conflict
+        are resolved serially afterwards. Defaults to 1, disabling parallel
+        resolution.
+    """,
+)
 
 output_options = argparser.add_argument_group("output options")
 output_options.add_argument(
@@ -876,10 +903,16 @@ def main(options, out, err):
             )
 
     extra_kwargs = {}
-    if options.empty:
+    if options.resolver_engine == "sat":
+        if options.empty:
+            extra_kwargs["resolver_cls"] = resolver.empty_tree_sat_merge_plan
+        else:
+            extra_kwargs["resolver_cls"] = sat.sat_merge_plan
+    elif options.empty:
         extra_kwargs["resolver_cls"] = resolver.empty_tree_merge_plan
     if options.debug:
         extra_kwargs["debug"] = True
+    extra_kwargs["jobs"] = options.resolver_jobs
 
     # XXX: This should recurse on deep
     if options.newuse:
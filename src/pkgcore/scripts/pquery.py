@@ -549,6 +549,20 @@ repo_group.add_argument(
         By default, virtuals are included during matching.
     """,
 )
+repo_group.add_argument(
+    "--threads",
+    type=arghparse.positive_int,
+    metavar="NUM",
+    help="number of threads to query repos with",
+    docs="""
+        Query the selected repos concurrently using up to the given number of
+        threads, useful when searching multiple repos where some need to
+        regenerate metadata. Matches are still output per repo in the usual
+        order.
+
+        By default, repos are queried sequentially.
+    """,
+)
 
 
 class RawAwareStoreRepoObject(commandline.StoreRepoObject):
@@ -1179,11 +1193,10 @@ def main(options, out, err):
 
     if options.query is None:
         return 0
-    for repo in options.repos:
+    repos = multiplex.tree(*options.repos, threads=options.threads)
+    for _, repo_matches in repos.itermatch_trees(options.query, sorter=sorted):
         try:
-            for pkgs in pkgutils.groupby_pkg(
-                repo.itermatch(options.query, sorter=sorted)
-            ):
+            for pkgs in pkgutils.groupby_pkg(repo_matches):
                 pkgs = list(pkgs)
                 if options.noversion:
                     print_packages_noversion(options, out, err, pkgs)
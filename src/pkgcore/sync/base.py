@@ -68,6 +68,9 @@ class Syncer:
     # plugin system uses this.
     disabled = False
 
+    # repo relative paths altered by the last sync, None if unknown
+    changed_paths = None
+
     pkgcore_config_type = ConfigHint(
         types={"path": "str", "uri": "str", "opts": "str", "usersync": "bool"},
         typename="syncer",
@@ -1,6 +1,7 @@
 __all__ = ("git_syncer",)
 
 import os
+import subprocess
 
 from . import base
 
@@ -47,3 +48,39 @@ class git_syncer(base.VcsSyncer):
 
     def _update_existing(self):
         return [self.binary_path, "pull"]
+
+    def _sync(self, verbosity):
+        old_head = self._git_output("rev-parse", "HEAD")
+        ret = super()._sync(verbosity)
+        self.changed_paths = None
+        if ret and old_head is not None:
+            new_head = self._git_output("rev-parse", "HEAD")
+            if new_head is not None:
+                diff = self._git_output(
+                    "diff",
+                    "--name-only",
+                    "--no-renames",
+                    "-z",
+                    old_head.strip(),
+                    new_head.strip(),
+                )
+                if diff is not None:
+                    self.changed_paths = frozenset(filter(None, diff.split("\0")))
+        return ret
+
+    def _git_output(self, *args):
+        """Return the output of a git command run in the repo, None on failure."""
+        try:
+            p = subprocess.run(
+                [self.binary_path, *args],
+                cwd=self.basedir,
+                env=self.env,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+            )
+        except OSError:
+            return None
+        if p.returncode:
+            return None
+        return p.stdout
@@ -140,27 +140,50 @@ class rsync_syncer(base.ExternalSyncer):
         elif verbosity > 0:
             opts.extend("-v" for x in range(verbosity))
 
-        # zip limits to the shortest iterable
-        ret = None
-        for ip in islice(self._get_ips(), self.retries):
-            cmd = [
-                self.binary_path,
-                self.uri.replace(self.hostname, ip, 1),
-                self.basedir,
-            ] + opts
-
-            ret = self._spawn(cmd)
-            if ret == 0:
-                return True
-            elif ret == 1:
-                raise base.SyncError("rsync command syntax error: {' '.join(cmd)}")
-            elif ret == 11:
-                raise base.SyncError("rsync ran out of disk space")
+        self.changed_paths = None
+        with tempfile.NamedTemporaryFile(mode="r", prefix="pkgcore-rsync-") as log:
+            # rsync runs as the sync user, it can only log to files it can open
+            if self.uid == os.getuid():
+                opts.append(f"--log-file={log.name}")
+                opts.append("--log-file-format=%i %n")
+
+            # zip limits to the shortest iterable
+            ret = None
+            for ip in islice(self._get_ips(), self.retries):
+                cmd = [
+                    self.binary_path,
+                    self.uri.replace(self.hostname, ip, 1),
+                    self.basedir,
+                ] + opts
+
+                ret = self._spawn(cmd)
+                if ret == 0:
+                    if self.uid == os.getuid():
+                        self.changed_paths = self._parse_log(log)
+                    return True
+                elif ret == 1:
+                    raise base.SyncError("rsync command syntax error: {' '.join(cmd)}")
+                elif ret == 11:
+                    raise base.SyncError("rsync ran out of disk space")
         # need to do something here instead of just restarting...
         # else:
         #     print(ret)
         raise base.SyncError("all attempts failed")
 
+    @staticmethod
+    def _parse_log(f):
+        """Return the paths itemized in a log file, covering all attempts."""
+        paths = set()
+        for line in f:
+            # lines look like: '2023/01/01 00:00:00 [123] >f+++++++++ cat/pkg/Manifest'
+            chunks = line.rstrip("\n").split(None, 4)
+            if len(chunks) != 5:
+                continue
+            flags, path = chunks[3:]
+            if flags == "*deleting" or (len(flags) == 11 and flags[0] in "<>ch.*"):
+                paths.add(path.rstrip("/"))
+        return frozenset(paths)
+
 
 class _RsyncFileSyncer(rsync_syncer):
     """Support syncing a single file over rsync."""
@@ -223,6 +246,7 @@ class rsync_timestamp_syncer(rsync_syncer):
                         else:
                             doit = delta > self.negative_sync_delay
             if not doit:
+                self.changed_paths = frozenset()
                 return True
             ret = super()._sync(verbosity)
             # force a reset of the timestamp
@@ -1,5 +1,8 @@
+import shutil
+
 import pytest
 
+from pkgcore import const
 from pkgcore.cache import errors, flat_hash
 from snakeoil.chksum import LazilyHashedPath
 
@@ -96,3 +99,139 @@ class TestFlatHash:
         for key, raw_data in self.test_data:
             d = dict(raw_data)
             db[key] = d
+
+    def test_validate_entries(self, tmp_path):
+        class eclass_db:
+            eclasses = {
+                "eclass1": LazilyHashedPath("/e/eclass1", mtime=1, eclassdir="/e"),
+                "eclass2": LazilyHashedPath("/e/eclass2", mtime=2, eclassdir="/e"),
+            }
+            rebuilds = 0
+
+            def rebuild_cache_entry(self, entry_eclasses):
+                self.rebuilds += 1
+                for eclass, chksums in entry_eclasses:
+                    data = self.eclasses.get(eclass)
+                    if any(val != getattr(data, chf, None) for chf, val in chksums):
+                        return None
+                return True
+
+        cache = db(str(tmp_path), auxdbkeys=("INHERIT", "SLOT", "_eclasses_"))
+        eclasses = eclass_db.eclasses
+        for cpv in ("cat/a-1", "cat/b-1", "cat/c-1"):
+            cache[cpv] = {"INHERIT": "eclass1", "_eclasses_": eclasses}
+        cache["cat/d-1"] = {"SLOT": "0"}
+        # entries with eclasses but no INHERIT are always stale
+        cache["cat/e-1"] = {"SLOT": "0", "_eclasses_": eclasses}
+
+        ebuild_hash = test_base._chf_obj
+        entries = [
+            (cpv, ebuild_hash)
+            for cpv in ("cat/a-1", "cat/b-1", "cat/c-1", "cat/d-1", "cat/e-1")
+        ]
+        ecache = eclass_db()
+        assert cache.validate_entries(entries, ecache) == {"cat/e-1"}
+        # shared eclass data is only checked once
+        assert ecache.rebuilds == 1
+
+        entries.append(("cat/missing-1", ebuild_hash))
+        entries.append(("cat/d-1", test_base._mk_chf_obj(mtime=1)))
+        ecache.eclasses = dict(
+            eclasses, eclass2=LazilyHashedPath("/e/eclass2", mtime=3, eclassdir="/e")
+        )
+        assert cache.validate_entries(entries, ecache) == {
+            "cat/a-1",
+            "cat/b-1",
+            "cat/c-1",
+            "cat/d-1",
+            "cat/e-1",
+            "cat/missing-1",
+        }
+
+    def test_batched_writes(self, tmp_path):
+        cache = db(str(tmp_path), auxdbkeys=("SLOT",))
+        cache.set_sync_rate(100)
+        for cpv in ("cat/a-1", "cat/b-1", "dog/a-1"):
+            cache[cpv] = {"SLOT": "0"}
+        # queued entries are visible before they hit the disk
+        assert not (tmp_path / "cat").exists()
+        assert "cat/a-1" in cache
+        assert cache["dog/a-1"] == {"SLOT": "0"}
+        del cache["cat/b-1"]
+        assert "cat/b-1" not in cache
+
+        cache.commit()
+        assert sorted(x.name for x in (tmp_path / "cat").iterdir()) == ["a-1"]
+        assert (tmp_path / "dog" / "a-1").read_text().startswith("SLOT=0\n")
+        assert sorted(cache) == ["cat/a-1", "dog/a-1"]
+
+        # entries are written immediately by default
+        cache.set_sync_rate(1)
+        cache["cat/c-1"] = {"SLOT": "1"}
+        assert (tmp_path / "cat" / "c-1").exists()
+
+    def test_journal(self, tmp_path):
+        cache = db(str(tmp_path), auxdbkeys=("SLOT",), journal=True)
+        cache.set_sync_rate(100)
+        for cpv in ("cat/a-1", "cat/b-1", "cat/c-1"):
+            cache[cpv] = {"SLOT": "0"}
+        del cache["cat/b-1"]
+        journal = tmp_path / cache.journal_name
+        assert journal.exists()
+        # simulate an interrupted run, dropping the queued entries
+        cache._journal.close()
+        with journal.open("a") as f:
+            f.write('["cat/d-1", {"SLO')
+        del cache
+
+        cache = db(str(tmp_path), auxdbkeys=("SLOT",), journal=True)
+        assert not journal.exists()
+        assert sorted(cache) == ["cat/a-1", "cat/c-1"]
+        assert cache["cat/c-1"] == {"SLOT": "0"}
+
+        # committed updates don't leave a journal behind
+        cache.set_sync_rate(100)
+        cache["cat/d-1"] = {"SLOT": "0"}
+        cache.commit()
+        assert not journal.exists()
+        assert sorted(cache) == ["cat/a-1", "cat/c-1", "cat/d-1"]
+
+    def test_eclass_index(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(const, "USER_CACHE_PATH", str(tmp_path / "user"))
+        location = tmp_path / "cache"
+        eclasses = dict(generic_data[1])["_eclasses_"]
+        cache = db(str(location), auxdbkeys=("SLOT", "_eclasses_"))
+        cache["cat/a-1"] = {"_eclasses_": {"multilib": eclasses["multilib"]}}
+        cache["cat/b-1"] = {"_eclasses_": eclasses}
+        cache["dog/c-1"] = {"SLOT": "0"}
+        assert cache.eclass_consumers(["multilib"]) == {"cat/a-1", "cat/b-1"}
+        assert cache.eclass_consumers(["eutils", "foo"]) == {"cat/b-1"}
+        assert not cache.eclass_consumers([])
+        # the index file isn't exposed as an entry
+        assert sorted(cache) == ["cat/a-1", "cat/b-1", "dog/c-1"]
+
+        # updates are tracked without rescanning
+        index = cache._eclass_index
+        monkeypatch.setattr(
+            index, "_scan_dir", lambda *args: pytest.fail("unexpected rescan")
+        )
+        cache["dog/c-1"] = {"_eclasses_": {"eutils": eclasses["eutils"]}}
+        del cache["cat/b-1"]
+        assert cache.eclass_consumers(["eutils"]) == {"dog/c-1"}
+        assert cache.eclass_index() == {"multilib": {"cat/a-1"}, "eutils": {"dog/c-1"}}
+        monkeypatch.undo()
+        monkeypatch.setattr(const, "USER_CACHE_PATH", str(tmp_path / "user"))
+
+        # changes by other writers are picked up by the persisted index
+        cache.commit()
+        other = db(str(location), auxdbkeys=("SLOT", "_eclasses_"))
+        other["cat/d-1"] = {"_eclasses_": {"multilib": eclasses["multilib"]}}
+        (location / "cat" / "corrupt-1").write_text("garbage\n")
+        shutil.rmtree(location / "dog")
+        cache = db(str(location), auxdbkeys=("SLOT", "_eclasses_"))
+        assert cache.eclass_consumers(["eutils"]) == {"cat/corrupt-1"}
+        assert cache.eclass_consumers(["multilib"]) == {
+            "cat/a-1",
+            "cat/d-1",
+            "cat/corrupt-1",
+        }
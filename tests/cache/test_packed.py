@@ -0,0 +1,160 @@
+import pytest
+
+from pkgcore.cache import errors, flat_hash, packed
+from snakeoil.chksum import LazilyHashedPath
+
+from .test_flat_hash import generic_data
+
+
+def _mk_chf_obj(md5):
+    return LazilyHashedPath("/nonexistent/path", md5=md5)
+
+
+class db(packed.database):
+    def __setitem__(self, cpv, data):
+        data["_chf_"] = _mk_chf_obj(0x1234)
+        return packed.database.__setitem__(self, cpv, data)
+
+
+class md5_db(flat_hash.database):
+    chf_type = "md5"
+    eclass_chf_types = ("md5",)
+
+    def __setitem__(self, cpv, data):
+        data["_chf_"] = _mk_chf_obj(0x1234)
+        return flat_hash.database.__setitem__(self, cpv, data)
+
+
+class TestPacked:
+    cache_keys = ("DEPEND", "DESCRIPTION", "EAPI", "KEYWORDS", "SLOT", "_eclasses_")
+
+    @pytest.fixture
+    def data(self):
+        d = dict(generic_data[1])
+        d["_eclasses_"] = {
+            k: LazilyHashedPath(v.path, md5=i)
+            for i, (k, v) in enumerate(d["_eclasses_"].items())
+        }
+        del d["_mtime_"]
+        return d
+
+    def test_readwrite(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-2.4"] = data
+        cache["sys-libs/libtrash-2.5"] = dict(data, SLOT="1")
+        # pending updates are visible before being written
+        assert sorted(cache.keys()) == [
+            "sys-libs/libtrash-2.4",
+            "sys-libs/libtrash-2.5",
+        ]
+        assert not (tmp_path / cache.filename).exists()
+        cache.commit()
+        assert (tmp_path / cache.filename).exists()
+
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert "sys-libs/libtrash-2.5" in cache
+        assert "sys-libs/libtrash-2.6" not in cache
+        entry = cache["sys-libs/libtrash-2.5"]
+        assert entry["SLOT"] == "1"
+        assert entry["DEPEND"] == data["DEPEND"]
+        assert entry["_md5_"] == 0x1234
+        assert [x[0] for x in entry["_eclasses_"]] == list(data["_eclasses_"])
+        # keys outside auxdbkeys aren't stored
+        assert "HOMEPAGE" not in entry
+
+        del cache["sys-libs/libtrash-2.4"]
+        with pytest.raises(KeyError):
+            del cache["sys-libs/libtrash-2.4"]
+        cache.commit()
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert list(cache.keys()) == ["sys-libs/libtrash-2.5"]
+
+    def test_commit(self, tmp_path, data):
+        path = tmp_path / db.filename
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-1"] = dict(data)
+        cache.commit()
+        mapping = cache.data._mmap
+        inode = path.stat().st_ino
+        # the pack isn't rewritten without updates, even if forced
+        cache.commit(force=True)
+        assert path.stat().st_ino == inode
+        assert not mapping.closed
+
+        # updates are written out once the sync rate is reached
+        cache.set_sync_rate(3)
+        cache["sys-libs/libtrash-2"] = dict(data)
+        cache["sys-libs/libtrash-3"] = dict(data)
+        assert len(list(db(str(tmp_path), auxdbkeys=self.cache_keys).keys())) == 1
+        cache["sys-libs/libtrash-4"] = dict(data)
+        assert len(list(db(str(tmp_path), auxdbkeys=self.cache_keys).keys())) == 4
+        # the previous mapping is released on reload
+        assert mapping.closed
+
+    def test_readonly(self, tmp_path, data):
+        path = tmp_path / db.filename
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-2.4"] = data
+        cache.commit()
+        inode = path.stat().st_ino
+
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys, readonly=True)
+        with pytest.raises(errors.ReadOnly):
+            cache["sys-libs/libtrash-2.5"] = data
+        with pytest.raises(errors.ReadOnly):
+            cache._write_data()
+        cache.commit(force=True)
+        assert path.stat().st_ino == inode
+        assert list(cache.keys()) == ["sys-libs/libtrash-2.4"]
+
+    def test_validated(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-2.4"] = data
+        cache.commit()
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        with pytest.raises(KeyError):
+            cache.validated("sys-libs/libtrash-2.5", _mk_chf_obj(0x1234), None)
+        # stale ebuild chksums are rejected from the index alone
+        assert cache.validated("sys-libs/libtrash-2.4", _mk_chf_obj(1), None) is None
+
+    def test_corrupt(self, tmp_path):
+        (tmp_path / packed.database.filename).write_text("not a pack\n")
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        with pytest.raises(errors.GeneralCacheCorruption):
+            list(cache.keys())
+
+    def test_clone(self, tmp_path, data):
+        source = md5_db(str(tmp_path / "md5-cache"), auxdbkeys=self.cache_keys)
+        source["sys-libs/libtrash-2.4"] = data
+        source["sys-libs/libtrash-2.5"] = dict(data, SLOT="1")
+
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/stale-1"] = dict(data)
+        cache.clone(source)
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert sorted(cache.keys()) == [
+            "sys-libs/libtrash-2.4",
+            "sys-libs/libtrash-2.5",
+        ]
+        for cpv in cache.keys():
+            assert cache[cpv] == source[cpv]
+
+        with pytest.raises(errors.CacheError):
+            cache.clone(flat_hash.database(str(tmp_path / "md5-cache")))
+
+    def test_validate_entries(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        data.pop("_eclasses_")
+        cache["sys-libs/libtrash-2.4"] = data
+        cache["sys-libs/libtrash-2.5"] = data
+        cache.commit()
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        entries = [
+            ("sys-libs/libtrash-2.4", _mk_chf_obj(0x1234)),
+            ("sys-libs/libtrash-2.5", _mk_chf_obj(1)),
+            ("sys-libs/libtrash-2.6", _mk_chf_obj(0x1234)),
+        ]
+        assert cache.validate_entries(entries, None) == {
+            "sys-libs/libtrash-2.5",
+            "sys-libs/libtrash-2.6",
+        }
@@ -0,0 +1,122 @@
+import pytest
+
+from pkgcore.cache import errors, flat_hash, shared
+from snakeoil.chksum import LazilyHashedPath
+
+from .test_flat_hash import generic_data
+from .test_packed import _mk_chf_obj, md5_db
+
+
+class db(shared.database):
+    def __setitem__(self, cpv, data):
+        data["_chf_"] = _mk_chf_obj(0x1234)
+        return shared.database.__setitem__(self, cpv, data)
+
+
+class TestShared:
+    cache_keys = ("DEPEND", "DESCRIPTION", "EAPI", "KEYWORDS", "SLOT", "_eclasses_")
+
+    @pytest.fixture
+    def data(self):
+        d = dict(generic_data[1])
+        d["_eclasses_"] = {
+            k: LazilyHashedPath(v.path, md5=i)
+            for i, (k, v) in enumerate(d["_eclasses_"].items())
+        }
+        del d["_mtime_"]
+        return d
+
+    def test_readwrite(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-2.4"] = data
+        cache["sys-libs/libtrash-2.5"] = dict(data, SLOT="1")
+        # pending updates are visible before being written
+        assert sorted(cache.keys()) == [
+            "sys-libs/libtrash-2.4",
+            "sys-libs/libtrash-2.5",
+        ]
+        assert not (tmp_path / cache.filename).exists()
+        cache.commit()
+        assert (tmp_path / cache.filename).exists()
+
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert "sys-libs/libtrash-2.5" in cache
+        assert "sys-libs/libtrash-2.6" not in cache
+        entry = cache["sys-libs/libtrash-2.5"]
+        assert entry["SLOT"] == "1"
+        assert entry["DEPEND"] == data["DEPEND"]
+        assert entry["_md5_"] == 0x1234
+        assert [x[0] for x in entry["_eclasses_"]] == list(data["_eclasses_"])
+        assert "HOMEPAGE" not in entry
+
+        del cache["sys-libs/libtrash-2.4"]
+        with pytest.raises(KeyError):
+            del cache["sys-libs/libtrash-2.4"]
+        cache.commit()
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert list(cache.keys()) == ["sys-libs/libtrash-2.5"]
+
+    def test_interned(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/libtrash-2.4"] = data
+        cache["sys-libs/libtrash-2.5"] = dict(data, SLOT="1")
+        cache.commit()
+
+        entries = db(str(tmp_path), auxdbkeys=self.cache_keys).data
+        first = entries["sys-libs/libtrash-2.4"]
+        second = entries["sys-libs/libtrash-2.5"]
+        # identical values are stored once and decoded once per process
+        assert first["DEPEND"] is second["DEPEND"]
+        assert first["SLOT"] != second["SLOT"]
+        # two cpvs, the shared keys and values plus the differing SLOT
+        assert len(entries._strings) == 2 + 2 * len(first) + 1
+
+    def test_readonly(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys, readonly=True)
+        with pytest.raises(errors.ReadOnly):
+            cache["sys-libs/libtrash-2.4"] = data
+        with pytest.raises(errors.ReadOnly):
+            cache.clone(md5_db(str(tmp_path / "md5-cache")))
+
+    def test_validate_entries(self, tmp_path, data):
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        data.pop("_eclasses_")
+        cache["sys-libs/libtrash-2.4"] = data
+        cache["sys-libs/libtrash-2.5"] = data
+        cache.commit()
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        entries = [
+            ("sys-libs/libtrash-2.4", _mk_chf_obj(0x1234)),
+            ("sys-libs/libtrash-2.5", _mk_chf_obj(1)),
+            ("sys-libs/libtrash-2.6", _mk_chf_obj(0x1234)),
+        ]
+        assert cache.validate_entries(entries, None) == {
+            "sys-libs/libtrash-2.5",
+            "sys-libs/libtrash-2.6",
+        }
+
+    @pytest.mark.parametrize("content", (b"not a store\n", b"pkgcore-shm-meta"))
+    def test_corrupt(self, tmp_path, content):
+        (tmp_path / shared.database.filename).write_bytes(content)
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        with pytest.raises(errors.GeneralCacheCorruption):
+            list(cache.keys())
+
+    def test_clone(self, tmp_path, data):
+        source = md5_db(str(tmp_path / "md5-cache"), auxdbkeys=self.cache_keys)
+        source["sys-libs/libtrash-2.4"] = data
+        source["sys-libs/libtrash-2.5"] = dict(data, SLOT="1")
+
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        cache["sys-libs/stale-1"] = dict(data)
+        cache.clone(source)
+        cache = db(str(tmp_path), auxdbkeys=self.cache_keys)
+        assert sorted(cache.keys()) == [
+            "sys-libs/libtrash-2.4",
+            "sys-libs/libtrash-2.5",
+        ]
+        for cpv in cache.keys():
+            assert cache[cpv] == source[cpv]
+
+        with pytest.raises(errors.CacheError):
+            cache.clone(flat_hash.database(str(tmp_path / "md5-cache")))
@@ -2,6 +2,8 @@ from functools import partial
 
 import pytest
 
+from pkgcore import const
+
 
 def pytest_addoption(parser):
     parser.addoption(
@@ -23,3 +25,11 @@ def mark_network(config, func):
 
 def pytest_configure(config):
     pytest.mark_network = partial(mark_network, config)
+
+
+@pytest.fixture(autouse=True)
+def user_cache(tmp_path_factory, monkeypatch):
+    """Keep files cached per user, e.g. repo indexes, out of the home directory."""
+    path = tmp_path_factory.mktemp("user-cache")
+    monkeypatch.setattr(const, "USER_CACHE_PATH", str(path))
+    return path
@@ -311,6 +311,31 @@ class TestCPV:
             "da/ba-6.0-r0", versioned=True
         )
 
+    def test_version_key(self):
+        vkls = cpv.VersionedCPV
+        versions = [
+            f"{ver}{suf}{rev}"
+            for ver in ("0", "00", "1", "1.0", "1.00", "1.01", "1.1", "1.1a", "1.10")
+            for suf in ("", "_alpha", "_beta2", "_p", "_p1", "_pre_p", "_rc1_p0")
+            for rev in ("", "-r0", "-r1", "-r10")
+        ]
+        pkgs = [vkls(f"da/ba-{x}") for x in versions]
+        for x in pkgs:
+            for y in pkgs:
+                expected = cpv.ver_cmp(x.version, x.revision, y.version, y.revision)
+                key_cmp = (x.version_key > y.version_key) - (
+                    x.version_key < y.version_key
+                )
+                assert key_cmp == expected, f"{x} vs {y}"
+        assert hash(pkgs[0].version_key) == hash(vkls("da/ba-0-r0").version_key)
+        for x in pkgs:
+            assert cpv.fullver_key(x.fullver) == x.version_key
+        for ver in ("1-foo", "1-r", "a1", "1_beta-r1-r2"):
+            assert cpv.fullver_key(ver) is None
+        assert cpv.UnversionedCPV("da/ba").version_key == ()
+        shuffle(pkgs)
+        assert sorted(pkgs) == sorted(pkgs, key=lambda x: x.version_key)
+
     def test_no_init(self):
         """Test if the cpv is in a somewhat sane state if __init__ fails.
 
@@ -5,8 +5,10 @@ import pytest
 
 from pkgcore.ebuild import domain as domain_mod
 from pkgcore.ebuild import profiles
+from pkgcore.ebuild.atom import atom
 from pkgcore.fs.livefs import iter_scan
 from pkgcore.restrictions import packages
+from pkgcore.test.misc import FakePkg
 
 from .test_profiles import profile_mixin
 
@@ -132,3 +134,17 @@ class TestDomain:
         assert () == self.mk_domain().pkg_use
         assert "token x_$z is not a valid use flag" in caplog.text
         caplog.clear()
+
+
+def test_mask_filter():
+    class KeyMask:
+        """Restriction-like mask only providing match()."""
+
+        def match(self, pkg):
+            return pkg.key == "dev-libs/foo"
+
+    masks = [atom("dev-libs/bar"), KeyMask()]
+    masking = domain_mod.make_mask_filter(masks, negate=True)
+    assert not masking.match(FakePkg("dev-libs/foo-1"))
+    assert not masking.match(FakePkg("dev-libs/bar-1"))
+    assert masking.match(FakePkg("dev-libs/baz-1"))
@@ -5,6 +5,7 @@ from types import SimpleNamespace
 
 import pytest
 from pkgcore import fetch
+from pkgcore.cache import base as cache_base
 from pkgcore.ebuild import digest, ebuild_src, repo_objs
 from pkgcore.ebuild.eapi import EAPI, get_eapi
 from pkgcore.package import errors
@@ -675,6 +676,8 @@ class TestPackageFactory:
             readonly = False
             validate_result = False
 
+            validated = cache_base.validated
+
             def validate_entry(self, *args):
                 return self.validate_result
 
@@ -2,6 +2,7 @@ import io
 import textwrap
 
 import pytest
+from pkgcore.ebuild import filter_env
 from pkgcore.ebuild.filter_env import main_run
 
 
@@ -267,3 +268,20 @@ class TestFilterEnv:
         l = set()
         self.get_output(data, global_envvar_callback=l.add)
         assert var_list == l
+
+    def test_cached_output(self, monkeypatch):
+        data = "f() {\n x=${y:-$'\\x'}\n}\nY=$(f) # c\n"
+        ret = self.get_output(data, funcs="f")
+        assert ret == "\nY=$(f) # c\n"
+
+        # repeated filtering reuses the earlier output
+        def fail(*args, **kwargs):
+            raise AssertionError("environment reparsed")
+
+        monkeypatch.setattr(filter_env, "run", fail)
+        assert self.get_output(data, funcs="f") == ret
+        # differing filters or callbacks get their own parse
+        with pytest.raises(AssertionError):
+            self.get_output(data, funcs="g")
+        with pytest.raises(AssertionError):
+            self.get_output(data, funcs="f", global_envvar_callback=print)
@@ -0,0 +1,72 @@
+from pickle import dumps, loads
+
+import pytest
+
+from pkgcore.ebuild import atom, cpv, parse_cache
+from pkgcore.test.misc import FakePkg
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = parse_cache.ParseCache(maxsize=4)
+    monkeypatch.setattr(parse_cache, "cache", cache)
+    return cache
+
+
+class TestParseCache:
+    def test_lru(self):
+        cache = parse_cache.ParseCache(maxsize=2)
+        cache.add("a", 1)
+        cache.add("b", 2)
+        assert cache.get("a") == 1
+        cache.add("c", 3)
+        # least recently used entry is evicted
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats() == (2, 1, 2, 2)
+        cache.resize(1)
+        assert len(cache) == 1
+        cache.clear()
+        assert cache.stats() == (0, 0, 0, 1)
+
+    def test_disabled(self):
+        cache = parse_cache.ParseCache(maxsize=0)
+        cache.add("a", 1)
+        assert cache.get("a") is None
+
+    def test_atoms(self, cache):
+        a = atom.atom(">=dev-libs/openssl-3")
+        assert atom.atom(">=dev-libs/openssl-3") is a
+        # the eapi is part of the key
+        assert atom.atom(">=dev-libs/openssl-3", eapi="8") is not a
+        assert atom.atom("dev-libs/foo[bar?]", eapi="8").__class__ is (
+            atom.transitive_use_atom
+        )
+        assert cache.stats().hits == 1
+        # caching can be bypassed per instantiation
+        assert atom.atom(">=dev-libs/openssl-3", disable_inst_caching=True) is not a
+
+        # failures aren't cached
+        for _ in range(2):
+            with pytest.raises(atom.errors.MalformedAtom):
+                atom.atom("=dev-libs/openssl")
+        assert cache.stats().hits == 1
+
+    def test_cpvs(self, cache):
+        pkg = cpv.VersionedCPV("dev-libs/openssl-3")
+        assert cpv.VersionedCPV("dev-libs/openssl-3") is pkg
+        assert cpv.VersionedCPV("dev-libs", "openssl", "3") is not pkg
+        assert cpv.UnversionedCPV("dev-libs/openssl") is cpv.UnversionedCPV(
+            "dev-libs/openssl"
+        )
+        assert loads(dumps(pkg)) == pkg
+        with pytest.raises(cpv.InvalidCPV):
+            cpv.VersionedCPV("dev-libs/openssl")
+        for cls in (cpv.VersionedCPV, cpv.UnversionedCPV):
+            with pytest.raises(TypeError):
+                cls()
+
+        # derived package classes aren't shared
+        hits = cache.stats().hits
+        assert FakePkg("dev-libs/openssl-3") is not FakePkg("dev-libs/openssl-3")
+        assert cache.stats().hits == hits
@@ -202,3 +202,32 @@ class TestReposConf:
         assert repos == sym_repos
         assert defaults["main-repo"] == "gentoo"
         assert list(repos.keys()) == ["foo", "bar", "gentoo", "binpkgs"]
+
+    def test_shared_cache(self, tmp_path):
+        (repo_path := tmp_path / "foo" / "metadata" / "md5-cache").mkdir(parents=True)
+        repo_path = str(tmp_path / "foo")
+        config = PortageConfig.__new__(PortageConfig)
+        config._config = {}
+
+        def repo_config(**repo_opts):
+            config._config.clear()
+            return config._repo_ebuild_v1(
+                repo_name="foo",
+                repo_opts={"location": repo_path, **repo_opts},
+                repo_map={},
+                defaults={"main-repo": "gentoo"},
+            )
+
+        assert repo_config()["cache"] == "cache:foo"
+        assert "shared-cache:foo" not in config
+
+        # the shared store is checked before the regular cache
+        repo = repo_config(**{"shared-cache": str(tmp_path / "shm")})
+        assert repo["cache"] == "shared-cache:foo cache:foo"
+        section = config["shared-cache:foo"]
+        assert section.render_value(None, "class", "str") == (
+            "pkgcore.cache.shared.database"
+        )
+        assert section.render_value(None, "location", "str") == str(
+            tmp_path / "shm" / "foo"
+        )
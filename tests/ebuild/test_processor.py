@@ -0,0 +1,171 @@
+import os
+import threading
+from collections import deque
+
+import pytest
+
+from pkgcore.ebuild import eclass_cache, processor, repository
+from pkgcore.package.errors import MetadataException
+from pkgcore.restrictions import packages
+
+
+class FakeProcessor:
+    userpriv = False
+    sandbox = False
+    pooled = False
+    is_responsive = True
+
+    def __init__(self, *eclasses):
+        self._preloaded_eclasses = {x: f"/eclass/{x}.eclass" for x in eclasses}
+        self._idle_since = None
+        self.is_locked = False
+        self.custom_fds = None
+        self.pid = 1
+
+    def shutdown_processor(self, force=False):
+        self.pid = None
+
+
+class TestScheduling:
+    @pytest.fixture(autouse=True)
+    def _lists(self, monkeypatch):
+        monkeypatch.setattr(processor, "active_ebp_list", [])
+        monkeypatch.setattr(processor, "inactive_ebp_list", [])
+        monkeypatch.setattr(processor, "_max_inactive", None)
+        monkeypatch.setattr(processor, "_idle_timeout", None)
+
+    def release(self, *ebps):
+        for ebp in ebps:
+            processor.active_ebp_list.append(ebp)
+            assert processor.release_ebuild_processor(ebp)
+
+    def test_eclass_affinity(self):
+        a = FakeProcessor("foo")
+        b = FakeProcessor("bar", "baz")
+        c = FakeProcessor("foo", "bar")
+        self.release(a, b, c)
+        assert processor.request_ebuild_processor(eclasses={"bar", "baz"}) is b
+        assert processor.request_ebuild_processor(eclasses={"foo", "bar"}) is c
+        # least recently released processor is used without hints
+        self.release(b)
+        assert processor.request_ebuild_processor() is a
+
+    def test_max_inactive(self):
+        ebps = [FakeProcessor() for _ in range(3)]
+        self.release(*ebps)
+        processor.set_processor_limits(max_inactive=1)
+        assert processor.inactive_ebp_list == ebps[2:]
+        assert [x.pid for x in ebps] == [None, None, 1]
+
+    def test_idle_timeout(self, monkeypatch):
+        now = 100
+        monkeypatch.setattr(processor.time, "monotonic", lambda: now)
+        old, new = FakeProcessor(), FakeProcessor()
+        self.release(old)
+        now = 200
+        self.release(new)
+        processor.set_processor_limits(idle_timeout=50)
+        assert processor.inactive_ebp_list == [new]
+        assert old.pid is None
+
+
+class TestExpect:
+    @pytest.fixture
+    def ebp(self):
+        ebp = processor.EbuildProcessor.__new__(processor.EbuildProcessor)
+        ebp.pid = 1
+        ebp._outstanding_expects = []
+        dread, dwrite = os.pipe()
+        ebp.ebd_read = os.fdopen(dread, "r")
+        ebp.ebd_write = os.fdopen(dwrite, "w")
+        yield ebp
+        ebp.ebd_read.close()
+        ebp.ebd_write.close()
+
+    def test_timeout(self, ebp):
+        results = []
+
+        def expect():
+            results.append(ebp.expect("yep!", timeout=0.1))
+            ebp.ebd_write.write("yep!\n")
+            results.append(ebp.expect("yep!", flush=True, timeout=0.1))
+
+        # timeouts apply outside the main thread as well
+        thread = threading.Thread(target=expect, daemon=True)
+        thread.start()
+        thread.join(5)
+        assert results == [False, True]
+
+
+class TestPipelinedMetadata:
+    @pytest.fixture
+    def repo(self, tmp_path):
+        (tmp_path / "profiles").mkdir()
+        (tmp_path / "metadata").mkdir()
+        (tmp_path / "metadata" / "layout.conf").write_text("masters =\n")
+        (tmp_path / "eclass").mkdir()
+        (tmp_path / "eclass" / "foo.eclass").write_text('HOMEPAGE="https://foo"\n')
+        (pkg_dir := tmp_path / "cat" / "pkg").mkdir(parents=True)
+        ebuilds = {
+            "1": 'DESCRIPTION="one"',
+            # sourcing failure
+            "2": "if; then",
+            # processor is killed for unknown eclasses
+            "3": "inherit bar",
+            "4": 'inherit foo\nDESCRIPTION="four"',
+        }
+        for ver, data in ebuilds.items():
+            (pkg_dir / f"pkg-{ver}.ebuild").write_text(f'EAPI=7\nSLOT="0"\n{data}\n')
+        ecache = eclass_cache.cache(str(tmp_path / "eclass"))
+        return repository.UnconfiguredTree(str(tmp_path), eclass_cache=ecache)
+
+    def pkgs(self, repo):
+        return sorted(repo.itermatch(packages.AlwaysTrue, pkg_filter=None))
+
+    def test_update_metadata(self, repo):
+        pkgs = self.pkgs(repo)
+        factory = pkgs[0]._parent
+        results = dict(factory._update_metadata_pipelined(pkgs, store=False))
+        assert results.keys() == set(pkgs)
+        assert results[pkgs[0]]["DESCRIPTION"] == "one"
+        assert isinstance(results[pkgs[1]], MetadataException)
+        assert isinstance(results[pkgs[2]], MetadataException)
+        assert results[pkgs[3]]["DESCRIPTION"] == "four"
+        assert results[pkgs[3]]["HOMEPAGE"] == "https://foo"
+        assert set(results[pkgs[3]]["_eclasses_"]) == {"foo"}
+
+    def test_early_exit(self, repo):
+        pkgs = self.pkgs(repo)
+        ebp = processor.request_ebuild_processor()
+        try:
+            queue = deque([pkgs[0], pkgs[3]])
+            results = ebp.get_keys_pipelined(queue, repo.eclass_cache)
+            pkg, keys = next(results)
+            assert pkg == pkgs[0]
+            assert keys["DESCRIPTION"] == "one"
+            # the request in flight is drained when the consumer bails out
+            results.close()
+            assert not queue
+            assert ebp.get_keys(pkgs[0], repo.eclass_cache)["DESCRIPTION"] == "one"
+        finally:
+            processor.release_ebuild_processor(ebp)
+
+    def test_modified_eclass(self, repo, tmp_path):
+        pkg = self.pkgs(repo)[3]
+        ebp = processor.request_ebuild_processor()
+        ebp.allow_eclass_caching()
+        try:
+            # the second request uses the eclass preloaded after the first one
+            for _ in range(2):
+                keys = ebp.get_keys(pkg, repo.eclass_cache)
+                assert keys["HOMEPAGE"] == "https://foo"
+            assert "foo" in ebp._preloaded_eclasses
+            # eclasses edited in place are reloaded
+            eclass = tmp_path / "eclass" / "foo.eclass"
+            eclass.write_text('HOMEPAGE="https://bar"\n')
+            os.utime(eclass, ns=(0, 0))
+            ecache = eclass_cache.cache(str(tmp_path / "eclass"))
+            assert ebp.get_keys(pkg, ecache)["HOMEPAGE"] == "https://bar"
+        finally:
+            ebp.disable_eclass_caching()
+            processor.release_ebuild_processor(ebp)
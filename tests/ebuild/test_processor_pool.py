@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import pytest
+
+from pkgcore.ebuild import eclass_cache, processor, processor_pool, repository
+from pkgcore.ebuild.atom import atom
+
+
+class TestPoolServer:
+    @pytest.fixture
+    def repo(self, tmp_path):
+        (tmp_path / "profiles").mkdir()
+        (tmp_path / "metadata").mkdir()
+        (tmp_path / "metadata" / "layout.conf").write_text("masters =\n")
+        (tmp_path / "eclass").mkdir()
+        (tmp_path / "eclass" / "foo.eclass").write_text('DESCRIPTION="foo"\n')
+        (tmp_path / "cat" / "pkg").mkdir(parents=True)
+        (tmp_path / "cat" / "pkg" / "pkg-1.ebuild").write_text(
+            'EAPI=7\ninherit foo\nSLOT="0"\n'
+        )
+        ecache = eclass_cache.cache(str(tmp_path / "eclass"))
+        return repository.UnconfiguredTree(str(tmp_path), eclass_cache=ecache)
+
+    @pytest.fixture
+    def server(self, tmp_path, repo, monkeypatch):
+        # ignore processors left inactive by other tests
+        monkeypatch.setattr(processor, "active_ebp_list", [])
+        monkeypatch.setattr(processor, "inactive_ebp_list", [])
+        path = str(tmp_path / "pool.sock")
+        server = processor_pool.PoolServer(path, repo.eclass_cache, size=1)
+        ctx = multiprocessing.get_context("fork")
+        ready = ctx.Event()
+        proc = ctx.Process(target=server.serve, kwargs={"ready": ready.set})
+        proc.start()
+        try:
+            assert ready.wait(30)
+            monkeypatch.setenv("PKGCORE_EBD_POOL", path)
+            yield server
+        finally:
+            processor.shutdown_all_processors()
+            os.kill(proc.pid, signal.SIGTERM)
+            proc.join(30)
+        assert not os.path.exists(path)
+
+    def test_borrow(self, server, repo):
+        ebp = processor.request_ebuild_processor(pooled=True)
+        assert isinstance(ebp, processor_pool.LentProcessor)
+        pid = ebp.pid
+        assert ebp._preloaded_eclasses == {
+            "foo": repo.eclass_cache.eclasses["foo"].path
+        }
+        pkg = repo.match(atom("cat/pkg"))[0]
+        assert ebp.get_keys(pkg, repo.eclass_cache)["DESCRIPTION"] == "foo"
+
+        # all processors are lent out, others get spawned locally
+        other = processor.request_ebuild_processor(pooled=True)
+        assert not other.pooled
+        processor.drop_ebuild_processor(other)
+        other.shutdown_processor()
+
+        # returned processors are lent out again
+        processor.release_ebuild_processor(ebp)
+        processor.drop_ebuild_processor(ebp)
+        ebp.shutdown_processor()
+        assert ebp.pid is None
+        ebp = processor.request_ebuild_processor(pooled=True)
+        assert ebp.pid == pid
+        processor.release_ebuild_processor(ebp)
+
+        # processors only get borrowed when requested
+        ebp = processor.request_ebuild_processor()
+        assert not ebp.pooled
+        processor.release_ebuild_processor(ebp)
+
+    def test_stalled_client(self, server, repo):
+        # a client connecting without sending its request doesn't block others
+        with socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET) as stalled:
+            stalled.connect(server.path)
+            start = time.monotonic()
+            ebp = processor.request_ebuild_processor(pooled=True)
+            assert isinstance(ebp, processor_pool.LentProcessor)
+            assert time.monotonic() - start < 5
+            processor.release_ebuild_processor(ebp)
+
+    def test_mismatched_eclasses(self, server, repo, tmp_path):
+        (edir := tmp_path / "other").mkdir()
+        (edir / "foo.eclass").write_text('DESCRIPTION="other"\n')
+        ecache = eclass_cache.cache(str(edir))
+        ebp = processor.request_ebuild_processor(pooled=True)
+        pkg = repo.match(atom("cat/pkg"))[0]
+        assert ebp.get_keys(pkg, ecache)["DESCRIPTION"] == "other"
+        assert not ebp._preloaded_eclasses
+        processor.release_ebuild_processor(ebp)
@@ -710,6 +710,13 @@ class TestRepoConfig:
         assert repo_config.cache_format == "md5-dict"
         del repo_config
 
+        # packed md5 cache is favored when requested
+        with open(self.metadata_path, "w") as f:
+            f.write("cache-formats = md5-dict md5-pack\n")
+        repo_config = repo_objs.RepoConfig(self.repo_path)
+        assert repo_config.cache_format == "md5-pack"
+        del repo_config
+
     def test_profile_formats(self, caplog):
         os.mkdir(self.profiles_base)
         with open(os.path.join(self.profiles_base, "repo_name"), "w") as f:
@@ -1,13 +1,21 @@
+import os
 import textwrap
 from pathlib import Path
+from unittest import mock
 
 import pytest
 
-from pkgcore.ebuild import eclass_cache
+from pkgcore import const
+from pkgcore.cache import shared
+from pkgcore.cache.flat_hash import md5_cache
+from pkgcore.ebuild import eclass_cache, processor
 from pkgcore.ebuild import repository, restricts
 from pkgcore.ebuild.atom import atom
+from pkgcore.operations import regen
 from pkgcore.repository import errors
+from pkgcore.restrictions import packages, values
 from snakeoil.contexts import chdir
+from snakeoil.osutils import pjoin
 
 
 class TestUnconfiguredTree:
@@ -183,6 +191,32 @@ class TestUnconfiguredTree:
         assert {"cat": ("pkg",), "empty": ("empty",)} == dict(repo.packages)
         assert {("cat", "pkg"): ("3",), ("empty", "empty"): ()} == dict(repo.versions)
 
+    def test_layout_index(self, tmp_path):
+        (pkgdir := tmp_path / "cat" / "pkg").mkdir(parents=True)
+        (pkgdir / "pkg-1.ebuild").touch()
+        for path in (pkgdir, pkgdir.parent):
+            os.utime(path, ns=(0, 0))
+        repo = self.mk_tree(tmp_path)
+        assert repo.versions[("cat", "pkg")] == ("1",)
+        repo._layout_index.save()
+
+        # unchanged directories aren't listed again
+        repo = self.mk_tree(tmp_path)
+        with mock.patch("pkgcore.ebuild.repository.listdir_files") as listdir:
+            assert repo.versions[("cat", "pkg")] == ("1",)
+            assert not listdir.called
+
+        # recently modified directories are listed and not recorded
+        (pkgdir / "pkg-2.ebuild").touch()
+        repo = self.mk_tree(tmp_path)
+        assert sorted(repo.versions[("cat", "pkg")]) == ["1", "2"]
+        repo._layout_index.save()
+        repo = self.mk_tree(tmp_path)
+        with mock.patch("pkgcore.ebuild.repository.listdir_files") as listdir:
+            listdir.return_value = ["pkg-1.ebuild", "pkg-2.ebuild"]
+            assert sorted(repo.versions[("cat", "pkg")]) == ["1", "2"]
+            assert listdir.called
+
     def test_package_mask(self, tmp_path, pdir):
         (pdir / "package.mask").write_text(
             textwrap.dedent(
@@ -225,6 +259,221 @@ class TestUnconfiguredTree:
         }
         assert "line 4: parsing error:" in caplog.text
 
+    @pytest.mark.parametrize("processes", (False, True))
+    def test_regen_cache(self, tmp_path, pdir, processes):
+        for cpv, desc in (("cat/pkg-1", "one"), ("cat/pkg-2", "two")):
+            cat, pv = cpv.split("/")
+            pkg_dir = tmp_path / cat / pv.rsplit("-", 1)[0]
+            pkg_dir.mkdir(parents=True, exist_ok=True)
+            (pkg_dir / f"{pv}.ebuild").write_text(
+                f'EAPI=7\nDESCRIPTION="{desc}"\nSLOT="0"\n'
+            )
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        assert repo.operations.regen_cache(threads=2, processes=processes) == 0
+        assert sorted(cache) == ["cat/pkg-1", "cat/pkg-2"]
+        assert cache["cat/pkg-2"]["DESCRIPTION"] == "two"
+        # released processors keep their preloaded eclasses but not the caching
+        assert not any(x._eclass_caching for x in processor.inactive_ebp_list)
+        # valid entries are left alone on repeated runs
+        mtime = os.stat(pjoin(cache.location, "cat/pkg-1")).st_mtime_ns
+        assert repo.operations.regen_cache(threads=2, processes=processes) == 0
+        assert os.stat(pjoin(cache.location, "cat/pkg-1")).st_mtime_ns == mtime
+
+    @pytest.mark.parametrize("processes", (False, True))
+    def test_regen_cache_bad_metadata(self, tmp_path, pdir, processes):
+        (pkg_dir := tmp_path / "cat" / "pkg").mkdir(parents=True)
+        (pkg_dir / "pkg-1.ebuild").write_text('EAPI=7\nSLOT="0"\n')
+        (pkg_dir / "pkg-2.ebuild").write_text('EAPI=7\nSLOT="0"\ndie "broken"\n')
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        sourced = []
+        get_keys = processor.EbuildProcessor.get_keys
+
+        def _get_keys(self, pkg, *args, **kwargs):
+            sourced.append(pkg.cpvstr)
+            return get_keys(self, pkg, *args, **kwargs)
+
+        with mock.patch.object(processor.EbuildProcessor, "get_keys", _get_keys):
+            # the broken pkg is only sourced and reported once
+            assert repo.operations.regen_cache(processes=processes) == 1
+        # worker processes source pkgs with their own copy of the list
+        expected = [] if processes else ["cat/pkg-1", "cat/pkg-2"]
+        assert sorted(sourced) == expected
+        assert sorted(cache) == ["cat/pkg-1"]
+        assert [x.cpvstr for x in repo._bad_masked] == ["cat/pkg-2"]
+
+    def test_regen_cache_shared(self, tmp_path, pdir):
+        for pv in ("pkg-1", "pkg-2"):
+            (pkg_dir := tmp_path / "cat" / "pkg").mkdir(parents=True, exist_ok=True)
+            (pkg_dir / f"{pv}.ebuild").write_text('EAPI=7\nSLOT="0"\n')
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        assert repo.operations.regen_cache(threads=1) == 0
+
+        store = shared.database(str(tmp_path / "shm"))
+        repo = self.mk_tree(tmp_path, cache=(store, cache))
+        # valid entries of the regular cache aren't copied into the store
+        assert repo.operations.regen_cache(threads=1) == 0
+        assert not list(store.keys())
+        # regenerated entries are only written to the store
+        (tmp_path / "cat" / "pkg" / "pkg-3.ebuild").write_text('EAPI=7\nSLOT="0"\n')
+        repo = self.mk_tree(tmp_path, cache=(store, cache))
+        assert repo.operations.regen_cache(threads=1) == 0
+        assert list(store.keys()) == ["cat/pkg-3"]
+        assert "cat/pkg-3" not in cache
+        # pclonecache fills the store from the regular cache
+        store.clone(cache)
+        assert sorted(shared.database(str(tmp_path / "shm")).keys()) == [
+            "cat/pkg-1",
+            "cat/pkg-2",
+        ]
+
+    def test_regen_cache_batching(self, tmp_path, pdir):
+        for cpv in ("cat/a-1", "cat/b-1", "other/c-1"):
+            (pkg_dir := tmp_path / cpv.rsplit("-", 1)[0]).mkdir(parents=True)
+            (pkg_dir / f"{cpv.split('/')[1]}.ebuild").write_text('EAPI=7\nSLOT="0"\n')
+        cache = md5_cache(str(tmp_path), journal=True)
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        writes = []
+        write_entries = cache._write_entries
+        journal_entry = cache._journal_entry
+
+        def _write_entries(dirname, entries, **kwargs):
+            writes.append((dirname, sorted(entries)))
+            return write_entries(dirname, entries, **kwargs)
+
+        with (
+            mock.patch.object(cache, "_write_entries", side_effect=_write_entries),
+            mock.patch.object(
+                cache, "_journal_entry", side_effect=journal_entry
+            ) as journaled,
+        ):
+            assert repo.operations.regen_cache() == 0
+        # entries are written once per directory, journaled until then
+        assert sorted(writes) == [
+            ("cat/", ["cat/a-1", "cat/b-1"]),
+            ("other/", ["other/c-1"]),
+        ]
+        assert journaled.call_count == 3
+        assert not os.path.exists(cache.journal_path)
+        assert cache.sync_rate == cache.default_sync_rate
+        assert sorted(cache) == ["cat/a-1", "cat/b-1", "other/c-1"]
+
+    def test_metadata_index(self, tmp_path, pdir, monkeypatch):
+        monkeypatch.setattr(repository.UnconfiguredTree, "indexed_min_candidates", 2)
+        for pkg, license, keywords in (
+            ("a", "MIT", "amd64 ~x86"),
+            ("b", "|| ( GPL-2 BSD )", "~amd64"),
+            ("c", "foo? ( MIT )", "x86"),
+        ):
+            (pkg_dir := tmp_path / "cat" / pkg).mkdir(parents=True)
+            (pkg_dir / f"{pkg}-1.ebuild").write_text(
+                f'EAPI=7\nLICENSE="{license}"\nKEYWORDS="{keywords}"\nSLOT="0"\n'
+            )
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        assert repo.operations.regen_cache() == 0
+        # stale entries are always candidates
+        (tmp_path / "cat" / "b" / "b-1.ebuild").write_text(
+            'EAPI=7\nLICENSE="MIT"\nKEYWORDS="x86"\nSLOT="0"\n'
+        )
+
+        def query(restrict):
+            repo = self.mk_tree(tmp_path, cache=(cache,))
+            get_metadata = repo.package_class._get_metadata
+            with mock.patch.object(
+                repo.package_class, "_get_metadata", side_effect=get_metadata
+            ) as loaded:
+                matches = sorted(pkg.cpvstr for pkg in repo.itermatch(restrict))
+            return matches, sorted(
+                call.args[0].cpvstr for call in loaded.call_args_list
+            )
+
+        bsd = packages.PackageRestriction("license", values.ContainmentMatch("BSD"))
+        assert query(bsd) == ([], ["cat/b-1"])
+        # conditional licenses are indexed, matching decides whether they apply
+        license = packages.PackageRestriction("license", values.ContainmentMatch("MIT"))
+        assert query(license) == (
+            ["cat/a-1", "cat/b-1"],
+            ["cat/a-1", "cat/b-1", "cat/c-1"],
+        )
+        x86 = packages.PackageRestriction("keywords", values.ContainmentMatch("x86"))
+        assert query(packages.AndRestriction(license, x86)) == (
+            ["cat/b-1"],
+            ["cat/b-1", "cat/c-1"],
+        )
+        amd64 = packages.PackageRestriction(
+            "keywords", values.ContainmentMatch("amd64")
+        )
+        assert query(packages.OrRestriction(amd64, bsd)) == (["cat/a-1"], ["cat/a-1"])
+        # negated restrictions can't be narrowed
+        assert query(
+            packages.PackageRestriction(
+                "keywords", values.ContainmentMatch("x86", negate=True)
+            )
+        )[1] == ["cat/a-1", "cat/b-1", "cat/c-1"]
+
+        # queries spanning few packages check them directly
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        restrict = packages.AndRestriction(
+            restricts.CategoryDep("cat"), restricts.PackageDep("a"), license
+        )
+        assert [pkg.cpvstr for pkg in repo.itermatch(restrict)] == ["cat/a-1"]
+        assert getattr(repo, "_jit_reset_metadata_index", None) is None
+
+        # the indexes are rebuilt after cache entries are written
+        assert not list(repo.itermatch(bsd))
+        (tmp_path / "cat" / "c" / "c-1.ebuild").write_text(
+            'EAPI=7\nLICENSE="BSD"\nSLOT="0"\n'
+        )
+        assert repo.operations.regen_cache() == 0
+        assert [pkg.cpvstr for pkg in repo.itermatch(bsd)] == ["cat/c-1"]
+
+    def test_regen_cache_incremental(self, tmp_path, pdir, monkeypatch):
+        monkeypatch.setattr(const, "USER_CACHE_PATH", str(tmp_path / "user-cache"))
+        (tmp_path / "eclass").mkdir()
+        (eclass := tmp_path / "eclass" / "foo.eclass").write_text('DESCRIPTION="foo"\n')
+        for pkg, inherit in (("a", "inherit foo\n"), ("b", ""), ("c", "")):
+            (pkg_dir := tmp_path / "cat" / pkg).mkdir(parents=True)
+            (pkg_dir / f"{pkg}-1.ebuild").write_text(f'EAPI=7\n{inherit}SLOT="0"\n')
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+
+        # the first run regenerates everything
+        changed_paths, state = regen.incremental_changes(repo)
+        assert changed_paths is None
+        assert repo.operations.regen_cache(changed_paths=changed_paths) == 0
+        regen.save_incremental_state(repo, state)
+        assert sorted(cache) == ["cat/a-1", "cat/b-1", "cat/c-1"]
+
+        eclass.write_text('DESCRIPTION="bar"\n')
+        os.utime(eclass, ns=(0, 0))
+        (tmp_path / "cat" / "b" / "b-1.ebuild").unlink()
+        repo = self.mk_tree(tmp_path, cache=(cache,))
+        changed_paths, state = regen.incremental_changes(repo)
+        assert changed_paths == {"eclass/foo.eclass", "cat/b/b-1.ebuild"}
+        pkgs, removed = repo.changed_metadata(changed_paths)
+        assert [pkg.cpvstr for pkg in pkgs] == ["cat/a-1"]
+        assert removed == {"cat/b-1"}
+        assert repo.operations.regen_cache(changed_paths=changed_paths) == 0
+        regen.save_incremental_state(repo, state)
+        assert sorted(cache) == ["cat/a-1", "cat/c-1"]
+        assert cache["cat/a-1"]["DESCRIPTION"] == "bar"
+
+        # changes reported by syncing take precedence over the snapshot
+        regen.record_synced_paths(str(tmp_path), {"cat/c/c-1.ebuild", "cat/c/Manifest"})
+        changed_paths, state = regen.incremental_changes(repo)
+        assert changed_paths == {"cat/c/c-1.ebuild", "cat/c/Manifest"}
+        regen.save_incremental_state(repo, state)
+        # unknown sync changes fall back to the snapshot
+        regen.record_synced_paths(str(tmp_path), {"cat/c/c-1.ebuild"})
+        regen.record_synced_paths(str(tmp_path), None)
+        assert regen.incremental_changes(repo)[0] == set()
+
+        # layout changes can affect any package
+        assert repo.changed_metadata(["metadata/layout.conf"]) is None
+
 
 class TestSlavedTree(TestUnconfiguredTree):
     def mk_tree(self, path, *args, **kwds):
@@ -382,3 +631,50 @@ class TestSlavedTree(TestUnconfiguredTree):
     def test_masters(self, slave_repo):
         repo = self.mk_tree(slave_repo)
         assert repo.masters == (self.master_repo,)
+
+    def test_regen_cache_incremental_masters(
+        self, tmp_path, master_repo, slave_repo, monkeypatch
+    ):
+        monkeypatch.setattr(const, "USER_CACHE_PATH", str(tmp_path / "user-cache"))
+        (master_repo / "eclass").mkdir()
+        eclass = master_repo / "eclass" / "foo.eclass"
+        eclass.write_text('DESCRIPTION="foo"\n')
+        for pkg, inherit in (("a", "inherit foo\n"), ("b", "")):
+            (pkg_dir := slave_repo / "cat" / pkg).mkdir(parents=True)
+            (pkg_dir / f"{pkg}-1.ebuild").write_text(f'EAPI=7\n{inherit}SLOT="0"\n')
+        cache = md5_cache(str(slave_repo))
+
+        def mk_tree():
+            eclasses = eclass_cache.StackedCaches(
+                [
+                    eclass_cache.cache(str(slave_repo / "eclass")),
+                    eclass_cache.cache(str(master_repo / "eclass")),
+                ],
+                location=str(slave_repo),
+                eclassdir=str(slave_repo),
+            )
+            return self.mk_tree(slave_repo, eclass_cache=eclasses, cache=(cache,))
+
+        repo = mk_tree()
+        changed_paths, state = regen.incremental_changes(repo)
+        assert repo.operations.regen_cache(changed_paths=changed_paths) == 0
+        regen.save_incremental_state(repo, state)
+        assert cache["cat/a-1"]["DESCRIPTION"] == "foo"
+
+        # master eclass changes are picked up alongside sync changes
+        eclass.write_text('DESCRIPTION="bar"\n')
+        os.utime(eclass, ns=(0, 0))
+        regen.record_synced_paths(str(slave_repo), {"cat/b/b-1.ebuild"})
+        repo = mk_tree()
+        changed_paths, state = regen.incremental_changes(repo)
+        assert changed_paths == {"cat/b/b-1.ebuild", str(eclass)}
+        pkgs, removed = repo.changed_metadata(changed_paths)
+        assert [pkg.cpvstr for pkg in pkgs] == ["cat/a-1", "cat/b-1"]
+        assert not removed
+        assert repo.operations.regen_cache(changed_paths=changed_paths) == 0
+        regen.save_incremental_state(repo, state)
+        assert cache["cat/a-1"]["DESCRIPTION"] == "bar"
+
+        # and via the snapshot
+        os.utime(eclass, ns=(1, 1))
+        assert regen.incremental_changes(repo)[0] == {str(eclass)}
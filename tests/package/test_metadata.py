@@ -1,3 +1,7 @@
+from pickle import dumps, loads
+
+import pytest
+
 from pkgcore.package import base, metadata
 
 
@@ -46,3 +50,66 @@ class TestMetadataPackage:
         kls = make_pkg_kls()
         o = kls(None, data={"a": "b"})
         assert o.data == {"a": "b"}
+
+
+class TestMetadataRecord:
+    def test_mapping(self):
+        data = {"EAPI": "8", "SLOT": "0", "IDEPEND": "dev-libs/foo", "FOO": "bar"}
+        record = metadata.MetadataRecord.from_metadata(data)
+        assert record == data
+        assert len(record) == 4
+        assert sorted(record) == sorted(data)
+        assert "SLOT" in record
+        assert "KEYWORDS" not in record
+        assert record.get("KEYWORDS") is None
+        assert record.pop("KEYWORDS", "") == ""
+        with pytest.raises(KeyError):
+            record["KEYWORDS"]
+
+        # keys outside the schema are supported
+        assert record.pop("FOO") == "bar"
+        assert "FOO" not in record
+        assert record.pop("SLOT") == "0"
+        with pytest.raises(KeyError):
+            record.pop("SLOT")
+        with pytest.raises(KeyError):
+            del record["FOO"]
+        record["KEYWORDS"] = "~amd64"
+        assert record == {"EAPI": "8", "IDEPEND": "dev-libs/foo", "KEYWORDS": "~amd64"}
+
+    def test_schema(self):
+        eapi8 = metadata.MetadataRecord.from_metadata({"EAPI": "8"})
+        eapi0 = metadata.MetadataRecord.from_metadata({"SLOT": "0"})
+        invalid = metadata.MetadataRecord.from_metadata({"EAPI": "@"})
+        assert (
+            eapi8._schema
+            is metadata.MetadataRecord.from_metadata({"EAPI": "8"})._schema
+        )
+        assert eapi8._schema is not eapi0._schema
+        # keys are driven by the EAPI
+        assert "IDEPEND" in eapi8._schema.index
+        assert "IDEPEND" not in eapi0._schema.index
+        assert "IDEPEND" in invalid._schema.index
+        eapi0["IDEPEND"] = "dev-libs/foo"
+        assert eapi0["IDEPEND"] == "dev-libs/foo"
+
+    def test_interned(self):
+        slot = "".join(("sl", "ot"))
+        depend = "".join(("dev-libs/", "foo"))
+        records = [
+            metadata.MetadataRecord.from_metadata(
+                {"SLOT": "".join(("sl", "ot")), "DEPEND": "".join(("dev-libs/", "foo"))}
+            )
+            for _ in range(2)
+        ]
+        assert records[0]["SLOT"] is records[1]["SLOT"]
+        assert records[0]["SLOT"] == slot
+        assert records[0]["DEPEND"] == depend
+        # only commonly repeated values are interned
+        assert records[0]["DEPEND"] is not records[1]["DEPEND"]
+
+    def test_pickle(self):
+        record = metadata.MetadataRecord.from_metadata({"EAPI": "8", "FOO": "bar"})
+        unpickled = loads(dumps(record))
+        assert unpickled == record
+        assert unpickled._schema is record._schema
@@ -0,0 +1,56 @@
+from pkgcore import const
+from pkgcore.cache.flat_hash import md5_cache
+from pkgcore.ebuild import eclass_cache, repository
+from pkgcore.ebuild.atom import atom
+from pkgcore.pkgsets.live_rebuild_set import EclassConsumerSet
+from pkgcore.repository.util import SimpleTree
+
+
+class FakePkg:
+    package_is_real = True
+    is_supported = True
+
+    def __init__(self, cat, pn, ver):
+        self.versioned_atom = atom(f"={cat}/{pn}-{ver}")
+
+
+class TestEclassConsumerSet:
+    def mk_tree(self, path, cache):
+        ecache = eclass_cache.cache(str(path / "eclass"))
+        return repository.UnconfiguredTree(
+            str(path), eclass_cache=ecache, cache=(cache,)
+        )
+
+    def test_iter(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(const, "USER_CACHE_PATH", str(tmp_path / "user-cache"))
+        (tmp_path / "profiles").mkdir()
+        (tmp_path / "metadata").mkdir()
+        (tmp_path / "metadata" / "layout.conf").write_text("masters =\n")
+        (tmp_path / "eclass").mkdir()
+        (tmp_path / "eclass" / "foo.eclass").write_text('HOMEPAGE="https://foo"\n')
+        for pkg, inherit in (("a", "inherit foo\n"), ("b", ""), ("c", "")):
+            (pkg_dir := tmp_path / "cat" / pkg).mkdir(parents=True)
+            (pkg_dir / f"{pkg}-1.ebuild").write_text(f'EAPI=7\n{inherit}SLOT="0"\n')
+        cache = md5_cache(str(tmp_path))
+        repo = self.mk_tree(tmp_path, cache)
+        assert repo.operations.regen_cache() == 0
+        vdb = SimpleTree(
+            {"cat": {"a": ["1"], "b": ["1"], "c": ["1"]}}, pkg_klass=FakePkg
+        )
+
+        pkgset = EclassConsumerSet([vdb], [repo], ["foo"])
+        assert sorted(map(str, pkgset)) == ["=cat/b-1", "=cat/c-1"]
+
+        # stale entries fall back to the package's metadata
+        (tmp_path / "cat" / "a" / "a-1.ebuild").write_text('EAPI=7\nSLOT="0"\n')
+        (tmp_path / "cat" / "b" / "b-1.ebuild").write_text(
+            'EAPI=7\ninherit foo\nSLOT="0"\n'
+        )
+        # corrupted entries don't count as consumers either
+        (entry := tmp_path / "metadata" / "md5-cache" / "cat" / ".c-1").write_text(
+            "garbage\n"
+        )
+        entry.rename(entry.with_name("c-1"))
+        repo = self.mk_tree(tmp_path, cache)
+        pkgset = EclassConsumerSet([vdb], [repo], ["foo"])
+        assert sorted(map(str, pkgset)) == ["=cat/a-1", "=cat/c-1"]
@@ -1,6 +1,9 @@
+import time
 from collections import OrderedDict
 from functools import partial
 
+import pytest
+
 from pkgcore.repository.multiplex import tree
 from pkgcore.repository.util import SimpleTree
 from pkgcore.restrictions import packages, values
@@ -60,3 +63,76 @@ class TestMultiplex:
             x.cpvstr
             for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=rev_sorted)
         ) == rev_sorted(self.tree1_list + self.tree2_list)
+
+    def test_itermatch_trees(self):
+        for threads in (None, 2):
+            ctree = self.kls(self.tree1, self.tree2, threads=threads)
+            matches = ctree.itermatch_trees(packages.AlwaysTrue, sorter=rev_sorted)
+            assert [(repo, [x.cpvstr for x in pkgs]) for repo, pkgs in matches] == [
+                (self.tree1, rev_sorted(self.tree1_list)),
+                (self.tree2, rev_sorted(self.tree2_list)),
+            ]
+
+    def test_threaded_itermatch(self):
+        ctree = self.kls(self.tree1, self.tree2, threads=2)
+        for sorter in (iter, sorted, rev_sorted):
+            assert [
+                x.cpvstr for x in ctree.itermatch(packages.AlwaysTrue, sorter=sorter)
+            ] == [
+                x.cpvstr
+                for x in self.ctree.itermatch(packages.AlwaysTrue, sorter=sorter)
+            ]
+
+        # results can be abandoned early
+        matches = ctree.itermatch(packages.AlwaysTrue)
+        assert next(matches).cpvstr == next(iter(self.ctree)).cpvstr
+        matches.close()
+
+        # errors are raised in the consuming thread
+        def itermatch(*args, **kwargs):
+            raise KeyError("broken repo")
+
+        self.tree2.itermatch = itermatch
+        with pytest.raises(KeyError, match="broken repo"):
+            list(ctree.itermatch(packages.AlwaysTrue))
+
+    def test_deferred_itermatch_trees(self):
+        def itermatch(*args, **kwargs):
+            raise KeyError("broken repo")
+
+        self.tree2.itermatch = itermatch
+        matches = self.ctree.itermatch_trees(packages.AlwaysTrue)
+        repo, pkgs = next(matches)
+        assert repo is self.tree1
+        assert len(list(pkgs)) == len(self.tree1_list)
+        # trees are only queried once their matches are consumed
+        repo, pkgs = next(matches)
+        with pytest.raises(KeyError, match="broken repo"):
+            next(pkgs)
+
+    def test_threaded_abandoned(self):
+        class EndlessTree:
+            produced = 0
+
+            def itermatch(self, restrict, **kwargs):
+                while True:
+                    self.produced += 1
+                    yield self.produced
+
+        trees = EndlessTree(), EndlessTree()
+        ctree = self.kls(*trees, threads=2)
+        ctree.match_buffer = 10
+        matches = ctree.itermatch_trees(packages.AlwaysTrue)
+        repo, pkgs = next(matches)
+        assert next(pkgs) == 1
+        # abandoning a repo's matches stops its worker
+        pkgs.close()
+        repo, pkgs = next(matches)
+        assert next(pkgs) == 1
+        time.sleep(0.3)
+        produced = [x.produced for x in trees]
+        # workers only queue a bounded number of matches ahead
+        assert all(x <= ctree.match_buffer + 2 for x in produced)
+        time.sleep(0.3)
+        assert [x.produced for x in trees] == produced
+        matches.close()
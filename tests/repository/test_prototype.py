@@ -186,6 +186,29 @@ class TestPrototype:
             VersionedCPV(x) for x in ("dev-lib/fake-1.0", "dev-lib/fake-1.0-r1")
         )
 
+    def test_atom_versions(self):
+        versions = ["1.0", "1.0-r1", "1.0-r2", "0.7", "1.1_rc1", "1.1", "2"]
+        repo = SimpleTree({"dev-util": {"diffball": versions}})
+        all_pkgs = [VersionedCPV("dev-util", "diffball", x) for x in versions]
+        for op in ("<", "<=", "=", "~", ">=", ">"):
+            for ver in ("0.1", "0.7", "1.0", "1.0-r1", "1.1_rc1", "1.1", "3"):
+                if op == "~" and "-r" in ver:
+                    continue
+                a = atom(f"{op}dev-util/diffball-{ver}")
+                assert sorted(repo.itermatch(a)) == sorted(
+                    x for x in all_pkgs if a.match(x)
+                ), a
+        # unparsable versions are left for the regular handling
+        repo = SimpleTree({"dev-util": {"diffball": versions + ["1-foo"]}})
+        assert repo._atom_versions(atom(">dev-util/diffball-1.1")) == {
+            ("dev-util", "diffball"): ("2", "1-foo")
+        }
+        assert repo._atom_versions(atom("~dev-util/diffball-1.0")) == {
+            ("dev-util", "diffball"): ("1.0", "1.0-r1", "1.0-r2", "1-foo")
+        }
+        assert repo._atom_versions(atom("=dev-util/diffball-1*")) is None
+        assert repo._atom_versions(atom(">=dev-util/bsdiff-1")) is None
+
     def test_iter(self):
         expected = sorted(
             VersionedCPV(x)
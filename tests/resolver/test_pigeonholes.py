@@ -1,6 +1,8 @@
 import pytest
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver.pigeonholes import PigeonHoledSlots
 from pkgcore.restrictions import restriction
+from pkgcore.test.misc import FakePkg
 
 from .test_choice_point import fake_package
 
@@ -58,3 +60,34 @@ class TestSlot:
         assert not c.fill_slotting(p2)
         c.remove_slotting(p)
         c.remove_slotting(p2)
+
+    def test_slotted_limiters(self):
+        c = PigeonHoledSlots()
+        pkgs = [FakePkg(f"dev-lang/python-3.{x}", slot=f"3.{x}") for x in (11, 12)]
+        for pkg in pkgs:
+            assert not c.fill_slotting(pkg)
+        blocker = atom("!dev-lang/python:3.12")
+        assert c.add_limiter(blocker) == [pkgs[1]]
+        assert c.check_limiters(pkgs[0]) == []
+        assert c.check_limiters(pkgs[1]) == [blocker]
+        assert blocker in c
+        unslotted = atom("!<dev-lang/python-4")
+        assert c.add_limiter(unslotted) == pkgs
+        assert c.check_limiters(pkgs[1]) == [unslotted, blocker]
+        c.remove_limiter(blocker)
+        assert blocker not in c
+        assert c.check_limiters(pkgs[1]) == [unslotted]
+        assert c.find_atom_matches(atom("dev-lang/python:3.11")) == [pkgs[0]]
+
+    def test_remove_by_identity(self):
+        c = PigeonHoledSlots()
+        p, p2 = FakePkg("dev-libs/foo-1"), FakePkg("dev-libs/foo-1")
+        assert not c.fill_slotting(p)
+        assert c.fill_slotting(p2, force=True) == [p]
+        c.remove_slotting(p)
+        assert c.get_conflicting_slot(p) is p2
+        with pytest.raises(KeyError):
+            c.remove_slotting(p)
+        c.remove_slotting(p2)
+        assert p not in c
+        assert not c.slot_dict
@@ -1,6 +1,8 @@
 import pytest
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
 from pkgcore.resolver import plan
-from pkgcore.test.misc import FakePkg
+from pkgcore.test.misc import FakePkg, FakeRepo
 
 
 @pytest.mark.parametrize(
@@ -28,3 +30,205 @@ def test_pkg_sorting(sorter, vers, expected, iter_sort_target):
     if iter_sort_target:
         pkgs = [x[0] for x in pkgs]
     assert [int(x.fullver) for x in pkgs] == expected
+
+
+def make_repo(pkgs, slots=None, livefs=False, **kwargs):
+    repo = FakeRepo(livefs=livefs, **kwargs)
+    if slots is None:
+        slots = {}
+    repo.pkgs = [
+        FakePkg(
+            cpv,
+            eapi="8",
+            slot=slots.get(cpv, "0"),
+            repo=repo,
+            data={"EAPI": "8", "RDEPEND": rdepend},
+        )
+        for cpv, rdepend in pkgs.items()
+    ]
+    return repo
+
+
+class TestSolutionCache:
+    pkgs = {
+        "app-misc/foo-2": "dev-libs/a dev-libs/missing",
+        "app-misc/foo-1": "dev-libs/a dev-libs/c",
+        "dev-libs/a-1": "dev-libs/b",
+        "dev-libs/b-1": "",
+        "dev-libs/c-2": "dev-libs/d",
+        "dev-libs/c-1": "dev-libs/d",
+        "dev-libs/d-1": "dev-libs/b",
+    }
+
+    def resolve(self, pkgs, cache=True):
+        repo = make_repo(pkgs)
+        vdb = make_repo({}, livefs=True)
+        merge_plan = resolver.upgrade_resolver([vdb], [repo])
+        if not cache:
+            merge_plan._record_solution = merge_plan._record_failure = (
+                lambda *args: None
+            )
+        spliced = []
+        splice = merge_plan._splice_solution
+
+        def _splice_solution(frame):
+            if ret := splice(frame):
+                spliced.append(str(frame.atom))
+            return ret
+
+        merge_plan._splice_solution = _splice_solution
+        ret = merge_plan.add_atoms([atom("app-misc/foo")])
+        return ret, [str(op) for op in merge_plan.state.iter_ops()], spliced
+
+    def test_solutions(self):
+        ret, ops, spliced = self.resolve(self.pkgs)
+        assert not ret
+        # dev-libs/a was resolved for foo-2 and reused after it failed
+        assert spliced == ["dev-libs/a"]
+        assert (ret, ops) == self.resolve(self.pkgs, cache=False)[:2]
+        assert ops == [
+            "add: ebuild src: dev-libs/b-1",
+            "add: ebuild src: dev-libs/a-1",
+            "add: ebuild src: dev-libs/d-1",
+            "add: ebuild src: dev-libs/c-2",
+            "add: ebuild src: app-misc/foo-1",
+        ]
+
+    def test_state_dependent_solutions(self):
+        pkgs = {
+            "app-misc/foo-2": "=dev-libs/z-1 dev-libs/a dev-libs/missing",
+            "app-misc/foo-1": "dev-libs/a",
+            "dev-libs/a-2": "=dev-libs/z-2",
+            "dev-libs/a-1": "",
+            "dev-libs/z-2": "",
+            "dev-libs/z-1": "",
+        }
+        ret, ops, spliced = self.resolve(pkgs)
+        assert not ret
+        # dev-libs/a-1 was only picked for foo-2 since dev-libs/z-1 was planned
+        assert not spliced
+        assert (ret, ops) == self.resolve(pkgs, cache=False)[:2]
+        assert ops == [
+            "add: ebuild src: dev-libs/z-2",
+            "add: ebuild src: dev-libs/a-2",
+            "add: ebuild src: app-misc/foo-1",
+        ]
+
+    def test_failures(self, monkeypatch):
+        pkgs = {
+            "app-misc/foo-2": "dev-libs/d",
+            "app-misc/foo-1": "dev-libs/c",
+            "dev-libs/c-1": "dev-libs/d",
+            "dev-libs/d-1": "dev-libs/e",
+            "dev-libs/e-1": "dev-libs/missing",
+        }
+        processed = []
+        process = plan.merge_plan.process_dependencies_and_blocks
+
+        def _process(self, stack, choices, attr, *args, **kwargs):
+            processed.append((choices.current_pkg.cpvstr, attr))
+            return process(self, stack, choices, attr, *args, **kwargs)
+
+        monkeypatch.setattr(
+            plan.merge_plan, "process_dependencies_and_blocks", _process
+        )
+        ret, ops, _ = self.resolve(pkgs)
+        assert ret
+        assert not ops
+        # dev-libs/d failing for foo-2 is reused for dev-libs/c-1 in the same state
+        assert processed.count(("dev-libs/d-1", "rdepend")) == 1
+        processed.clear()
+        uncached_ret, uncached_ops, _ = self.resolve(pkgs, cache=False)
+        assert uncached_ret
+        assert ops == uncached_ops
+        # the cached failure reports the chain of the original failure
+        assert ret[0][-1] == atom("dev-libs/missing")
+        assert processed.count(("dev-libs/d-1", "rdepend")) == 2
+
+
+class TestConflictLearning:
+    pkgs = {
+        "app-misc/foo-1": "=dev-libs/lib-1",
+        "app-misc/bar-2": "dev-libs/x dev-libs/wrap-x",
+        "app-misc/bar-1": "dev-libs/y dev-libs/wrap-y",
+        "dev-libs/x-1": "",
+        "dev-libs/y-1": "",
+        "dev-libs/wrap-x-1": "dev-libs/mid",
+        "dev-libs/wrap-y-1": "dev-libs/mid",
+        "dev-libs/mid-1": ">=dev-libs/lib-2",
+        "dev-libs/lib-2": "dev-libs/heavy",
+        "dev-libs/lib-1": "",
+        "dev-libs/heavy-1": "",
+    }
+
+    def resolve(self, monkeypatch, learning=True):
+        processed = []
+        process = plan.merge_plan.process_dependencies_and_blocks
+
+        def _process(self, stack, choices, attr, *args, **kwargs):
+            processed.append((choices.current_pkg.cpvstr, attr))
+            return process(self, stack, choices, attr, *args, **kwargs)
+
+        monkeypatch.setattr(
+            plan.merge_plan, "process_dependencies_and_blocks", _process
+        )
+        merge_plan = resolver.upgrade_resolver(
+            [make_repo({}, livefs=True)], [make_repo(self.pkgs)]
+        )
+        if not learning:
+            merge_plan._doomed = lambda stack, pkg: []
+            merge_plan._learned_failure = lambda frame: None
+        assert not merge_plan.add_atoms([atom("app-misc/foo")])
+        ret = merge_plan.add_atoms([atom("app-misc/bar")])
+        ops = [str(op) for op in merge_plan.state.iter_ops()]
+        monkeypatch.undo()
+        return ret, ops, processed
+
+    def test_nogoods(self, monkeypatch):
+        ret, ops, processed = self.resolve(monkeypatch)
+        assert ret
+        uncached_ret, uncached_ops, uncached_processed = self.resolve(
+            monkeypatch, learning=False
+        )
+        assert uncached_ret
+        assert (
+            ops
+            == uncached_ops
+            == [
+                "add: ebuild src: dev-libs/lib-1",
+                "add: ebuild src: app-misc/foo-1",
+            ]
+        )
+        # dev-libs/lib-2 can't be inserted next to the planned dev-libs/lib-1
+        # so its deps aren't resolved
+        assert ("dev-libs/lib-2", "rdepend") not in processed
+        assert ("dev-libs/lib-2", "rdepend") in uncached_processed
+        # dev-libs/mid failing due to dev-libs/lib-1 is learned for bar-2 and
+        # reused for bar-1 in a different plan state
+        assert processed.count(("dev-libs/mid-1", "rdepend")) == 1
+        assert uncached_processed.count(("dev-libs/mid-1", "rdepend")) == 2
+
+    def test_open_frames(self):
+        # c/p3-4 blocking c/p0 is planned while resolving c/p1-4, it mustn't
+        # doom c/p0 for the c/p1-3 choice resolved after backtracking over it
+        pkgs = {
+            "c/p0-1": ">=c/p2-4 c/p2 >=c/p0-2",
+            "c/p0-2": "<c/p4-4 || ( =c/p2-2 c/p1 )",
+            "c/p0-4": "<c/p4-2",
+            "c/p1-3": "c/p4",
+            "c/p1-4": ">=c/p3-1 >=c/p4-1 !c/p1",
+            "c/p2-2": "",
+            "c/p2-3": "!<c/p4-3",
+            "c/p2-4": "c/p0 >=c/p4-1",
+            "c/p3-4": "c/p1 !c/p0 =c/p1-4",
+            "c/p4-2": "c/p2",
+        }
+        repo = make_repo(pkgs, slots={"c/p1-3": "1", "c/p3-4": "1"})
+        merge_plan = resolver.upgrade_resolver([make_repo({}, livefs=True)], [repo])
+        assert not merge_plan.add_atoms([atom("c/p1")])
+        assert [str(op) for op in merge_plan.state.iter_ops()] == [
+            "add: ebuild src: c/p0-2",
+            "add: ebuild src: c/p2-4",
+            "add: ebuild src: c/p4-2",
+            "add: ebuild src: c/p1-3",
+        ]
@@ -0,0 +1,140 @@
+from itertools import combinations
+
+import pytest
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.conditionals import DepSet
+from pkgcore.resolver import plan, sat
+from pkgcore.resolver.util import reduce_to_failures
+from pkgcore.restrictions import values
+
+from .test_plan import make_repo
+
+
+class TestSolver:
+    def test_satisfiable(self):
+        solver = sat.Solver()
+        a, b, c = (solver.new_var() for _ in range(3))
+        solver.add_clause([a, b])
+        solver.add_clause([-a, c])
+        solver.add_clause([-c, -b])
+        model = solver.solve()
+        assert model[a] or model[b]
+        assert not model[a] or model[c]
+        assert not (model[b] and model[c])
+
+        # assumptions don't persist
+        assert solver.solve([b, c]) is None
+        assert solver.solve([b])[b]
+
+    def test_decide(self):
+        solver = sat.Solver()
+        a, b = solver.new_var(), solver.new_var()
+        solver.add_clause([a, b])
+        # variables default to false, forcing the last one true
+        assert solver.solve()[b]
+        assert solver.solve(decide=lambda value: None if value(a) else a)[a]
+
+    def test_pigeonhole(self):
+        # three pigeons can't share two holes
+        solver = sat.Solver()
+        holes = [[solver.new_var() for _ in range(2)] for _ in range(3)]
+        for pigeon in holes:
+            solver.add_clause(pigeon)
+        for hole in range(2):
+            for x, y in combinations(holes, 2):
+                solver.add_clause([-x[hole], -y[hole]])
+        assert solver.solve() is None
+        assert solver.conflicts
+
+
+class TestSatMergePlan:
+    pkgs = {
+        "app-misc/foo-2": "|| ( dev-libs/a dev-libs/b ) !app-misc/bar",
+        "app-misc/foo-1": "dev-libs/b",
+        "app-misc/bar-1": "",
+        "dev-libs/a-1": "dev-libs/missing",
+        "dev-libs/b-2": "dev-libs/c",
+        "dev-libs/b-1": "",
+        "dev-libs/c-1": "",
+    }
+
+    def resolve(self, *atoms, resolver_cls=sat.sat_merge_plan, installed=(), repo=None):
+        if repo is None:
+            repo = make_repo(self.pkgs)
+        vdb = make_repo({x: "" for x in installed}, livefs=True)
+        merge_plan = resolver.upgrade_resolver([vdb], [repo], resolver_cls=resolver_cls)
+        ret = merge_plan.add_atoms([atom(x) for x in atoms])
+        return ret, [str(op) for op in merge_plan.state.iter_ops()]
+
+    def test_default_resolver_ops(self):
+        for atoms in (["app-misc/foo"], ["dev-libs/b", "app-misc/foo"]):
+            installed = ["dev-libs/b-1"]
+            ret, ops = self.resolve(*atoms, installed=installed)
+            assert not ret
+            default = self.resolve(
+                *atoms, installed=installed, resolver_cls=plan.merge_plan
+            )
+            assert ops == default[1]
+        assert ops == [
+            "add: ebuild src: dev-libs/c-1",
+            "replace: ebuild src: dev-libs/b-1 with ebuild src: dev-libs/b-2",
+            "add: ebuild src: app-misc/foo-2",
+        ]
+
+    def test_blockers(self):
+        # foo-2 blocks bar, the formula solves for foo-1 instead
+        ret, ops = self.resolve("app-misc/foo", "app-misc/bar")
+        assert not ret
+        assert ops == [
+            "add: ebuild src: dev-libs/c-1",
+            "add: ebuild src: dev-libs/b-2",
+            "add: ebuild src: app-misc/foo-1",
+            "add: ebuild src: app-misc/bar-1",
+        ]
+        ret, ops = self.resolve("=app-misc/foo-2", "app-misc/bar")
+        assert ret[0] == [atom("app-misc/bar")]
+
+    def test_required_use(self):
+        repo = make_repo(self.pkgs)
+        ret, ops = self.resolve("dev-libs/b", repo=repo)
+        assert ops == ["add: ebuild src: dev-libs/c-1", "add: ebuild src: dev-libs/b-2"]
+
+        pkg = repo.match(atom("=dev-libs/b-2"))[0]
+        required_use = DepSet.parse("test", values.ContainmentMatch)
+        object.__setattr__(pkg, "required_use", required_use)
+        ret, ops = self.resolve("dev-libs/b", repo=repo)
+        assert ops == ["add: ebuild src: dev-libs/b-1"]
+
+    def test_failures(self):
+        ret, ops = self.resolve("dev-libs/a")
+        assert ret[0] == [atom("dev-libs/a")]
+        frame, (pkg, events) = reduce_to_failures(ret[1])
+        assert frame.atom == atom("dev-libs/a")
+        assert pkg.cpvstr == "dev-libs/a-1"
+        assert events == [
+            (
+                "choice",
+                "ebuild src: dev-libs/a-1",
+                False,
+                "dependencies can't be satisfied",
+            )
+        ]
+        ret, ops = self.resolve("dev-libs/missing")
+        assert ret[0] == [atom("dev-libs/missing")]
+        assert not ops
+
+    @pytest.mark.parametrize("installed", ((), ("dev-libs/b-1",)))
+    def test_incremental(self, installed):
+        repo = make_repo(self.pkgs)
+        vdb = make_repo({x: "" for x in installed}, livefs=True)
+        merge_plan = resolver.upgrade_resolver(
+            [vdb], [repo], resolver_cls=sat.sat_merge_plan
+        )
+        assert not merge_plan.add_atoms([atom("=app-misc/foo-2")])
+        ret = merge_plan.add_atoms([atom("app-misc/bar")])
+        assert ret[0] == [atom("app-misc/bar")]
+        merge_plan.reset()
+        assert not merge_plan.add_atoms([atom("app-misc/bar")])
+        ops = [str(op) for op in merge_plan.state.iter_ops()]
+        assert ops == ["add: ebuild src: app-misc/bar-1"]
@@ -0,0 +1,127 @@
+from pkgcore.ebuild import resolver
+from pkgcore.ebuild.atom import atom
+from pkgcore.resolver import speculative, state
+
+from .test_plan import make_repo
+
+
+class TestSpeculation:
+    pkgs = {
+        "app-misc/a-1": "dev-libs/x !app-misc/blocked",
+        "app-misc/b-1": "dev-libs/y",
+        "app-misc/c-1": "|| ( dev-libs/z dev-libs/x )",
+        "app-misc/d-1": "dev-libs/missing",
+        "app-misc/blocked-1": "",
+        "dev-libs/x-2": "",
+        "dev-libs/x-1": "",
+        "dev-libs/y-1": "",
+        "dev-libs/z-1": "",
+    }
+    targets = ["app-misc/a", "app-misc/b", "app-misc/c", "app-misc/d"]
+
+    def merge_plan(self, **kwargs):
+        repo = make_repo(self.pkgs)
+        vdb = make_repo({"dev-libs/y-1": ""}, livefs=True)
+        return resolver.upgrade_resolver([vdb], [repo], **kwargs)
+
+    def test_groups(self):
+        merge_plan = self.merge_plan()
+        spec = speculative.speculation(merge_plan, [atom(x) for x in self.targets])
+        groups = [[str(x) for x in group] for group in spec.groups]
+        assert groups == [["app-misc/a", "app-misc/c"], ["app-misc/b"], ["app-misc/d"]]
+        # only the preferred candidates are indexed, including installed ones
+        assert sorted(pkg.cpvstr for pkg in spec.pkgs if pkg.repo.livefs) == [
+            "dev-libs/y-1"
+        ]
+        cpvs = {pkg.cpvstr for pkg in spec.pkgs}
+        assert "dev-libs/x-2" in cpvs
+        assert "dev-libs/x-1" not in cpvs
+        # blocked packages group their key without being pulled in
+        assert "app-misc/blocked-1" not in cpvs
+        spec = speculative.speculation(
+            merge_plan, [atom("app-misc/a"), atom("app-misc/blocked")]
+        )
+        assert len(spec.groups) == 1
+
+    def test_resolve(self, monkeypatch):
+        restricts = [atom(x) for x in self.targets[:3]]
+        merge_plan = self.merge_plan()
+        assert not merge_plan.add_atoms(restricts)
+        expected = sorted(str(op) for op in merge_plan.state.iter_ops())
+
+        # requests left for serial resolution
+        serial = []
+        resolve = speculative.resolve
+
+        def _resolve(*args):
+            serial.append(resolve(*args))
+            return serial[-1]
+
+        # logs replayed from the worker of each group
+        replayed = []
+        replay = speculative.speculation.replay
+
+        def _replay(self, log):
+            replayed.append(replay(self, log))
+            return replayed[-1]
+
+        monkeypatch.setattr(speculative, "resolve", _resolve)
+        monkeypatch.setattr(speculative.speculation, "replay", _replay)
+        merge_plan = self.merge_plan(jobs=4)
+        assert not merge_plan.add_atoms(restricts)
+        assert serial == [[]]
+        assert replayed == [True, True]
+        assert sorted(str(op) for op in merge_plan.state.iter_ops()) == expected
+        blockers = [
+            x
+            for x in merge_plan.state.plan
+            if isinstance(x, state.incref_forward_block_op)
+        ]
+        assert [str(x.blocker) for x in blockers] == ["!app-misc/blocked"]
+
+        # failures are left for serial resolution and reported as usual
+        ret = merge_plan.add_atoms([atom(x) for x in self.targets])
+        assert ret[0] == [atom("app-misc/d"), atom("dev-libs/missing")]
+
+    def test_replay_conflicts(self):
+        restricts = [atom("app-misc/a"), atom("app-misc/b")]
+        merge_plan = self.merge_plan()
+        spec = speculative.speculation(merge_plan, restricts)
+        assert not merge_plan._add_restricts(restricts[:1])
+        log = spec.export(0)
+        assert [x[0] for x in log if x[0] not in ("choices", "incref")] == ["add"] * 2
+
+        merge_plan.reset()
+        assert not merge_plan._add_restricts([atom("=dev-libs/x-1")])
+        point = merge_plan.state.current_state
+        # dev-libs/x-2 can't be slotted alongside x-1
+        assert not spec.replay(log)
+        assert merge_plan.state.current_state == point
+
+        merge_plan.reset()
+        assert spec.replay(log)
+        assert [str(op) for op in merge_plan.state.iter_ops()] == [
+            "add: ebuild src: dev-libs/x-2",
+            "add: ebuild src: app-misc/a-1",
+        ]
+
+    def test_preferred_closure(self):
+        pkgs = {
+            "app-misc/a-2": "dev-libs/x",
+            "app-misc/a-1": "dev-libs/shared",
+            "app-misc/b-1": "dev-libs/shared",
+            "dev-libs/x-1": "",
+            "dev-libs/shared-1": "",
+        }
+        merge_plan = resolver.upgrade_resolver(
+            [make_repo({}, livefs=True)], [make_repo(pkgs)]
+        )
+        spec = speculative.speculation(
+            merge_plan, [atom("app-misc/a"), atom("app-misc/b")]
+        )
+        # only the deps of the preferred app-misc/a-2 are walked
+        assert [[str(x) for x in group] for group in spec.groups] == [
+            ["app-misc/a"],
+            ["app-misc/b"],
+        ]
+        assert "app-misc/a-1" not in {pkg.cpvstr for pkg in spec.pkgs}
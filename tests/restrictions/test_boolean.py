@@ -1,3 +1,5 @@
+from itertools import product
+
 import pytest
 
 from pkgcore.restrictions import boolean, restriction
@@ -99,6 +101,18 @@ class TestAndRestriction(base):
         assert self.kls(false, false, node_type="foo", negate=True).match(None)
         assert not self.kls(true, true, node_type="foo", negate=True).match(None)
 
+    def test_compile(self):
+        for restricts in product((true, false, self.kls(true, false)), repeat=3):
+            for negate in (False, True):
+                r = self.kls(*restricts, negate=negate)
+                assert r.compile()(None) == r.match(None), r
+        for negate in (False, True):
+            r = self.kls(negate=negate)
+            assert r.compile()(None) == r.match(None)
+        # unfinalized instances can change, they aren't compiled
+        r = self.kls(true, finalize=False)
+        assert r.compile() == r.match
+
     def test_dnf_solutions(self):
         assert self.kls(true, true).dnf_solutions() == [[true, true]]
         assert self.kls(self.kls(true, true), true).dnf_solutions() == [
@@ -142,6 +156,15 @@ class TestOrRestriction(base):
             assert not self.kls(node_type="foo", negate=True, *x).match(None)
         assert self.kls(false, false, node_type="foo", negate=True).match(None)
 
+    def test_compile(self):
+        for restricts in product((true, false, self.kls(true, false)), repeat=3):
+            for negate in (False, True):
+                r = self.kls(*restricts, negate=negate)
+                assert r.compile()(None) == r.match(None), r
+        for negate in (False, True):
+            r = self.kls(negate=negate)
+            assert r.compile()(None) == r.match(None)
+
     def test_dnf_solutions(self):
         assert self.kls(true, true).dnf_solutions() == [[true], [true]]
         assert list(
@@ -79,6 +79,70 @@ class TestPackageRestriction(TestRestriction):
 
         assert not self.kls("foon", AlwaysSelfIntersect).match(foo())
 
+    def test_compile(self, caplog):
+        strexact = values.StrExactMatch
+        pkg = SimpleNamespace(category="foon", package="dar")
+        for negate in (False, True):
+            for restricts in (
+                (self.kls("category", strexact("foon")),),
+                (
+                    self.kls("package", strexact("foon"), negate=True),
+                    self.kls("category", strexact("foon")),
+                    self.kls("package", strexact("dar")),
+                ),
+                (
+                    self.kls("package", strexact("dar")),
+                    self.kls("category", strexact("dar")),
+                    self.kls("package", strexact("foon"), negate=True),
+                ),
+                (self.kls("missing", strexact("foon"), negate=True),),
+            ):
+                for kls in (packages.AndRestriction, packages.OrRestriction):
+                    r = kls(*restricts, negate=negate)
+                    assert r.compile()(pkg) == r.match(pkg), r
+
+        class foo:
+            def __getattr__(self, attr):
+                if attr == "exc":
+                    raise ValueError(attr)
+                raise AttributeError(self, attr)
+
+        # failures are handled the same as without compiling
+        assert not self.kls("foon", strexact("foon")).compile()(foo())
+        caplog.clear()
+        with pytest.raises(ValueError):
+            self.kls("exc", strexact("foon")).compile()(foo())
+        assert len(caplog.records) == 1
+
+    def test_cost(self):
+        strexact = values.StrExactMatch
+        category = self.kls("category", strexact("foon"))
+        description = self.kls("description", values.StrRegex("foon"))
+        assert category.cost < description.cost
+        assert category.selectivity < 0.5
+        assert self.kls("category", strexact("foon"), negate=True).selectivity > 0.5
+
+        pulled = []
+
+        class pkg:
+            def __init__(self, value):
+                self.value = value
+
+            def __getattr__(self, attr):
+                pulled.append(attr)
+                return self.value
+
+        # cheap and selective children are evaluated first
+        for kls, value in (
+            (packages.AndRestriction, "dar"),
+            (packages.OrRestriction, "foon"),
+        ):
+            r = kls(description, category)
+            assert r.compile()(pkg(value)) == r.match(pkg(value))
+            pulled.clear()
+            r.compile()(pkg(value))
+            assert pulled == ["category"]
+
     @pytest.mark.parametrize("value", ("val", "val.dar"))
     def test_attr(self, value):
         assert self.kls(value, values.AlwaysTrue).attr == value
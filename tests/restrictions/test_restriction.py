@@ -45,6 +45,29 @@ class TestBase(TestRestriction):
         self.assertNotForceTrue(false, args)
         self.assertForceFalse(false, args)
 
+    def test_compile(self):
+        true = self.bool_kls(negate=False)
+        assert true.compile() == true.match
+        assert true.compile()(None)
+        negated = restriction.Negate(restriction.AlwaysBool("foo", True))
+        assert negated.compile() is negated.compile()
+        assert not negated.compile()(None)
+        assert restriction.FakeType(negated, "foo").compile() is negated.compile()
+        # compiled forms aren't pickled
+        assert "_compiled" not in negated.__getstate__()
+
+    def test_compile_match(self):
+        true = self.bool_kls(negate=False)
+        assert restriction.compile_match(true) == true.compile()
+
+        # restriction-like objects only providing match() are used as is
+        class MatchOnly:
+            def match(self, val):
+                return val == "foo"
+
+        obj = MatchOnly()
+        assert restriction.compile_match(obj) == obj.match
+
 
 class TestAlwaysBool(TestRestriction):
     bool_kls = partial(restriction.AlwaysBool, "foo")
@@ -68,6 +91,8 @@ class TestAlwaysBool(TestRestriction):
         assert true_r == self.bool_kls(True)
         assert false_r == self.bool_kls(False)
         assert true_r != false_r
+        assert true_r.compile()(None)
+        assert not false_r.compile()(None)
 
 
 class NoneMatch(restriction.base):
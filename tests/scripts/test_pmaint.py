@@ -267,3 +267,29 @@ class TestRegen(ArgParseMixin):
         options = self.parse("fake", "--threads", "2", domain=make_domain())
         assert isinstance(options.repos[0], util.SimpleTree)
         assert options.threads == 2
+        assert not options.processes
+
+        options = self.parse("fake", "--use-processes", domain=make_domain())
+        assert options.processes
+
+    def test_processor_limits(self):
+        options = self.parse("fake", domain=make_domain())
+        assert options.max_idle_processors is None
+        assert options.processor_idle_timeout is None
+        options = self.parse(
+            "fake",
+            "--max-idle-processors",
+            "0",
+            "--processor-idle-timeout",
+            "60",
+            domain=make_domain(),
+        )
+        assert options.max_idle_processors == 0
+        assert options.processor_idle_timeout == 60
+        self.assertError(
+            "argument --max-idle-processors: must be >= 0",
+            "fake",
+            "--max-idle-processors",
+            "-1",
+            domain=make_domain(),
+        )
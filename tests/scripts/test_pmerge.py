@@ -1,8 +1,13 @@
+from types import SimpleNamespace
+
 import pytest
+from pkgcore.config import basics
+from pkgcore.config.hint import ConfigHint, configurable
 from pkgcore.ebuild.atom import atom
-from pkgcore.repository.util import SimpleTree
+from pkgcore.repository.util import RepositoryGroup, SimpleTree
 from pkgcore.scripts import pmerge
 from pkgcore.test.misc import FakePkg, FakeRepo
+from pkgcore.test.scripts.helpers import ArgParseMixin
 from pkgcore.util.parserestrict import parse_match
 
 
@@ -80,3 +85,95 @@ class TestTargetParsing:
         assert a[0].key == "foo/bar"
         assert a[0].match(atom("foo/bar:0"))
         assert not a[0].match(atom("foo/bar:2"))
+
+
+def make_repo(pkgs, livefs=False, **kwargs):
+    repo = FakeRepo(livefs=livefs, **kwargs)
+    repo.pkgs = [
+        FakePkg(cpv, eapi="8", repo=repo, data={"EAPI": "8", "RDEPEND": rdepend})
+        for cpv, rdepend in pkgs.items()
+    ]
+    return repo
+
+
+class FakeDomain:
+    pkgcore_config_type = ConfigHint(typename="domain")
+
+    def __init__(self):
+        repo = make_repo(
+            {
+                "app-misc/foo-1": "|| ( dev-libs/bar dev-libs/baz )",
+                "dev-libs/bar-1": "",
+                "dev-libs/baz-1": "",
+                "app-misc/qux-1": "dev-libs/quux",
+                "dev-libs/quux-1": "",
+            },
+            repo_id="gentoo",
+        )
+        vdb = make_repo({"dev-libs/baz-1": ""}, repo_id="vdb", livefs=True)
+        self.source_repos = RepositoryGroup([repo])
+        self.installed_repos = self.all_installed_repos = RepositoryGroup([vdb])
+        self.unstable_arch = "~x86"
+        self.profile = SimpleNamespace(use_expand=(), use_expand_hidden=())
+        self.distdir = ""
+
+    def get_package_use_unconfigured(self, pkg):
+        return pkg.use
+
+
+@configurable(typename="pkgset")
+def fake_world():
+    return frozenset()
+
+
+class TestCommandline(ArgParseMixin):
+    _argparser = pmerge.argparser
+
+    def parse(self, *args, **kwargs):
+        for name, section in pmerge.pmerge_config[0].items():
+            kwargs.setdefault(name, section)
+        kwargs.setdefault(
+            "domain",
+            basics.HardCodedConfigSection({"class": FakeDomain, "default": True}),
+        )
+        kwargs.setdefault("world", basics.HardCodedConfigSection({"class": fake_world}))
+        return super().parse(*args, **kwargs)
+
+    def test_resolver_engine(self):
+        assert self.parse("app-misc/foo").resolver_engine == "default"
+        options = self.parse("--resolver-engine=sat", "app-misc/foo")
+        assert options.resolver_engine == "sat"
+        self.assertError(
+            "argument --resolver-engine: invalid choice: 'foo' "
+            "(choose from 'default', 'sat')",
+            "--resolver-engine=foo",
+            "app-misc/foo",
+        )
+
+        args = ("--pretend", "--fetchonly", "--oneshot", "--formatter=basic")
+        for engine in ((), ("--resolver-engine=sat",)):
+            # the installed alternative satisfies the || dep
+            self.assertOut(["app-misc/foo"], *args, *engine, "app-misc/foo")
+            self.assertOut(
+                ["dev-libs/baz", "app-misc/foo"],
+                *args,
+                *engine,
+                "--empty",
+                "app-misc/foo",
+            )
+
+    def test_resolver_jobs(self):
+        assert self.parse("app-misc/foo").resolver_jobs == 1
+        assert self.parse("--resolver-jobs=2", "app-misc/foo").resolver_jobs == 2
+        self.assertError(
+            "argument --resolver-jobs: must be >= 1",
+            "--resolver-jobs=0",
+            "app-misc/foo",
+        )
+
+        args = ("--pretend", "--fetchonly", "--oneshot", "--formatter=basic")
+        targets = ("--empty", "app-misc/foo", "app-misc/qux")
+        expected = ["dev-libs/baz", "app-misc/foo", "dev-libs/quux", "app-misc/qux"]
+        # independent targets resolved in parallel are planned in the same order
+        for jobs in ((), ("--resolver-jobs=2",)):
+            self.assertOut(expected, *args, *jobs, *targets)
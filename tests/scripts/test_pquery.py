@@ -25,6 +25,14 @@ def fake_repo():
     )
 
 
+@configurable(typename="repo")
+def fake_overlay():
+    return util.SimpleTree(
+        {"spork": {"bar": ("1",)}, "app": {"foo": ("1",)}},
+        pkg_klass=FakePkg.for_tree_usage,
+    )
+
+
 @configurable(typename="repo")
 def fake_vdb():
     return util.SimpleTree({})
@@ -98,3 +106,29 @@ class TestCommandline(ArgParseMixin):
 
     def test_no_contents(self):
         self.assertOut([], "--contents", "--all", test_domain=domain_config)
+
+    def test_threads(self):
+        self.assertError("argument --threads: must be >= 1", "--threads", "0")
+        overlay_config = basics.HardCodedConfigSection(
+            {
+                "class": FakeDomain,
+                "repos": [
+                    basics.HardCodedConfigSection({"class": fake_repo}),
+                    basics.HardCodedConfigSection({"class": fake_overlay}),
+                ],
+                "vdb": [basics.HardCodedConfigSection({"class": fake_vdb})],
+                "default": True,
+            }
+        )
+        expected = ["spork/foon-1", "spork/foon-2", "app/foo-1", "spork/bar-1"]
+        self.assertOut(expected, "--all", test_domain=overlay_config)
+        # concurrent queries are output per repo in the same order
+        self.assertOut(expected, "--threads", "2", "--all", test_domain=overlay_config)
+        self.assertOut(
+            ["spork/foon-1", "app/foo-1"],
+            "--threads",
+            "2",
+            "--first",
+            "--all",
+            test_domain=overlay_config,
+        )
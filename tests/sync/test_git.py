@@ -1,4 +1,5 @@
 import os
+import subprocess
 from unittest import mock
 
 import pytest
@@ -49,6 +50,39 @@ class TestGitSyncer:
         assert spawn.call_args[1]["cwd"] == syncer.basedir
 
 
+class TestGitSyncerLocal:
+    def test_changed_paths(self, tmp_path):
+        def run(*args):
+            subprocess.run(
+                ["git", "-c", "user.name=a", "-c", "user.email=a@b", *args],
+                cwd=remote,
+                check=True,
+                capture_output=True,
+            )
+
+        (remote := tmp_path / "remote").mkdir()
+        (remote / "a").write_text("a")
+        (remote / "b").write_text("b")
+        run("init", "-q")
+        run("add", "a", "b")
+        run("commit", "-q", "-m", "init")
+
+        syncer = git.git_syncer(str(tmp_path / "repo"), f"git+file://{remote}")
+        assert syncer.sync(verbosity=-1)
+        # changes are unknown for the initial clone
+        assert syncer.changed_paths is None
+
+        (remote / "a").write_text("aa")
+        (remote / "c").write_text("c")
+        run("rm", "-q", "b")
+        run("add", "a", "c")
+        run("commit", "-q", "-m", "update")
+        assert syncer.sync(verbosity=-1)
+        assert syncer.changed_paths == {"a", "b", "c"}
+        assert syncer.sync(verbosity=-1)
+        assert syncer.changed_paths == set()
+
+
 @pytest.mark_network
 class TestGitSyncerReal:
     def test_sync(self, tmp_path):
@@ -86,6 +86,24 @@ class TestRsyncSyncer:
         assert str(excinfo.value).startswith("DNS resolution failed")
         spawn.assert_not_called()
 
+    def test_parse_log(self, spawn, getaddrinfo, tmp_path):
+        log = tmp_path / "log"
+        log.write_text(
+            "2023/01/01 00:00:00 [1] receiving file list\n"
+            "2023/01/01 00:00:00 [1] >f.st...... cat/pkg/pkg-1.ebuild\n"
+            "2023/01/01 00:00:00 [1] cd+++++++++ cat/new/\n"
+            "2023/01/01 00:00:00 [1] >f+++++++++ cat/new/new 1.ebuild\n"
+            "2023/01/01 00:00:00 [1] *deleting   eclass/old.eclass\n"
+            "2023/01/01 00:00:00 [1] sent 1 bytes  received 2 bytes  total size 3\n"
+        )
+        with log.open() as f:
+            assert self.syncer._parse_log(f) == {
+                "cat/pkg/pkg-1.ebuild",
+                "cat/new",
+                "cat/new/new 1.ebuild",
+                "eclass/old.eclass",
+            }
+
 
 class TestRsyncTimestampSyncer(TestRsyncSyncer):
     _syncer_class = rsync.rsync_timestamp_syncer